@@ -0,0 +1,75 @@
+import multiprocessing
+import os
+import tempfile
+
+# production serving profile, run with: gunicorn -c gunicorn.conf.py mentorq_main.asgi:application
+# the app is loaded and warmed up once in the master and then forked, so new workers start serving right away
+
+bind = "0.0.0.0:" + os.getenv("PORT", "8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# the workers serve the ASGI entrypoint with uvicorn, so the LCS-bound endpoints and the ticket event stream wait
+# without holding a thread, the rest of the API runs in a pool of GUNICORN_THREADS threads per worker (see
+# mentorq_main.asgi), GUNICORN_WORKER_CLASS=sync serves mentorq_main.wsgi with sync workers instead
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "mentorq_main.workers.UvicornWorker")
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+preload_app = True
+accesslog = "-"
+# the worker heartbeat files go to memory, container filesystems can stall them
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+# the workers keep their metrics in files in a directory they share, so that any of them can serve the totals of all
+# of them (see mentorq_main.metrics), the directory must be set before prometheus_client is imported
+if os.getenv("MENTORQ_METRICS") and not os.getenv("prometheus_multiproc_dir"):
+    os.environ["prometheus_multiproc_dir"] = tempfile.mkdtemp(prefix="mentorq-metrics-",
+                                                              dir=globals().get("worker_tmp_dir"))
+
+
+# a restarted server doesn't add up the metrics of its previous run
+def on_starting(server):
+    # the in-process event broker only reaches the clients of the worker that made a change
+    if server.cfg.workers > 1 and os.getenv("MENTORQ_EVENT_BROKER") == "mentorq_api.events.InProcessBroker":
+        server.log.warning("MENTORQ_EVENT_BROKER is the in-process broker, ticket events only reach the clients of "
+                           "the worker that made the change, unset it to deliver them to every worker")
+    directory = os.getenv("prometheus_multiproc_dir")
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+
+    from mentorq_main.backends.pool import close_pools
+    from mentorq_main.warmup import warm_up
+
+    warm_up()
+    # workers must not share the master's database connections (closing a pooled connection returns it to the pool)
+    connections.close_all()
+    close_pools()
+
+
+def post_worker_init(worker):
+    from django.db import connections
+    from uvicorn.workers import UvicornWorker
+
+    from mentorq_main.warmup import warm_up, connect
+
+    if not worker.cfg.preload_app:
+        warm_up()
+    connect()
+    # uvicorn workers serve requests from their thread pool, which only gets the connections opened here through the
+    # database pool
+    if isinstance(worker, UvicornWorker):
+        connections.close_all()
+
+
+# the gauges of a worker that exited are dropped (its counters and histograms are kept in the totals)
+def child_exit(server, worker):
+    if os.getenv("prometheus_multiproc_dir"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,7 +1,22 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.http import HttpResponseRedirect
 
-from mentorq_api.models import Ticket
+from mentorq_api.models import Ticket, TicketConflict, InvalidTransition
 
 # Register your models here.
 
-admin.site.register(Ticket)
+
+@admin.register(Ticket)
+class TicketAdmin(admin.ModelAdmin):
+    # a ticket somebody else changed in the meantime (or moved to a status it can't reach) isn't saved, the change page
+    # is shown again with the ticket as it is now
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except InvalidTransition as e:
+            reason = str(e)
+        except TicketConflict:
+            reason = "The ticket was changed by somebody else."
+        self.message_user(request, reason + " The changes weren't saved, review the ticket and try again.",
+                          messages.ERROR)
+        return HttpResponseRedirect(request.get_full_path())
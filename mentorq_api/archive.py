@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from mentorq_api import events
+from mentorq_api.models import Ticket, Feedback, ArchivedTicket, ArchivedFeedback, ChangeSequence, DeletedTicket
+
+# Moves finished tickets (closed, cancelled or inactive ones) and their feedback out of the ticket and feedback tables
+# into ArchivedTicket and ArchivedFeedback, so that the tables the API reads only hold the current tickets
+# - the rollups are left as they are, archived tickets keep counting in the stats and the leaderboard (and rebuilding
+#   the rollups reads the archive tables too)
+# - archived tickets are recorded as deleted, so that the change feed and the event stream tell clients to drop them
+# - tickets are moved in batches, each in its own transaction, so that the tables are only locked briefly
+
+FIELDS = [field.attname for field in Ticket._meta.concrete_fields]
+
+
+def archive_after():
+    return timedelta(hours=getattr(settings, "MENTORQ_ARCHIVE_AFTER_HOURS", 48))
+
+
+# the tickets that can be archived at the given cutoff: finished tickets that were created and closed (if they were)
+# before it
+def archivable(cutoff):
+    return Ticket.objects.filter(
+        Q(status__in=(Ticket.StatusType.CLOSED, Ticket.StatusType.CANCELLED)) | Q(active=False),
+        Q(closed_datetime__isnull=True) | Q(closed_datetime__lt=cutoff),
+        created_datetime__lt=cutoff,
+    )
+
+
+# archives up to batch_size tickets that can be archived at the cutoff, returning how many were archived
+def archive_batch(cutoff, batch_size):
+    with transaction.atomic():
+        # the tickets are locked so that they can't change (or get feedback) while they are copied
+        tickets = list(archivable(cutoff).select_for_update().order_by("pk").values(*FIELDS)[:batch_size])
+        if not tickets:
+            return 0
+        ids = [ticket["id"] for ticket in tickets]
+        ArchivedTicket.objects.bulk_create([ArchivedTicket(**ticket) for ticket in tickets])
+        ArchivedFeedback.objects.bulk_create([
+            ArchivedFeedback(ticket_id=feedback["ticket_id"], rating=feedback["rating"],
+                             comments=feedback["comments"])
+            for feedback in Feedback.objects.filter(ticket_id__in=ids).values("ticket_id", "rating", "comments")
+        ])
+        # raw deletes, since the delete signals would take the tickets and feedback out of the rollups
+        Feedback.objects.filter(ticket_id__in=ids)._raw_delete(Feedback.objects.db)
+        Ticket.objects.filter(pk__in=ids)._raw_delete(Ticket.objects.db)
+
+        version = ChangeSequence.next_value(ChangeSequence.TICKETS, len(tickets))
+        deleted = DeletedTicket.objects.bulk_create([
+            DeletedTicket(ticket_id=ticket["id"], owner_email=ticket["owner_email"],
+                          version=version - len(tickets) + 1 + n)
+            for n, ticket in enumerate(tickets)
+        ])
+        events.publish_all_on_commit([events.deleted_event(ticket.ticket_id, ticket.owner_email, ticket.version)
+                                      for ticket in deleted])
+    return len(tickets)
+
+
+# archives every ticket that finished more than MENTORQ_ARCHIVE_AFTER_HOURS (or older_than) ago, batch by batch
+# returns the number of archived tickets
+def archive_tickets(older_than=None, batch_size=None):
+    cutoff = timezone.now() - (older_than if older_than is not None else archive_after())
+    batch_size = batch_size or getattr(settings, "MENTORQ_ARCHIVE_BATCH_SIZE", 500)
+    archived = 0
+    while True:
+        count = archive_batch(cutoff, batch_size)
+        archived += count
+        if count < batch_size:
+            return archived
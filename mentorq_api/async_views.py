@@ -0,0 +1,83 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from lcs_client import InternalServerError, RequestError, CredentialError
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from mentorq_api.models import Ticket
+from mentorq_main.asgi_utils import header_dict, bearer_token, send_json
+from mentorq_user import lcs_async
+from mentorq_user.authentication import MentorqTokenUser, MentorqStatelessJWTAuthentication
+from mentorq_user.lcs import dm_link_cache, profile_cache
+from mentorq_user.models import MentorqUser
+
+SLACK_DM_PATH = re.compile(r"^/api/tickets/(?P<pk>[0-9]+)/slack-dm/$")
+
+
+# the active user a token was issued for and their cached LCS profile (None if it has to be fetched),
+# None if there is no such user
+def token_user(validated_token):
+    try:
+        user = MentorqUser.objects.filter(pk=validated_token[api_settings.USER_ID_CLAIM]).first()
+        if user is None or not user.is_active:
+            return None
+        if getattr(settings, "MENTORQ_STATELESS_AUTH", False) and \
+                all(claim in validated_token for claim in MentorqStatelessJWTAuthentication.REQUIRED_CLAIMS):
+            return user, MentorqTokenUser(validated_token).lcs_profile
+        return user, profile_cache.peek(user.email, user.lcs_token)
+    finally:
+        close_old_connections()
+
+
+# the email of the other side of a ticket the user can see, None if they can't see it
+def other_email(pk, lcs_profile):
+    try:
+        ticket = Ticket.objects.visible_to(lcs_profile).filter(pk=pk).values("mentor_email", "owner_email").first()
+    finally:
+        close_old_connections()
+    if ticket is None:
+        return None
+    if lcs_profile["email"] == ticket["mentor_email"]:
+        return ticket["owner_email"]
+    return ticket["mentor_email"]
+
+
+# ASGI version of TicketViewSet.get_slack_dm: the profile (on a cache miss) and the DM link are fetched from LCS
+# without holding a thread, only the database lookups run in one
+# returns False for requests it leaves to Django (missing or invalid credentials, tickets the user can't see, ...),
+# which answers them with the same errors as before
+async def slack_dm(scope, send, pk):
+    token = bearer_token(header_dict(scope))
+    if not token:
+        return False
+    try:
+        validated_token = AccessToken(token)
+    except TokenError:
+        return False
+    found = await sync_to_async(token_user)(validated_token)
+    if found is None:
+        return False
+    user, lcs_profile = found
+    if lcs_profile is None:
+        try:
+            lcs_profile = await lcs_async.get_profile(user.lcs_token, user.email)
+        except Exception:
+            return False
+        await sync_to_async(profile_cache.set)(user.email, user.lcs_token, lcs_profile)
+
+    email = await sync_to_async(other_email)(pk, lcs_profile)
+    if email is None:
+        return False
+
+    async def fetch():
+        try:
+            return 200, await lcs_async.create_dm_link_between(user.lcs_token, email)
+        except (CredentialError, RequestError, InternalServerError) as e:
+            return e.response.json()["statusCode"], e.response.json()["body"]
+
+    await send_json(send, *await dm_link_cache.get_async(lcs_profile["email"], email, fetch))
+    return True
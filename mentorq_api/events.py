@@ -0,0 +1,135 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+# Ticket events pushed to the clients of the event stream (see mentorq_api.sse)
+# An event is a dict with the "id" of the event (the version of the ticket after the change), its "event" type and
+# the "data" sent to clients. Events are published once the change is committed.
+
+# the event type of a ticket moving to each status
+STATUS_EVENTS = {
+    "OPEN": "reopened",
+    "CLAIMED": "claimed",
+    "CLOSED": "closed",
+    "CANCELLED": "cancelled",
+}
+# the fields of a ticket that events carry
+TICKET_FIELDS = ("id", "version", "status", "owner_email", "owner", "mentor", "mentor_email", "title", "comment",
+                 "contact", "location", "active", "created_datetime", "claimed_datetime", "closed_datetime")
+
+
+def ticket_event(event, ticket):
+    data = {field: getattr(ticket, field) for field in TICKET_FIELDS}
+    for field in ("created_datetime", "claimed_datetime", "closed_datetime"):
+        if data[field] is not None:
+            data[field] = data[field].isoformat()
+    return {"id": ticket.version, "event": event, "data": data}
+
+
+def deleted_event(ticket_id, owner_email, version):
+    return {"id": version, "event": "deleted", "data": {"id": ticket_id, "version": version,
+                                                        "owner_email": owner_email}}
+
+
+# publishes an event once the current transaction commits (right away outside of a transaction)
+def publish_on_commit(event):
+    transaction.on_commit(lambda: get_broker().publish(event))
+
+
+# publishes several events, in order, once the current transaction commits
+def publish_all_on_commit(events):
+    def publish():
+        broker = get_broker()
+        for event in events:
+            broker.publish(event)
+
+    transaction.on_commit(publish)
+
+
+# a subscriber's bounded queue of events
+# a subscriber that falls behind by more than the queue holds is dropped: its queue is cleared and ends with None,
+# after which the client reconnects and catches up from its Last-Event-ID
+class Subscription:
+    def __init__(self, broker, loop, size):
+        self.broker = broker
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+        # set by brokers that only deliver events once they have started, see wait_started
+        self.started = None
+
+    # called on the subscriber's event loop
+    def deliver(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    # waits until the broker delivers events to the subscription, the events committed from then on aren't missed
+    async def wait_started(self):
+        if self.started is not None:
+            await asyncio.shield(self.started)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+# pub/sub between the threads of one process: events published by any thread (e.g. a request handled in a
+# thread pool) are handed to the event loop of every subscriber
+# only events published in the same process are delivered, so it only suits a single process, deployments with
+# several use mentorq_api.sse.ChangeFeedBroker (see MENTORQ_EVENT_BROKER)
+class InProcessBroker:
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    # must be called from the event loop that reads the subscription
+    def subscribe(self, size):
+        subscription = Subscription(self, asyncio.get_event_loop(), size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # the subscriber's loop has been closed
+                self.unsubscribe(subscription)
+
+    @property
+    def subscribers(self):
+        return len(self._subscriptions)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+# the broker configured in MENTORQ_EVENT_BROKER, shared by the whole process
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, "MENTORQ_EVENT_BROKER",
+                                                "mentorq_api.sse.ChangeFeedBroker"))()
+    return _broker
@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from mentorq_api import archive
+
+
+# moves finished tickets and their feedback into the archive tables, once or every few seconds
+class Command(BaseCommand):
+    help = "Archives closed, cancelled and inactive tickets that finished a while ago"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-hours", type=float, default=settings.MENTORQ_ARCHIVE_AFTER_HOURS,
+                            help="archive the tickets that finished more than this many hours ago")
+        parser.add_argument("--batch-size", type=int, default=settings.MENTORQ_ARCHIVE_BATCH_SIZE,
+                            help="tickets moved per transaction")
+        parser.add_argument("--every", type=float,
+                            help="keep running and archive every this many seconds, e.g. as a sidecar of the app")
+        parser.add_argument("--dry-run", action="store_true", help="only count the tickets that would be archived")
+
+    def handle(self, *args, **options):
+        older_than = timedelta(hours=options["older_than_hours"])
+        while True:
+            if options["dry_run"]:
+                count = archive.archivable(timezone.now() - older_than).count()
+                self.stdout.write("{} tickets would be archived".format(count))
+            else:
+                count = archive.archive_tickets(older_than, options["batch_size"])
+                self.stdout.write("Archived {} tickets".format(count))
+            if options["every"] is None:
+                return
+            # (the connection isn't reused across runs that are far apart)
+            close_old_connections()
+            time.sleep(options["every"])
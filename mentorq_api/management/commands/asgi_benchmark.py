@@ -0,0 +1,154 @@
+import asyncio
+import io
+import json
+import threading
+import time
+from wsgiref.util import setup_testing_defaults
+
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+
+from mentorq_api.management.commands.loadtest import Command as LoadTest
+from mentorq_api.models import Ticket
+from mentorq_main.asgi_utils import call
+from mentorq_user.fake_lcs import FakeLCS, make_profile
+from mentorq_user.models import MentorqUser
+from mentorq_user.serializers import MentorqTokenObtainPairSerializer
+
+ENDPOINTS = ("slack-dm", "token")
+
+
+# sends a request to a WSGI app, returning the status of the response
+def wsgi_request(application, method, path, headers, body):
+    environ = {"REQUEST_METHOD": method, "PATH_INFO": path, "CONTENT_LENGTH": str(len(body)),
+               "wsgi.input": io.BytesIO(body)}
+    for name, value in headers:
+        key = name.upper().replace("-", "_")
+        environ[key if key == "CONTENT_TYPE" else "HTTP_" + key] = value
+    setup_testing_defaults(environ)
+    status = []
+    response = application(environ, lambda response_status, *args: status.append(int(response_status.split()[0])))
+    try:
+        b"".join(response)
+    finally:
+        response.close()
+    return status[0]
+
+
+# compares the WSGI app, served by a fixed number of worker threads like a sync gunicorn deployment, with the ASGI
+# entrypoint, which waits for LCS without holding a thread, on the endpoints that call LCS
+# every LCS call takes --lcs-latency seconds, LCS is replaced by the fake LCS
+class Command(BaseCommand):
+    help = "Benchmarks the LCS-bound endpoints on the WSGI app against the ASGI entrypoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint", choices=ENDPOINTS, default="slack-dm")
+        parser.add_argument("--requests", type=int, default=400, help="requests sent to each app")
+        parser.add_argument("--concurrency", type=int, default=100, help="number of concurrent clients")
+        parser.add_argument("--workers", type=int, default=8, help="worker threads serving the WSGI app")
+        parser.add_argument("--lcs-latency", type=float, default=0.1, help="seconds added to every LCS call")
+        parser.add_argument("--lcs-jitter", type=float, default=0)
+        parser.add_argument("--output", help="file to write the JSON results to")
+
+    def handle(self, *args, **options):
+        lcs = FakeLCS(fixtures=[], latency=options["lcs_latency"], jitter=options["lcs_jitter"]).install()
+        try:
+            method, path, headers, body = self.make_request(lcs, options["endpoint"])
+            connection.close()
+            results = {"config": {key: options[key] for key in ("endpoint", "requests", "concurrency", "workers",
+                                                                "lcs_latency", "lcs_jitter")}}
+            for mode, run in (("wsgi", self.run_wsgi), ("asgi", self.run_asgi)):
+                lcs.reset_calls()
+                samples, elapsed = run(method, path, headers, body, options)
+                results[mode] = dict(LoadTest.summarize(samples, elapsed, by_endpoint=False)["all"],
+                                     lcs_calls=lcs.calls)
+        finally:
+            lcs.uninstall()
+
+        row = "{:<6} {:>8} {:>7} {:>9} {:>9} {:>9}  {}"
+        self.stdout.write(row.format("app", "requests", "errors", "rps", "p50 ms", "p95 ms", "LCS calls"))
+        for mode in ("wsgi", "asgi"):
+            summary = results[mode]
+            self.stdout.write(row.format(
+                mode, summary["requests"], summary["errors"], "{:.1f}".format(summary["throughput_rps"]),
+                "{:.1f}".format(summary["latency_ms"]["p50"]), "{:.1f}".format(summary["latency_ms"]["p95"]),
+                summary["lcs_calls"]))
+        self.stdout.write("asgi vs wsgi: rps x{:.2f}, p95 x{:.2f}".format(
+            results["asgi"]["throughput_rps"] / max(results["wsgi"]["throughput_rps"], 1e-9),
+            results["asgi"]["latency_ms"]["p95"] / max(results["wsgi"]["latency_ms"]["p95"], 1e-9)))
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+
+    # creates the users (and ticket) the requests need, returning (method, path, headers, body) of the request
+    @staticmethod
+    def make_request(lcs, endpoint):
+        hacker_token = lcs.add_user(make_profile("benchmark-hacker@example.com", "Hacker"))
+        if endpoint == "token":
+            body = {"email": "benchmark-hacker@example.com", "lcs_token": hacker_token}
+            return "POST", "/api/auth/token/", [("Content-Type", "application/json")], json.dumps(body).encode()
+
+        mentor_token = lcs.add_user(make_profile("benchmark-mentor@example.com", "Mentor", roles=("mentor",)))
+        MentorqUser.objects.update_or_create(email="benchmark-hacker@example.com",
+                                             defaults={"lcs_token": hacker_token})
+        mentor, _ = MentorqUser.objects.update_or_create(email="benchmark-mentor@example.com",
+                                                         defaults={"lcs_token": mentor_token})
+        ticket = Ticket.objects.create(owner_email="benchmark-hacker@example.com", owner="Hacker",
+                                       title="Benchmark", location="Table 1", status=Ticket.StatusType.CLAIMED,
+                                       mentor="Mentor", mentor_email="benchmark-mentor@example.com")
+        access_token = MentorqTokenObtainPairSerializer.get_token(mentor).access_token
+        return "GET", "/api/tickets/{}/slack-dm/".format(ticket.pk), \
+            [("Authorization", "Bearer {}".format(access_token))], b""
+
+    # every client waits for one of the worker threads, like requests queueing for a sync worker
+    @staticmethod
+    def run_wsgi(method, path, headers, body, options):
+        application = get_wsgi_application()
+        workers = threading.BoundedSemaphore(options["workers"])
+        remaining = [options["requests"]]
+        lock = threading.Lock()
+        samples = []
+
+        def client():
+            while True:
+                with lock:
+                    if remaining[0] == 0:
+                        break
+                    remaining[0] -= 1
+                start = time.perf_counter()
+                with workers:
+                    status = wsgi_request(application, method, path, headers, body)
+                    connection.close()
+                with lock:
+                    samples.append((path, status, time.perf_counter() - start, 0))
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(options["concurrency"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples, time.perf_counter() - start
+
+    @staticmethod
+    def run_asgi(method, path, headers, body, options):
+        # imported here since it sets up Django for a deployment
+        from mentorq_main.asgi import application
+
+        samples = []
+
+        async def client(remaining):
+            while remaining:
+                remaining.pop()
+                start = time.perf_counter()
+                status, _, _ = await call(application, method, path, headers, body)
+                samples.append((path, status, time.perf_counter() - start, 0))
+
+        async def run():
+            remaining = list(range(options["requests"]))
+            await asyncio.gather(*(client(remaining) for _ in range(options["concurrency"])))
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        return samples, time.perf_counter() - start
@@ -0,0 +1,217 @@
+import io
+import json
+import random
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+from wsgiref.util import setup_testing_defaults
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.utils import timezone
+
+from mentorq_api.management.commands.seed_tickets import hacker_email, mentor_email
+from mentorq_user.fake_lcs import FakeLCS, make_profile
+from mentorq_user.models import MentorqUser
+from mentorq_user.serializers import MentorqTokenObtainPairSerializer
+
+# the requests each kind of user makes, with their relative weights
+WORKLOAD = {
+    "hacker": (
+        (20, "GET", "/api/tickets/"),
+        (1, "POST", "/api/tickets/"),
+        (1, "GET", "/api/feedback/"),
+    ),
+    "mentor": (
+        (20, "GET", "/api/tickets/"),
+        (1, "GET", "/api/tickets/stats/"),
+        (1, "GET", "/api/feedback/leaderboard/"),
+    ),
+    "director": (
+        (10, "GET", "/api/tickets/"),
+        (5, "GET", "/api/tickets/stats/"),
+        (5, "GET", "/api/feedback/leaderboard/"),
+        (1, "GET", "/api/feedback/"),
+    ),
+}
+PERCENTILES = (50, 90, 95, 99)
+
+
+# replays a mixed hacker/mentor/director workload against the WSGI app and reports per endpoint throughput,
+# latency percentiles and SQL query counts
+class Command(BaseCommand):
+    help = "Runs a load test against the WSGI app, LCS is replaced by the fake LCS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=50, help="number of concurrent pollers")
+        parser.add_argument("--duration", type=float, default=30, help="seconds to run for")
+        parser.add_argument("--mix", default="hacker=0.7,mentor=0.25,director=0.05",
+                            help="share of pollers with each role")
+        parser.add_argument("--think-time", type=float, default=0, help="seconds each poller waits between requests")
+        parser.add_argument("--hackers", type=int, default=2000, help="must match seed_tickets --hackers")
+        parser.add_argument("--mentors", type=int, default=100, help="must match seed_tickets --mentors")
+        parser.add_argument("--lcs-latency", type=float, default=0.05, help="seconds added to every LCS call")
+        parser.add_argument("--lcs-jitter", type=float, default=0.05)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="file to write the JSON results to")
+        parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        try:
+            mix = {role: float(share) for role, share in
+                   (item.split("=") for item in options["mix"].split(","))}
+        except ValueError:
+            raise CommandError("--mix must look like hacker=0.7,mentor=0.25,director=0.05")
+        if set(mix) - set(WORKLOAD):
+            raise CommandError("unknown roles in --mix: " + ", ".join(set(mix) - set(WORKLOAD)))
+
+        lcs = FakeLCS(fixtures=[], latency=options["lcs_latency"], jitter=options["lcs_jitter"],
+                      seed=options["seed"]).install()
+        try:
+            pollers = [self.make_poller(lcs, rng, options, role, n) for n, role in
+                       enumerate(rng.choices(list(mix), list(mix.values()), k=options["concurrency"]))]
+            connection.close()
+            results = self.run(get_wsgi_application(), pollers, options)
+        finally:
+            lcs.uninstall()
+
+        results["lcs_calls"] = lcs.calls
+        self.report(results, options)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, indent=2)
+
+    # creates a user with the given role, returning (role, access token, rng) for a poller thread
+    @staticmethod
+    def make_poller(lcs, rng, options, role, n):
+        if role == "hacker":
+            email = hacker_email(rng.randrange(options["hackers"]))
+            profile = make_profile(email, "Hacker")
+        elif role == "mentor":
+            email = mentor_email(rng.randrange(options["mentors"]))
+            profile = make_profile(email, "Mentor", roles=("mentor",))
+        else:
+            email = "director{}@example.com".format(n)
+            profile = make_profile(email, "Director", roles=("organizer", "director"))
+        lcs_token = lcs.add_user(profile)
+        user, _ = MentorqUser.objects.update_or_create(email=email, defaults={"lcs_token": lcs_token})
+        access_token = MentorqTokenObtainPairSerializer.get_token(user).access_token
+        return role, email, str(access_token), random.Random(rng.random())
+
+    def run(self, application, pollers, options):
+        samples = []
+        samples_lock = threading.Lock()
+        deadline = time.perf_counter() + options["duration"]
+
+        def poll(role, email, access_token, rng):
+            weights, methods, paths = zip(*WORKLOAD[role])
+            requests = list(zip(methods, paths))
+            local_samples = []
+            while time.perf_counter() < deadline:
+                method, path = rng.choices(requests, weights)[0]
+                body = None
+                if method == "POST":
+                    body = {"owner_email": email, "title": "Load test", "location": "Table 1"}
+                local_samples.append(self.request(application, role, method, path, access_token, body))
+                if options["think_time"]:
+                    time.sleep(options["think_time"])
+            connection.close()
+            with samples_lock:
+                samples.extend(local_samples)
+
+        started_at = timezone.now()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=poll, args=poller) for poller in pollers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        return {
+            "started_at": started_at.isoformat(),
+            "elapsed_seconds": elapsed,
+            "config": {key: options[key] for key in ("concurrency", "duration", "mix", "think_time", "lcs_latency",
+                                                     "lcs_jitter", "seed")},
+            "endpoints": self.summarize(samples, elapsed),
+            "total": self.summarize(samples, elapsed, by_endpoint=False)["all"],
+        }
+
+    # sends one request to the WSGI app, returning (endpoint, status, seconds, number of SQL queries)
+    @staticmethod
+    def request(application, role, method, path, access_token, body=None):
+        url = urlsplit(path)
+        content = json.dumps(body).encode() if body is not None else b""
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": url.path,
+            "QUERY_STRING": url.query,
+            "HTTP_AUTHORIZATION": "Bearer " + access_token,
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(content)),
+            "wsgi.input": io.BytesIO(content),
+        }
+        setup_testing_defaults(environ)
+        status = []
+        queries = [0]
+
+        def start_response(response_status, headers, exc_info=None):
+            status.append(int(response_status.split()[0]))
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            response = application(environ, start_response)
+            try:
+                b"".join(response)
+            finally:
+                response.close()
+        return "{} {} ({})".format(method, url.path, role), status[0], time.perf_counter() - start, queries[0]
+
+    @staticmethod
+    def summarize(samples, elapsed, by_endpoint=True):
+        groups = {}
+        for endpoint, status, seconds, queries in samples:
+            groups.setdefault(endpoint if by_endpoint else "all", []).append((status, seconds, queries))
+        summary = {}
+        for endpoint, group in sorted(groups.items()):
+            latencies = sorted(seconds * 1000 for _, seconds, _ in group)
+            query_counts = [queries for _, _, queries in group]
+            summary[endpoint] = {
+                "requests": len(group),
+                "errors": sum(1 for status, _, _ in group if status >= 400),
+                "throughput_rps": len(group) / elapsed,
+                "latency_ms": dict(
+                    {"p{}".format(p): latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+                     for p in PERCENTILES},
+                    mean=statistics.mean(latencies), max=latencies[-1]),
+                "queries": {"mean": statistics.mean(query_counts), "max": max(query_counts)},
+            }
+        return summary
+
+    def report(self, results, options):
+        baseline = {}
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline_file:
+                baseline = json.load(baseline_file)["endpoints"]
+        row = "{:<45} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>8}"
+        self.stdout.write(row.format("endpoint", "requests", "errors", "rps", "p50 ms", "p95 ms", "p99 ms", "queries"))
+        for endpoint, summary in list(results["endpoints"].items()) + [("total", results["total"])]:
+            self.stdout.write(row.format(
+                endpoint, summary["requests"], summary["errors"], "{:.1f}".format(summary["throughput_rps"]),
+                "{:.1f}".format(summary["latency_ms"]["p50"]), "{:.1f}".format(summary["latency_ms"]["p95"]),
+                "{:.1f}".format(summary["latency_ms"]["p99"]), "{:.1f}".format(summary["queries"]["mean"])))
+            if endpoint in baseline:
+                before = baseline[endpoint]
+                self.stdout.write("{:<45} rps x{:.2f}, p95 x{:.2f}, queries {:+.1f}".format(
+                    "  vs baseline",
+                    summary["throughput_rps"] / max(before["throughput_rps"], 1e-9),
+                    summary["latency_ms"]["p95"] / max(before["latency_ms"]["p95"], 1e-9),
+                    summary["queries"]["mean"] - before["queries"]["mean"]))
+        self.stdout.write("LCS calls: {}".format(results["lcs_calls"]))
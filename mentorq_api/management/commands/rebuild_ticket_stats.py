@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mentorq_api.models import TicketStats, MentorRating
+
+
+# rebuilds the ticket stats and mentor rating rollups from the tickets and feedback, or checks them against the data
+class Command(BaseCommand):
+    help = "Rebuilds the ticket stats and mentor rating rollups from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true",
+                            help="only compare the rollups with the tickets, exits with an error on mismatches")
+
+    def handle(self, *args, **options):
+        if not options["verify"]:
+            TicketStats.rebuild()
+            MentorRating.rebuild()
+            self.stdout.write("Rebuilt the ticket stats")
+        mismatches = TicketStats.verify() + MentorRating.verify()
+        for what, stored, expected in mismatches:
+            self.stderr.write("{}: stored {}, expected {}".format(what, stored, expected))
+        if mismatches:
+            raise CommandError("The ticket stats are out of date, run rebuild_ticket_stats to fix them")
+        self.stdout.write("The ticket stats match the tickets")
@@ -0,0 +1,110 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from mentorq_api.models import Ticket, Feedback, TicketStats, MentorRating, ChangeSequence
+
+# share of tickets in each status at the end of a typical event
+STATUS_MIX = (
+    (Ticket.StatusType.OPEN, 0.08),
+    (Ticket.StatusType.CLAIMED, 0.07),
+    (Ticket.StatusType.CLOSED, 0.75),
+    (Ticket.StatusType.CANCELLED, 0.10),
+)
+# ratings are skewed towards satisfied hackers
+RATING_WEIGHTS = (1, 2, 5, 14, 18)
+
+
+def hacker_email(n):
+    return "hacker{}@example.com".format(n)
+
+
+def mentor_email(n):
+    return "mentor{}@example.com".format(n)
+
+
+# seeds the database with a synthetic hackathon worth of tickets and feedback using bulk inserts
+class Command(BaseCommand):
+    help = "Seeds the database with synthetic tickets and feedback for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tickets", type=int, default=50000)
+        parser.add_argument("--hackers", type=int, default=2000)
+        parser.add_argument("--mentors", type=int, default=100)
+        parser.add_argument("--event-hours", type=int, default=36, help="length of the event the tickets span")
+        parser.add_argument("--feedback-rate", type=float, default=0.5,
+                            help="share of closed tickets that receive feedback")
+        parser.add_argument("--batch-size", type=int, default=5000, help="tickets generated and inserted per chunk")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--clear", action="store_true", help="delete all tickets and feedback first")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        event_start = timezone.now() - timedelta(hours=options["event_hours"])
+        event_seconds = options["event_hours"] * 60 * 60
+
+        self.seed(rng, options, event_start, event_seconds)
+        # bulk inserts bypass the incremental stats updates
+        TicketStats.rebuild()
+        MentorRating.rebuild()
+
+    def seed(self, rng, options, event_start, event_seconds):
+        statuses, weights = zip(*STATUS_MIX)
+        with transaction.atomic():
+            if options["clear"]:
+                # raw deletes, the stats are rebuilt afterwards anyway
+                Feedback.objects.all()._raw_delete(Feedback.objects.db)
+                Ticket.objects.all()._raw_delete(Ticket.objects.db)
+
+            created = 0
+            while created < options["tickets"]:
+                size = min(options["batch_size"], options["tickets"] - created)
+                tickets = [self.make_ticket(rng, options, event_start, event_seconds, rng.choices(statuses, weights)[0])
+                           for _ in range(size)]
+                # the chunk takes a block of versions, so that the change feed reports the new tickets
+                last_version = ChangeSequence.next_value(ChangeSequence.TICKETS, size)
+                for n, ticket in enumerate(tickets):
+                    ticket.version = last_version - size + 1 + n
+                # bulk_create skips Ticket.save, the timestamps are generated above instead
+                # (the backend splits each chunk into statements that fit its parameter limits)
+                created_datetimes = [ticket.created_datetime for ticket in tickets]
+                tickets = Ticket.objects.bulk_create(tickets)
+                if tickets[0].pk is None:
+                    # backends that can't return ids from bulk inserts (e.g. SQLite) need them read back
+                    ids = Ticket.objects.order_by("-id").values_list("id", flat=True)[:size]
+                    for ticket, pk in zip(reversed(tickets), ids):
+                        ticket.pk = pk
+                # created_datetime is auto_now_add, so the insert stored the current time, the generated timestamps
+                # are set with queryset updates afterwards (bulk_update batches them like bulk_create)
+                for ticket, created_datetime in zip(tickets, created_datetimes):
+                    ticket.created_datetime = created_datetime
+                Ticket.objects.bulk_update(tickets, ["created_datetime"])
+                Feedback.objects.bulk_create([self.make_feedback(rng, ticket) for ticket in tickets
+                                              if ticket.status == Ticket.StatusType.CLOSED
+                                              and rng.random() < options["feedback_rate"]])
+                created += size
+                self.stdout.write("Seeded {}/{} tickets".format(created, options["tickets"]))
+
+    @staticmethod
+    def make_ticket(rng, options, event_start, event_seconds, status):
+        created_datetime = event_start + timedelta(seconds=rng.uniform(0, event_seconds))
+        owner = rng.randrange(options["hackers"])
+        ticket = Ticket(owner_email=hacker_email(owner), owner="Hacker {}".format(owner), status=status,
+                        title="Help with project {}".format(rng.randrange(1000)), comment="",
+                        contact="slack", location="Table {}".format(rng.randrange(300)),
+                        created_datetime=created_datetime, active=rng.random() > 0.02)
+        if status in (Ticket.StatusType.CLAIMED, Ticket.StatusType.CLOSED):
+            mentor = rng.randrange(options["mentors"])
+            ticket.mentor = "Mentor {}".format(mentor)
+            ticket.mentor_email = mentor_email(mentor)
+            ticket.claimed_datetime = created_datetime + timedelta(seconds=rng.expovariate(1 / 600))
+        if status == Ticket.StatusType.CLOSED:
+            ticket.closed_datetime = ticket.claimed_datetime + timedelta(seconds=rng.expovariate(1 / 1200))
+        return ticket
+
+    @staticmethod
+    def make_feedback(rng, ticket):
+        return Feedback(ticket_id=ticket.pk, rating=rng.choices(range(1, 6), RATING_WEIGHTS)[0], comments="Thanks!")
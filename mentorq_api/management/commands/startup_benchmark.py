@@ -0,0 +1,111 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+# run in a fresh interpreter, prints the timings (in seconds) of booting the WSGI app and serving two requests
+CHILD = """
+import io, json, os, time
+from wsgiref.util import setup_testing_defaults
+
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+timings = {"boot": time.perf_counter() - start}
+
+if os.environ["STARTUP_BENCHMARK_WARMUP"]:
+    from mentorq_main.warmup import warm_up
+    start = time.perf_counter()
+    warm_up()
+    timings["warmup"] = time.perf_counter() - start
+    # what a forked worker does before its first request
+    from mentorq_main.warmup import connect
+    start = time.perf_counter()
+    connect()
+    timings["connect"] = time.perf_counter() - start
+
+for request in ("first_request", "second_request"):
+    environ = {"REQUEST_METHOD": "GET", "PATH_INFO": os.environ["STARTUP_BENCHMARK_PATH"],
+               "QUERY_STRING": "page_size=20", "wsgi.input": io.BytesIO(b""),
+               "HTTP_AUTHORIZATION": "Bearer " + os.environ["STARTUP_BENCHMARK_TOKEN"]}
+    setup_testing_defaults(environ)
+    status = []
+    start = time.perf_counter()
+    response = application(environ, lambda response_status, *args: status.append(response_status))
+    b"".join(response)
+    response.close()
+    timings[request] = time.perf_counter() - start
+    timings["status"] = status[0]
+print(json.dumps(timings))
+"""
+
+
+# boots the app in fresh interpreters and reports how long a new worker takes to import and set up Django and to
+# serve its first requests, with and without the warmup that gunicorn.conf.py runs before forking the workers
+class Command(BaseCommand):
+    help = "Measures the import time and first request latency of a new worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="interpreters started per profile")
+        parser.add_argument("--path", default="/api/tickets/", help="path of the requests")
+        parser.add_argument("--imports", type=int, default=10, help="slowest top-level imports to list")
+
+    def handle(self, *args, **options):
+        # the requests are authorized from the token claims, so neither LCS nor a user row is involved
+        token = AccessToken()
+        token["user_id"] = 0
+        token["email"] = "startup-benchmark@example.com"
+        for role in ("director", "mentor", "organizer"):
+            token[role] = role == "director"
+        env = dict(os.environ, MENTORQ_STATELESS_AUTH="1", STARTUP_BENCHMARK_TOKEN=str(token),
+                   STARTUP_BENCHMARK_PATH=options["path"],
+                   DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "mentorq_main.settings.local"))
+
+        row = "{:<10} {:>9} {:>9} {:>10} {:>14} {:>14} {:>14}"
+        self.stdout.write(row.format("profile", "boot ms", "warmup ms", "connect ms", "1st request ms",
+                                     "2nd request ms", "ready after ms"))
+        for profile, warmup in (("cold", ""), ("preloaded", "1")):
+            runs = [self.run_child(dict(env, STARTUP_BENCHMARK_WARMUP=warmup)) for _ in range(options["runs"])]
+            median = {key: statistics.median(run.get(key, 0) for run in runs) * 1000
+                      for key in ("boot", "warmup", "connect", "first_request", "second_request")}
+            # a preloaded worker is forked from a master that has already booted and warmed up, it only connects
+            # before serving its first request
+            ready = median["connect"] + median["first_request"] + (0 if warmup else median["boot"])
+            self.stdout.write(row.format(
+                profile, "{:.1f}".format(median["boot"]), "{:.1f}".format(median["warmup"]),
+                "{:.1f}".format(median["connect"]),
+                "{:.1f}".format(median["first_request"]), "{:.1f}".format(median["second_request"]),
+                "{:.1f}".format(ready)))
+            statuses = {run["status"] for run in runs}
+            if statuses != {"200 OK"}:
+                self.stderr.write("unexpected responses: {}".format(", ".join(sorted(statuses))))
+
+        if options["imports"]:
+            self.stdout.write("slowest top-level imports (cumulative ms):")
+            for module, micros in self.slowest_imports(dict(env, STARTUP_BENCHMARK_WARMUP=""), options["imports"]):
+                self.stdout.write("  {:<40} {:>8.1f}".format(module, micros / 1000))
+
+    @staticmethod
+    def run_child(env, *flags):
+        result = subprocess.run([sys.executable, *flags, "-c", CHILD], env=env, cwd=settings.BASE_DIR,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise CommandError(result.stderr)
+        return json.loads(result.stdout.strip().splitlines()[-1]) if not flags else result.stderr
+
+    # the modules imported directly by the app and its dependencies (not by other modules) that took the longest
+    def slowest_imports(self, env, count):
+        imports = []
+        for line in self.run_child(env, "-X", "importtime").splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, module = line.split("|")
+            if module.startswith("  ") or not cumulative.strip().isdigit():
+                continue
+            imports.append((module.strip(), int(cumulative)))
+        return sorted(imports, key=lambda item: -item[1])[:count]
@@ -0,0 +1,104 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:43
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+
+# the rollup as this migration builds it, a copy of mentorq_api.rollup.rebuild at the time so that later changes
+# to the rollup don't change what the migration does
+STATUS_COUNTERS = {
+    "OPEN": "open_tickets",
+    "CLAIMED": "claimed_tickets",
+    "CLOSED": "closed_tickets",
+    "CANCELLED": "cancelled_tickets",
+}
+
+
+def ticket_duration(field):
+    return ExpressionWrapper(F(field) - F("created_datetime"), output_field=DurationField())
+
+
+def microseconds(duration):
+    return duration // timedelta(microseconds=1) if duration is not None else 0
+
+
+def build_ticket_stats(apps, schema_editor):
+    Ticket = apps.get_model('mentorq_api', 'Ticket')
+    Feedback = apps.get_model('mentorq_api', 'Feedback')
+    TicketStats = apps.get_model('mentorq_api', 'TicketStats')
+    TicketParticipant = apps.get_model('mentorq_api', 'TicketParticipant')
+
+    aggregates = {
+        "total_tickets": Count("id"),
+        "claimed_count": Count("id", filter=Q(claimed_datetime__isnull=False)),
+        "claimed_duration_sum": Sum(ticket_duration("claimed_datetime"), filter=Q(claimed_datetime__isnull=False)),
+        "closed_count": Count("id", filter=Q(closed_datetime__isnull=False, active=True)),
+        "closed_duration_sum": Sum(ticket_duration("closed_datetime"),
+                                   filter=Q(closed_datetime__isnull=False, active=True)),
+    }
+    for status, counter in STATUS_COUNTERS.items():
+        aggregates[counter] = Count("id", filter=Q(status=status))
+    counters = Ticket.objects.aggregate(**aggregates)
+    counters["claimed_duration_sum"] = microseconds(counters["claimed_duration_sum"])
+    counters["closed_duration_sum"] = microseconds(counters["closed_duration_sum"])
+    ratings = Feedback.objects.aggregate(rating_count=Count("rating"), rating_sum=Sum("rating"))
+    counters["rating_count"] = ratings["rating_count"]
+    counters["rating_sum"] = ratings["rating_sum"] or 0
+
+    participants = []
+    for role, field in (("mentor", "mentor_email"), ("owner", "owner_email")):
+        for row in Ticket.objects.exclude(**{field: ""}).values(field).annotate(tickets=Count("id")):
+            participants.append(TicketParticipant(role=role, email=row[field], tickets=row["tickets"]))
+    counters["mentors"] = sum(participant.role == "mentor" for participant in participants)
+    counters["users"] = sum(participant.role == "owner" for participant in participants)
+
+    TicketStats.objects.update_or_create(pk=1, defaults=counters)
+    TicketParticipant.objects.all().delete()
+    TicketParticipant.objects.bulk_create(participants)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mentorq_api', '0007_ticket_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_tickets', models.BigIntegerField(default=0)),
+                ('open_tickets', models.BigIntegerField(default=0)),
+                ('claimed_tickets', models.BigIntegerField(default=0)),
+                ('closed_tickets', models.BigIntegerField(default=0)),
+                ('cancelled_tickets', models.BigIntegerField(default=0)),
+                ('claimed_count', models.BigIntegerField(default=0)),
+                ('claimed_duration_sum', models.BigIntegerField(default=0)),
+                ('closed_count', models.BigIntegerField(default=0)),
+                ('closed_duration_sum', models.BigIntegerField(default=0)),
+                ('mentors', models.BigIntegerField(default=0)),
+                ('users', models.BigIntegerField(default=0)),
+                ('rating_count', models.BigIntegerField(default=0)),
+                ('rating_sum', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Ticket stats',
+                'verbose_name_plural': 'Ticket stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='TicketParticipant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(max_length=6)),
+                ('email', models.EmailField(max_length=254)),
+                ('tickets', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('role', 'email')},
+            },
+        ),
+        migrations.RunPython(build_ticket_stats, migrations.RunPython.noop),
+    ]
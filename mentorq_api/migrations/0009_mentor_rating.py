@@ -0,0 +1,39 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:44
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+# the ratings of every mentor from the feedback, as mentorq_api.rollup.rebuild_mentor_ratings computed them when
+# this migration was written
+def build_mentor_ratings(apps, schema_editor):
+    Feedback = apps.get_model('mentorq_api', 'Feedback')
+    MentorRating = apps.get_model('mentorq_api', 'MentorRating')
+
+    MentorRating.objects.all().delete()
+    MentorRating.objects.bulk_create([
+        MentorRating(mentor_email=row["ticket__mentor_email"], rating_count=row["rating_count"],
+                     rating_sum=row["rating_sum"])
+        for row in Feedback.objects.values("ticket__mentor_email").annotate(rating_count=Count("rating"),
+                                                                            rating_sum=Sum("rating"))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mentorq_api', '0008_ticket_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MentorRating',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mentor_email', models.EmailField(blank=True, max_length=254, unique=True)),
+                ('rating_count', models.BigIntegerField(default=0)),
+                ('rating_sum', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(build_mentor_ratings, migrations.RunPython.noop),
+    ]
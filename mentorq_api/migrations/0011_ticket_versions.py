@@ -0,0 +1,49 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:52
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+# existing tickets are numbered by their id, the sequence continues after the highest one
+def number_tickets(apps, schema_editor):
+    Ticket = apps.get_model('mentorq_api', 'Ticket')
+    ChangeSequence = apps.get_model('mentorq_api', 'ChangeSequence')
+    Ticket.objects.update(version=F('id'))
+    ChangeSequence.objects.create(name='tickets', value=Ticket.objects.aggregate(Max('id'))['id__max'] or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mentorq_api', '0010_ticket_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DeletedTicket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket_id', models.IntegerField()),
+                ('owner_email', models.EmailField(max_length=254)),
+                ('version', models.BigIntegerField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ticket',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['version'], name='ticket_version_idx'),
+        ),
+        migrations.RunPython(number_tickets, migrations.RunPython.noop),
+    ]
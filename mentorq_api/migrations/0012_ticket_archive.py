@@ -0,0 +1,59 @@
+# Generated by Django 3.0.14 on 2026-10-18 09:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mentorq_api', '0011_ticket_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTicket',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('owner_email', models.EmailField(max_length=254)),
+                ('mentor', models.CharField(blank=True, max_length=255)),
+                ('mentor_email', models.EmailField(blank=True, max_length=254)),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('CLOSED', 'Closed'), ('CLAIMED', 'Claimed'), ('CANCELLED', 'Cancelled')], max_length=9)),
+                ('title', models.CharField(max_length=255)),
+                ('comment', models.CharField(blank=True, max_length=255)),
+                ('contact', models.CharField(blank=True, max_length=255, null=True)),
+                ('location', models.CharField(max_length=255)),
+                ('created_datetime', models.DateTimeField()),
+                ('claimed_datetime', models.DateTimeField(null=True)),
+                ('closed_datetime', models.DateTimeField(null=True)),
+                ('owner', models.CharField(blank=True, max_length=255)),
+                ('active', models.BooleanField()),
+                ('version', models.BigIntegerField()),
+                ('archived_datetime', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Archived ticket',
+                'verbose_name_plural': 'Archived tickets',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedFeedback',
+            fields=[
+                ('ticket', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='mentorq_api.ArchivedTicket')),
+                ('rating', models.SmallIntegerField(choices=[(1, 'Very Dissatisfied'), (2, 'Dissatisfied'), (3, 'Neutral'), (4, 'Satisfied'), (5, 'Very Satisfied')])),
+                ('comments', models.CharField(max_length=255)),
+            ],
+            options={
+                'verbose_name': 'Archived feedback',
+                'verbose_name_plural': 'Archived feedback',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedticket',
+            index=models.Index(fields=['owner_email', 'created_datetime'], name='archived_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedticket',
+            index=models.Index(fields=['mentor_email'], name='archived_mentor_idx'),
+        ),
+    ]
@@ -1,6 +1,96 @@
-from django.db import models
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.db import IntegrityError, models, router, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.utils import timezone
 
+from mentorq_api import events, rollup
+
+
+# raised when saving a ticket that somebody else changed since it was loaded
+class TicketConflict(Exception):
+    pass
+
+
+# raised when saving a ticket with a status its loaded status can't move to (see Ticket.TRANSITIONS)
+class InvalidTransition(TicketConflict):
+    pass
+
+
+class TicketQuerySet(models.QuerySet):
+    # the tickets visible to a user with the given LCS profile: mentors, organizers and directors see every ticket
+    # (except mentors, who don't see closed tickets) and everyone else only sees the tickets they made
+    def visible_to(self, lcs_profile):
+        user_roles = lcs_profile["role"]
+        queryset = self
+        if not (user_roles["organizer"] or user_roles["director"] or user_roles["mentor"]):
+            queryset = queryset.filter(owner_email=lcs_profile["email"])
+        if user_roles["mentor"] and not (user_roles["director"]):
+            queryset = queryset.exclude(status=Ticket.StatusType.CLOSED)
+        return queryset
+
+    # moves every ticket of the queryset that can make the transition to status (one of Ticket.BULK_STATUSES) and/or
+    # sets whether it is active, without loading the tickets: the tickets are marked with new versions, the rollup is
+    # updated with the difference between their counters before and after the change and one event is published per
+    # ticket, with a handful of statements whatever the number of tickets
+    # with a status, only the tickets that can make the transition are changed (and get active along with it),
+    # otherwise only the tickets whose active differs
+    # returns {"updated": number of tickets, "previous_status": {status: number of tickets}, "version": the highest
+    # version of the changed tickets, "ids": the ids of the changed tickets}
+    def bulk_change(self, status=None, active=None):
+        changes = {}
+        queryset = self
+        if status is not None:
+            if status not in Ticket.BULK_STATUSES:
+                raise ValueError("Tickets can't be moved to {} in bulk".format(status))
+            sources, datetime_field = Ticket.TRANSITIONS[status]
+            queryset = queryset.filter(status__in=sources)
+            changes["status"] = status
+            if datetime_field is not None:
+                changes[datetime_field] = timezone.now()
+        if active is not None:
+            if status is None:
+                queryset = queryset.exclude(active=active)
+            changes["active"] = active
+        if not changes:
+            raise ValueError("Nothing to change")
+
+        unchanged = {"updated": 0, "previous_status": {}, "ids": []}
+        with transaction.atomic():
+            # saves and transitions write tickets while holding the sequence, so the span is read after taking it
+            # (tickets that change anyway, e.g. archived ones, are left out by the conditional update)
+            ChangeSequence.lock(ChangeSequence.TICKETS)
+            span = queryset.aggregate(low=models.Min("pk"), high=models.Max("pk"))
+            if span["low"] is None:
+                return dict(unchanged, version=ChangeSequence.current_value(ChangeSequence.TICKETS))
+            # a ticket's new version is its id plus an offset, so every changed ticket gets its own version (the
+            # change feed and the event stream resume from a version) out of a block of values taken for the ids
+            # in the span (the values of the ids that aren't changed are skipped)
+            version = ChangeSequence.next_value(ChangeSequence.TICKETS, span["high"] - span["low"] + 1)
+            offset = version - span["high"]
+            # the tickets to change are the ones this conditional update marks, later statements select them by
+            # their new versions, which nobody else can have
+            queryset.filter(pk__range=(span["low"], span["high"])).update(version=models.F("pk") + offset)
+            changed = Ticket.objects.filter(version__range=(span["low"] + offset, version))
+            old_counters = rollup.queryset_counters(changed)
+            if not old_counters["total_tickets"]:
+                return dict(unchanged, version=version)
+            changed.update(**changes)
+            TicketStats.record_tickets_change(old_counters, rollup.queryset_counters(changed))
+            tickets = [SimpleNamespace(**ticket) for ticket in
+                       changed.order_by("version").values(*events.TICKET_FIELDS)]
+            event = events.STATUS_EVENTS[status] if status is not None else "updated"
+            events.publish_all_on_commit([events.ticket_event(event, ticket) for ticket in tickets])
+        return {
+            "updated": old_counters["total_tickets"],
+            "previous_status": {status: old_counters[counter] for status, counter in rollup.STATUS_COUNTERS.items()
+                                if old_counters[counter]},
+            "version": max(ticket.version for ticket in tickets),
+            "ids": [ticket.id for ticket in tickets],
+        }
+
 
 class Ticket(models.Model):
     class StatusType(models.TextChoices):
@@ -37,25 +127,163 @@ class Ticket(models.Model):
     owner = models.CharField(max_length=255, blank=True)
     # True = ticket is active / False = ticket is inactive
     active = models.BooleanField(default=True)
+    # the change sequence value of the latest change to the ticket, see ChangeSequence
+    version = models.BigIntegerField(default=0, editable=False)
+
+    objects = TicketQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Ticket"
         verbose_name_plural = "Tickets"
+        indexes = [
+            # hackers list their own tickets
+            models.Index(fields=["owner_email", "created_datetime"], name="ticket_owner_created_idx"),
+            # mentors list every ticket that isn't closed, this index only holds those
+            models.Index(fields=["created_datetime", "id"], condition=~models.Q(status="CLOSED"),
+                         name="ticket_unclosed_idx"),
+            # directors page through every ticket in creation order
+            models.Index(fields=["created_datetime", "id"], name="ticket_created_idx"),
+            # filters on a status (e.g. all the OPEN tickets)
+            models.Index(fields=["status", "created_datetime"], name="ticket_status_created_idx"),
+            # lookups of the tickets a mentor handled
+            models.Index(fields=["mentor_email"], name="ticket_mentor_idx"),
+            # the change feed reads the tickets changed since a version
+            models.Index(fields=["version"], name="ticket_version_idx"),
+        ]
 
-    # TODO: test transition to the "CANCELLED" status type and validate that arbitrary status changes aren't possible
+    # the fields a save or transition checks are unchanged since the ticket was loaded (the stats rollup depends on
+    # them), the UPDATE only matches the row if they still hold the loaded values
+    CHECKED_FIELDS = ("status", "mentor_email", "owner_email", "claimed_datetime", "closed_datetime", "active")
+    LOADED_FIELDS = CHECKED_FIELDS + ("created_datetime",)
+    # the status a transition moves to: (the statuses it can move from, the datetime field set when it happens)
+    TRANSITIONS = {
+        StatusType.OPEN: ((StatusType.CLAIMED,), None),
+        StatusType.CLAIMED: ((StatusType.OPEN,), "claimed_datetime"),
+        StatusType.CLOSED: ((StatusType.OPEN, StatusType.CLAIMED), "closed_datetime"),
+        StatusType.CANCELLED: ((StatusType.OPEN, StatusType.CLAIMED), None),
+    }
+    # the statuses tickets can be moved to in bulk (claiming and releasing change the mentor, which a bulk change can't)
+    BULK_STATUSES = (StatusType.CLOSED, StatusType.CANCELLED)
+
+    # remembers the checked fields as loaded from the database, so that saving doesn't have to read the ticket again
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_values()
+        return instance
+
+    def remember_loaded_values(self):
+        self._loaded_values = {field: self.__dict__[field] for field in self.LOADED_FIELDS if field in self.__dict__}
+
+    # the refreshed fields count as loaded, a save after a refresh only conflicts with changes made since then
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        refreshed = self.LOADED_FIELDS if fields is None else [field for field in fields if field in self.LOADED_FIELDS]
+        self._loaded_values = dict(getattr(self, "_loaded_values", {}), **{
+            field: self.__dict__[field] for field in refreshed if field in self.__dict__})
+
+    # the checked fields as they were loaded, tickets that weren't loaded with all of them are read again
+    def loaded_values(self, using=None):
+        loaded_values = getattr(self, "_loaded_values", {})
+        if len(loaded_values) != len(self.LOADED_FIELDS):
+            loaded_values = Ticket.objects.using(using).filter(pk=self.pk).values(*self.LOADED_FIELDS).first()
+        return loaded_values
+
+    # moves the ticket to status with a single conditional UPDATE that also sets the claimed/closed datetime and the
+    # other given fields (e.g. the mentor claiming it)
+    # returns whether the transition won: nothing is changed if status can't be reached from the loaded status or the
+    # ticket changed since it was loaded, e.g. because another mentor claimed it first
+    def transition(self, status, **changes):
+        loaded_values = self.loaded_values()
+        sources, datetime_field = self.TRANSITIONS[status]
+        if loaded_values is None or loaded_values["status"] not in sources:
+            return False
+        changes["status"] = status
+        if datetime_field is not None:
+            changes[datetime_field] = timezone.now()
+        using = router.db_for_write(Ticket, instance=self)
+        with transaction.atomic(using):
+            changes["version"] = ChangeSequence.next_value(ChangeSequence.TICKETS)
+            previous = {field: getattr(self, field) for field in changes}
+            for field, value in changes.items():
+                setattr(self, field, value)
+            update_fields = frozenset(changes)
+            self.send_save_signal(pre_save, using, update_fields)
+            if not self.conditional_update(loaded_values, changes, using):
+                for field, value in previous.items():
+                    setattr(self, field, value)
+                return False
+            self.send_save_signal(post_save, using, update_fields, created=False)
+            self.record_change(loaded_values)
+            events.publish_on_commit(events.ticket_event(events.STATUS_EVENTS[status], self))
+        self.remember_loaded_values()
+        return True
+
+    # raises TicketConflict if the ticket changed since it was loaded, instead of overwriting that change, and
+    # InvalidTransition if the status changed to one the loaded status can't move to
+    # updates send the pre_save and post_save signals like Model.save, with a conditional UPDATE in between
     def save(self, *args, **kwargs):
-        try:
-            current_ticket = Ticket.objects.get(pk=self.pk)
-            current_status = current_ticket.status
-            if self.status == Ticket.StatusType.CLAIMED:
-                if current_status == Ticket.StatusType.OPEN:
-                    self.claimed_datetime = timezone.now()
-            elif self.status == Ticket.StatusType.CLOSED:
-                if current_status == Ticket.StatusType.OPEN or current_status == Ticket.StatusType.CLAIMED:
-                    self.closed_datetime = timezone.now()
-        except self.DoesNotExist:
-            pass
-        super().save(*args, **kwargs)
+        using = kwargs.get("using") or router.db_for_write(Ticket, instance=self)
+        loaded_values = None if self.pk is None else self.loaded_values(using)
+        if loaded_values is not None and self.status != loaded_values["status"]:
+            sources, datetime_field = self.TRANSITIONS.get(self.status, ((), None))
+            if loaded_values["status"] not in sources:
+                raise InvalidTransition("The ticket is {} and can't be moved to {}.".format(
+                    loaded_values["status"], self.status))
+        with transaction.atomic(using):
+            self.version = ChangeSequence.next_value(ChangeSequence.TICKETS)
+            if loaded_values is None:
+                super().save(*args, **kwargs)
+            else:
+                if self.status != loaded_values["status"] and datetime_field is not None:
+                    setattr(self, datetime_field, timezone.now())
+                update_fields = kwargs.get("update_fields")
+                if update_fields is not None:
+                    update_fields = frozenset(update_fields) | {"version"}
+                self.send_save_signal(pre_save, using, update_fields)
+                changes = {field.name: field.pre_save(self, False) for field in self._meta.concrete_fields
+                           if not field.primary_key and (update_fields is None or field.name in update_fields)}
+                if not self.conditional_update(loaded_values, changes, using):
+                    raise TicketConflict("Ticket {} changed since it was loaded".format(self.pk))
+                self._state.db = using
+                self.send_save_signal(post_save, using, update_fields, created=False)
+            self.record_change(loaded_values)
+            if loaded_values is None:
+                event = "created"
+            elif self.status != loaded_values["status"]:
+                event = events.STATUS_EVENTS[self.status]
+            else:
+                event = "updated"
+            events.publish_on_commit(events.ticket_event(event, self))
+        self.remember_loaded_values()
+
+    # marks a ticket as changed without loading it
+    @staticmethod
+    def bump_version(pk):
+        # the version has to be written before the sequence row is unlocked by the commit
+        with transaction.atomic():
+            Ticket.objects.filter(pk=pk).update(version=ChangeSequence.next_value(ChangeSequence.TICKETS))
+
+    # UPDATE ... WHERE the checked fields still hold the loaded values, returns whether the ticket was updated
+    def conditional_update(self, loaded_values, changes, using=None):
+        conditions = {field: loaded_values[field] for field in self.CHECKED_FIELDS}
+        return Ticket.objects.using(using).filter(pk=self.pk, **conditions).update(**changes) == 1
+
+    # sends pre_save or post_save for an update that doesn't go through Model.save
+    def send_save_signal(self, signal, using, update_fields, **kwargs):
+        signal.send(sender=self.__class__, instance=self, raw=False, using=using, update_fields=update_fields,
+                    **kwargs)
+
+    # updates the stats rollup and the mentor ratings for the change from the loaded values (None for new tickets)
+    def record_change(self, loaded_values):
+        old = SimpleNamespace(**loaded_values) if loaded_values is not None else None
+        TicketStats.record_ticket_change(old, self)
+        # feedback moves along with the ticket if it is handed to another mentor
+        if old is not None and old.mentor_email != self.mentor_email:
+            rating = Feedback.objects.filter(pk=self.pk).values_list("rating", flat=True).first()
+            if rating is not None:
+                MentorRating.record_rating_change(old.mentor_email, rating, None)
+                MentorRating.record_rating_change(self.mentor_email, None, rating)
 
     def __str__(self):
         return self.title
@@ -78,3 +306,243 @@ class Feedback(models.Model):
     class Meta:
         verbose_name = "Feedback"
         verbose_name_plural = "Feedback"
+
+    # remembers the rating loaded from the database, so that saving can update the stats rollup without a pre-read
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating = instance.__dict__.get("rating")
+        return instance
+
+    def save(self, *args, **kwargs):
+        old_rating = None if self._state.adding else getattr(self, "_loaded_rating", None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # the version of the ticket covers its feedback (and the ticket links to new feedback)
+            Ticket.bump_version(self.ticket_id)
+            TicketStats.record_rating_change(old_rating, self.rating)
+            MentorRating.record_rating_change(self.ticket.mentor_email, old_rating, self.rating)
+        self._loaded_rating = self.rating
+
+
+# running totals of the ticket statistics, kept up to date as tickets and feedback are written
+# (there is a single row, see mentorq_api.rollup for how it is maintained)
+class TicketStats(models.Model):
+    total_tickets = models.BigIntegerField(default=0)
+    open_tickets = models.BigIntegerField(default=0)
+    claimed_tickets = models.BigIntegerField(default=0)
+    closed_tickets = models.BigIntegerField(default=0)
+    cancelled_tickets = models.BigIntegerField(default=0)
+    # the number of tickets that have been claimed and the sum of their claim times in microseconds
+    claimed_count = models.BigIntegerField(default=0)
+    claimed_duration_sum = models.BigIntegerField(default=0)
+    # the number of active tickets that have been closed and the sum of their close times in microseconds
+    closed_count = models.BigIntegerField(default=0)
+    closed_duration_sum = models.BigIntegerField(default=0)
+    # the number of distinct mentors and ticket owners
+    mentors = models.BigIntegerField(default=0)
+    users = models.BigIntegerField(default=0)
+    rating_count = models.BigIntegerField(default=0)
+    rating_sum = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Ticket stats"
+        verbose_name_plural = "Ticket stats"
+
+    # returns the rollup, building it from the tickets if it doesn't exist yet
+    @classmethod
+    def load(cls):
+        try:
+            return cls.objects.get(pk=rollup.STATS_PK)
+        except cls.DoesNotExist:
+            cls.rebuild()
+            return cls.objects.get(pk=rollup.STATS_PK)
+
+    @classmethod
+    def record_ticket_change(cls, old, new):
+        rollup.record_ticket_change(cls, TicketParticipant, old, new)
+
+    @classmethod
+    def record_tickets_change(cls, old_counters, new_counters):
+        rollup.record_tickets_change(cls, old_counters, new_counters)
+
+    @classmethod
+    def record_rating_change(cls, old_rating, new_rating):
+        rollup.record_rating_change(cls, old_rating, new_rating)
+
+    @classmethod
+    def rebuild(cls):
+        rollup.rebuild(Ticket, Feedback, cls, TicketParticipant, [(ArchivedTicket, ArchivedFeedback)])
+
+    @classmethod
+    def verify(cls):
+        return rollup.verify(Ticket, Feedback, cls, TicketParticipant, [(ArchivedTicket, ArchivedFeedback)])
+
+    @property
+    def average_claimed_datetime(self):
+        if not self.claimed_count:
+            return None
+        return timedelta(microseconds=self.claimed_duration_sum) / self.claimed_count
+
+    @property
+    def average_closed_datetime(self):
+        if not self.closed_count:
+            return None
+        return timedelta(microseconds=self.closed_duration_sum) / self.closed_count
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+
+# the number of tickets each mentor and ticket owner has, used to keep the distinct counts in TicketStats
+class TicketParticipant(models.Model):
+    role = models.CharField(max_length=max(len(rollup.MENTOR), len(rollup.OWNER)))
+    email = models.EmailField()
+    tickets = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["role", "email"]
+
+
+# the rating totals of each mentor, from which the leaderboard is ranked
+class MentorRating(models.Model):
+    mentor_email = models.EmailField(unique=True, blank=True)
+    rating_count = models.BigIntegerField(default=0)
+    rating_sum = models.BigIntegerField(default=0)
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.rating_count
+
+    # applies a rating for a mentor being created (old_rating is None), changed or deleted (new_rating is None)
+    @classmethod
+    def record_rating_change(cls, mentor_email, old_rating, new_rating):
+        rollup.record_mentor_rating_change(cls, mentor_email, old_rating, new_rating)
+
+    @classmethod
+    def rebuild(cls):
+        rollup.rebuild_mentor_ratings(Feedback, cls, [ArchivedFeedback])
+
+    @classmethod
+    def verify(cls):
+        return rollup.verify_mentor_ratings(Feedback, cls, [ArchivedFeedback])
+
+    # returns the limit (or every) rated mentors ordered by their average rating, highest first
+    # (read from the rollup on every request, with one row per mentor this is a single small query, and unlike a
+    # per-process cache every worker serves the current ranking)
+    @classmethod
+    def leaderboard(cls, limit=None):
+        mentor_ratings = cls.objects.filter(rating_count__gt=0).annotate(
+            average=models.ExpressionWrapper(models.F("rating_sum") * 1.0 / models.F("rating_count"),
+                                             output_field=models.FloatField())
+        ).order_by("-average", "mentor_email")
+        if limit is not None:
+            mentor_ratings = mentor_ratings[:limit]
+        return [{"mentor": mentor_rating.mentor_email, "average_rating": mentor_rating.average_rating}
+                for mentor_rating in mentor_ratings]
+
+
+# named counters that hand out increasing values, e.g. the ticket versions the change feed is based on
+# a value is taken by incrementing the counter row, which stays locked until the transaction commits, so values
+# become visible in the order they were handed out: once a reader sees a value, every change with a lower value has
+# been committed
+class ChangeSequence(models.Model):
+    TICKETS = "tickets"
+
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    # takes count values, returning the highest of them
+    @classmethod
+    def next_value(cls, name, count=1):
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).update(value=models.F("value") + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(name=name, value=count)
+                except IntegrityError:
+                    # somebody else created the counter in the meantime
+                    cls.objects.filter(name=name).update(value=models.F("value") + count)
+            return cls.objects.filter(name=name).values_list("value", flat=True).get()
+
+    # locks the counter until the transaction commits, without taking a value
+    @classmethod
+    def lock(cls, name):
+        if not cls.objects.filter(name=name).update(value=models.F("value")):
+            cls.next_value(name, 0)
+
+    # the latest committed value
+    @classmethod
+    def current_value(cls, name):
+        return cls.objects.filter(name=name).values_list("value", flat=True).first() or 0
+
+
+# records the tickets that were deleted, so that the change feed can tell clients to drop them
+class DeletedTicket(models.Model):
+    ticket_id = models.IntegerField()
+    owner_email = models.EmailField()
+    # the change sequence value of the deletion
+    version = models.BigIntegerField(db_index=True)
+
+
+# finished tickets moved out of the ticket table by mentorq_api.archive, with their ids and fields as they were
+# archived tickets and their feedback still count in TicketStats and MentorRating: archiving leaves the rollups as
+# they are and rebuilding them reads both tables
+class ArchivedTicket(models.Model):
+    id = models.IntegerField(primary_key=True)
+    owner_email = models.EmailField()
+    mentor = models.CharField(max_length=255, blank=True)
+    mentor_email = models.EmailField(blank=True)
+    status = models.CharField(max_length=max(map(lambda st: len(st[0]), Ticket.StatusType.choices)),
+                              choices=Ticket.StatusType.choices)
+    title = models.CharField(max_length=255)
+    comment = models.CharField(max_length=255, blank=True)
+    contact = models.CharField(max_length=255, null=True, blank=True)
+    location = models.CharField(max_length=255)
+    created_datetime = models.DateTimeField()
+    claimed_datetime = models.DateTimeField(null=True)
+    closed_datetime = models.DateTimeField(null=True)
+    owner = models.CharField(max_length=255, blank=True)
+    active = models.BooleanField()
+    version = models.BigIntegerField()
+    # the datetime when the ticket was archived
+    archived_datetime = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Archived ticket"
+        verbose_name_plural = "Archived tickets"
+        indexes = [
+            models.Index(fields=["owner_email", "created_datetime"], name="archived_owner_created_idx"),
+            models.Index(fields=["mentor_email"], name="archived_mentor_idx"),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class ArchivedFeedback(models.Model):
+    ticket = models.OneToOneField(to=ArchivedTicket, primary_key=True, on_delete=models.CASCADE)
+    rating = models.SmallIntegerField(choices=Rating.choices)
+    comments = models.CharField(max_length=255)
+
+    class Meta:
+        verbose_name = "Archived feedback"
+        verbose_name_plural = "Archived feedback"
+
+
+# tickets and feedback deleted through the admin or by cascade are taken out of the rollup, deleted tickets are
+# recorded for the change feed
+@receiver(post_delete, sender=Ticket)
+def remove_ticket_from_stats(sender, instance, **kwargs):
+    TicketStats.record_ticket_change(instance, None)
+    deleted = DeletedTicket.objects.create(ticket_id=instance.pk, owner_email=instance.owner_email,
+                                           version=ChangeSequence.next_value(ChangeSequence.TICKETS))
+    events.publish_on_commit(events.deleted_event(deleted.ticket_id, deleted.owner_email, deleted.version))
+
+
+@receiver(post_delete, sender=Feedback)
+def remove_feedback_from_stats(sender, instance, **kwargs):
+    TicketStats.record_rating_change(instance.rating, None)
+    MentorRating.record_rating_change(instance.ticket.mentor_email, instance.rating, None)
+    Ticket.bump_version(instance.ticket_id)
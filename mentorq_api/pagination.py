@@ -0,0 +1,101 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+# keyset pagination over the (unique) ordering declared in the view's cursor_ordering, e.g. ("created_datetime", "id")
+# each page continues strictly after the last row of the previous one, so rows created or changed while a client
+# pages through the list are never skipped or repeated
+# pagination is opt-in: requests without a cursor or page_size parameter get the whole list as before
+class KeysetCursorPagination(BasePagination):
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params and \
+                self.page_size_query_param not in request.query_params:
+            return None
+        self.request = request
+        self.ordering = view.cursor_ordering
+        self.page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            queryset = queryset.filter(self.after(queryset.model, self.decode_cursor(encoded)))
+
+        # one row more than the page tells whether there is a next page
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("results", data),
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, api_settings.PAGE_SIZE or 100))
+        except ValueError:
+            page_size = api_settings.PAGE_SIZE or 100
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor([self.value_of(last, field) for field in self.ordering])
+        url = replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+        return replace_query_param(url, self.page_size_query_param, self.page_size)
+
+    # the condition for rows that come after the given values of the ordering fields:
+    # (a > x) or (a = x and b > y) or ...
+    def after(self, model, values):
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [self.model_field(model, field).to_python(value) for field, value in zip(self.ordering, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        condition = Q(**{self.ordering[-1] + "__gt": values[-1]})
+        for field, value in reversed(list(zip(self.ordering[:-1], values[:-1]))):
+            condition = Q(**{field + "__gt": value}) | (Q(**{field: value}) & condition)
+        return condition
+
+    @staticmethod
+    def model_field(model, path):
+        *relations, name = path.split("__")
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+    @staticmethod
+    def value_of(obj, path):
+        for name in path.split("__"):
+            obj = getattr(obj, name)
+        return obj.isoformat() if hasattr(obj, "isoformat") else obj
+
+    @staticmethod
+    def encode_cursor(values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, encoded):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list):
+            raise NotFound(self.invalid_cursor_message)
+        return values
@@ -0,0 +1,240 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+
+# Keeps the TicketStats rollup row, the TicketParticipant counts and the MentorRating totals in step with the
+# tickets and feedback
+# The functions take the model classes as arguments so that they also cover the archive tables (the migrations that
+# first built the rollup keep their own copy of the rebuild)
+
+# the rollup counter for tickets in each status
+STATUS_COUNTERS = {
+    "OPEN": "open_tickets",
+    "CLAIMED": "claimed_tickets",
+    "CLOSED": "closed_tickets",
+    "CANCELLED": "cancelled_tickets",
+}
+COUNTERS = ("total_tickets",) + tuple(STATUS_COUNTERS.values()) + (
+    "claimed_count", "claimed_duration_sum", "closed_count", "closed_duration_sum", "mentors", "users",
+    "rating_count", "rating_sum")
+MENTOR = "mentor"
+OWNER = "owner"
+# the id of the single TicketStats row
+STATS_PK = 1
+
+
+# the time between a ticket being created and the given datetime field being set
+def ticket_duration(field):
+    return ExpressionWrapper(F(field) - F("created_datetime"), output_field=DurationField())
+
+
+def microseconds(duration):
+    return duration // timedelta(microseconds=1) if duration is not None else 0
+
+
+# the counters a single ticket adds to the rollup, ticket can be any object with the Ticket fields
+def ticket_counters(ticket):
+    counters = {"total_tickets": 1}
+    if ticket.status in STATUS_COUNTERS:
+        counters[STATUS_COUNTERS[ticket.status]] = 1
+    if ticket.claimed_datetime is not None:
+        counters["claimed_count"] = 1
+        counters["claimed_duration_sum"] = microseconds(ticket.claimed_datetime - ticket.created_datetime)
+    # inactive tickets are left out of the average close time
+    if ticket.closed_datetime is not None and ticket.active:
+        counters["closed_count"] = 1
+        counters["closed_duration_sum"] = microseconds(ticket.closed_datetime - ticket.created_datetime)
+    return counters
+
+
+# the (role, email) participants a single ticket counts towards
+def ticket_participants(ticket):
+    participants = []
+    if ticket.mentor_email:
+        participants.append((MENTOR, ticket.mentor_email))
+    if ticket.owner_email:
+        participants.append((OWNER, ticket.owner_email))
+    return participants
+
+
+# applies the difference between the old and the new version of a ticket to the rollup
+# old is None for new tickets and new is None for deleted ones
+def record_ticket_change(stats_model, participant_model, old, new):
+    counters = {}
+    for ticket, sign in ((old, -1), (new, 1)):
+        if ticket is None:
+            continue
+        for counter, value in ticket_counters(ticket).items():
+            counters[counter] = counters.get(counter, 0) + sign * value
+    participants = {}
+    for ticket, sign in ((old, -1), (new, 1)):
+        if ticket is None:
+            continue
+        for participant in ticket_participants(ticket):
+            participants[participant] = participants.get(participant, 0) + sign * 1
+    for (role, email), change in participants.items():
+        if change:
+            distinct_change = update_participant(participant_model, role, email, change)
+            counter = "mentors" if role == MENTOR else "users"
+            counters[counter] = counters.get(counter, 0) + distinct_change
+    update_counters(stats_model, counters)
+
+
+# applies a feedback rating being created (old_rating is None), changed or deleted (new_rating is None)
+def record_rating_change(stats_model, old_rating, new_rating):
+    update_counters(stats_model, {
+        "rating_count": (new_rating is not None) - (old_rating is not None),
+        "rating_sum": (new_rating or 0) - (old_rating or 0),
+    })
+
+
+def update_counters(stats_model, counters):
+    changes = {counter: F(counter) + change for counter, change in counters.items() if change}
+    if changes:
+        stats_model.objects.filter(pk=STATS_PK).update(**changes)
+
+
+# applies a rating for a mentor being created (old_rating is None), changed or deleted (new_rating is None)
+def record_mentor_rating_change(mentor_rating_model, mentor_email, old_rating, new_rating):
+    count_change = (new_rating is not None) - (old_rating is not None)
+    sum_change = (new_rating or 0) - (old_rating or 0)
+    if not count_change and not sum_change:
+        return
+    ratings = mentor_rating_model.objects.filter(mentor_email=mentor_email)
+    if ratings.update(rating_count=F("rating_count") + count_change, rating_sum=F("rating_sum") + sum_change):
+        return
+    try:
+        with transaction.atomic():
+            mentor_rating_model.objects.create(mentor_email=mentor_email, rating_count=count_change,
+                                               rating_sum=sum_change)
+    except IntegrityError:
+        ratings.update(rating_count=F("rating_count") + count_change, rating_sum=F("rating_sum") + sum_change)
+
+
+# changes the number of tickets of a participant, returning how the number of distinct participants changed
+def update_participant(participant_model, role, email, change):
+    participants = participant_model.objects.filter(role=role, email=email)
+    if change < 0:
+        # a participant without tickets is removed so that each row is one distinct participant
+        if participants.filter(tickets__lte=-change).delete()[0]:
+            return -1
+        participants.update(tickets=F("tickets") + change)
+        return 0
+    if participants.update(tickets=F("tickets") + change):
+        return 0
+    try:
+        with transaction.atomic():
+            participant_model.objects.create(role=role, email=email, tickets=change)
+        return 1
+    except IntegrityError:
+        # somebody else added the participant in the meantime
+        participants.update(tickets=F("tickets") + change)
+        return 0
+
+
+# the aggregates of the counters a set of tickets adds to the rollup (the set version of ticket_counters)
+def ticket_aggregates():
+    aggregates = {
+        "total_tickets": Count("id"),
+        "claimed_count": Count("id", filter=Q(claimed_datetime__isnull=False)),
+        "claimed_duration_sum": Sum(ticket_duration("claimed_datetime"), filter=Q(claimed_datetime__isnull=False)),
+        "closed_count": Count("id", filter=Q(closed_datetime__isnull=False, active=True)),
+        "closed_duration_sum": Sum(ticket_duration("closed_datetime"),
+                                   filter=Q(closed_datetime__isnull=False, active=True)),
+    }
+    for status, counter in STATUS_COUNTERS.items():
+        aggregates[counter] = Count("id", filter=Q(status=status))
+    return aggregates
+
+
+# the counters the tickets of a queryset add to the rollup, in a single query
+def queryset_counters(queryset):
+    counters = queryset.aggregate(**ticket_aggregates())
+    counters["claimed_duration_sum"] = microseconds(counters["claimed_duration_sum"])
+    counters["closed_duration_sum"] = microseconds(counters["closed_duration_sum"])
+    return counters
+
+
+# applies the difference between the counters of a set of tickets before and after they were changed together,
+# the tickets must keep their mentor and owner (the participants aren't updated)
+def record_tickets_change(stats_model, old_counters, new_counters):
+    update_counters(stats_model, {counter: new_counters[counter] - old_counters[counter] for counter in new_counters})
+
+
+# computes the rollup from scratch, returning (counters, participants)
+# archived_models are (ticket model, feedback model) pairs of archived tickets, which still count in the rollup
+def compute(ticket_model, feedback_model, archived_models=()):
+    counters = dict.fromkeys(COUNTERS, 0)
+    participants = {}
+    for tickets, feedback in ((ticket_model, feedback_model),) + tuple(archived_models):
+        for counter, value in queryset_counters(tickets.objects.all()).items():
+            counters[counter] += value
+        ratings = feedback.objects.aggregate(rating_count=Count("rating"), rating_sum=Sum("rating"))
+        counters["rating_count"] += ratings["rating_count"]
+        counters["rating_sum"] += ratings["rating_sum"] or 0
+        for role, field in ((MENTOR, "mentor_email"), (OWNER, "owner_email")):
+            for row in tickets.objects.exclude(**{field: ""}).values(field).annotate(tickets=Count("id")):
+                participants[(role, row[field])] = participants.get((role, row[field]), 0) + row["tickets"]
+    # (a participant can have tickets in both tables)
+    counters["mentors"] = sum(role == MENTOR for role, _ in participants)
+    counters["users"] = sum(role == OWNER for role, _ in participants)
+    return counters, participants
+
+
+# replaces the rollup with one computed from scratch
+def rebuild(ticket_model, feedback_model, stats_model, participant_model, archived_models=()):
+    with transaction.atomic():
+        counters, participants = compute(ticket_model, feedback_model, archived_models)
+        stats_model.objects.update_or_create(pk=STATS_PK, defaults=counters)
+        participant_model.objects.all().delete()
+        participant_model.objects.bulk_create([
+            participant_model(role=role, email=email, tickets=tickets)
+            for (role, email), tickets in participants.items()
+        ])
+
+
+# computes the rating count and sum of every mentor from scratch, including the archived feedback
+def compute_mentor_ratings(feedback_model, archived_feedback_models=()):
+    ratings = {}
+    for feedback in (feedback_model,) + tuple(archived_feedback_models):
+        for row in feedback.objects.values("ticket__mentor_email").annotate(rating_count=Count("rating"),
+                                                                             rating_sum=Sum("rating")):
+            rating_count, rating_sum = ratings.get(row["ticket__mentor_email"], (0, 0))
+            ratings[row["ticket__mentor_email"]] = (rating_count + row["rating_count"],
+                                                    rating_sum + row["rating_sum"])
+    return ratings
+
+
+def rebuild_mentor_ratings(feedback_model, mentor_rating_model, archived_feedback_models=()):
+    with transaction.atomic():
+        mentor_rating_model.objects.all().delete()
+        mentor_rating_model.objects.bulk_create([
+            mentor_rating_model(mentor_email=mentor_email, rating_count=rating_count, rating_sum=rating_sum)
+            for mentor_email, (rating_count, rating_sum)
+            in compute_mentor_ratings(feedback_model, archived_feedback_models).items()
+        ])
+
+
+# compares the rollup with one computed from scratch, returning a list of (what, stored, expected) mismatches
+def verify(ticket_model, feedback_model, stats_model, participant_model, archived_models=()):
+    counters, participants = compute(ticket_model, feedback_model, archived_models)
+    stats = stats_model.objects.filter(pk=STATS_PK).values(*COUNTERS).first() or {}
+    mismatches = [(counter, stats.get(counter), expected) for counter, expected in counters.items()
+                  if stats.get(counter) != expected]
+    stored = {(row["role"], row["email"]): row["tickets"]
+              for row in participant_model.objects.values("role", "email", "tickets")}
+    for participant in sorted(set(stored) | set(participants)):
+        if stored.get(participant) != participants.get(participant):
+            mismatches.append(("{} {}".format(*participant), stored.get(participant), participants.get(participant)))
+    return mismatches
+
+
+def verify_mentor_ratings(feedback_model, mentor_rating_model, archived_feedback_models=()):
+    expected = compute_mentor_ratings(feedback_model, archived_feedback_models)
+    stored = {row["mentor_email"]: (row["rating_count"], row["rating_sum"]) for row in
+              mentor_rating_model.objects.filter(rating_count__gt=0).values("mentor_email", "rating_count",
+                                                                            "rating_sum")}
+    return [("ratings of " + mentor_email, stored.get(mentor_email), expected.get(mentor_email))
+            for mentor_email in sorted(set(stored) | set(expected))
+            if stored.get(mentor_email) != expected.get(mentor_email)]
@@ -3,41 +3,117 @@ from rest_framework.reverse import reverse
 
 from mentorq_api.models import Ticket, Feedback
 
+# stands in for the primary key while a detail URL is reversed, it is replaced with the actual key afterwards
+URL_PLACEHOLDER = "mentorq-pk-placeholder"
+
+
+# reverses the detail URL of view_name once, returning a template that only needs the primary key filled in
+def detail_url_template(view_name, request, format=None, lookup_url_kwarg="pk"):
+    return reverse(view_name, kwargs={lookup_url_kwarg: URL_PLACEHOLDER}, request=request, format=format)
+
+
+# a HyperlinkedIdentityField that resolves its URL once per serializer instead of once per object
+class TemplatedHyperlinkedIdentityField(serializers.HyperlinkedIdentityField):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url_templates = {}
+
+    def get_url(self, obj, view_name, request, format):
+        lookup_value = getattr(obj, self.lookup_field)
+        if lookup_value in (None, ""):
+            return None
+        if format not in self.url_templates:
+            self.url_templates[format] = detail_url_template(view_name, request, format, self.lookup_url_kwarg)
+        return self.url_templates[format].replace(URL_PLACEHOLDER, str(lookup_value))
+
 
 # returns the relevant fields from a Ticket object
+# the feedback is expected to be loaded along with the tickets (select_related("feedback"))
 class TicketSerializer(serializers.HyperlinkedModelSerializer):
+    serializer_url_field = TemplatedHyperlinkedIdentityField
     feedback = serializers.SerializerMethodField()
 
     def get_feedback(self, obj):
         feedback = ""
         request = self.context["request"]
         lcs_profile = request.user.lcs_profile
-        if hasattr(obj, "feedback") and (lcs_profile["role"]["director"] or lcs_profile["email"] == obj.owner_email):
-            feedback = reverse(
-                "feedback-detail", args=[obj.feedback.pk], request=self.context["request"])
+        if (lcs_profile["role"]["director"] or lcs_profile["email"] == obj.owner_email) and hasattr(obj, "feedback"):
+            if not hasattr(self, "feedback_url_template"):
+                self.feedback_url_template = detail_url_template("feedback-detail", request)
+            feedback = self.feedback_url_template.replace(URL_PLACEHOLDER, str(obj.feedback.pk))
         return feedback
 
     class Meta:
         model = Ticket
         fields = [
             "id", "url", "owner_email", "mentor", "mentor_email", "status", "title",
-            "comment", "contact", "location", "created_datetime", "feedback", "owner", "active"
+            "comment", "contact", "location", "created_datetime", "feedback", "owner", "active", "version"
         ]
 
 
 class TicketEditableSerializer(serializers.HyperlinkedModelSerializer):
+    serializer_url_field = TemplatedHyperlinkedIdentityField
+
     class Meta:
         model = Ticket
         fields = [
             "id", "url", "owner_email", "mentor", "mentor_email", "status", "title",
-            "comment", "contact", "location", "created_datetime", "owner", "active"
+            "comment", "contact", "location", "created_datetime", "owner", "active", "version"
         ]
         read_only_fields = ["id", "url", "owner_email", "title", "comment", "contact", "location", "created_datetime",
                             "claimed_datetime", "closed_datetime", "owner"]
 
 
+# selects the tickets of a bulk change, every given field has to match
+class TicketBulkFilterSerializer(serializers.Serializer):
+    # the lookup each field filters the tickets with
+    LOOKUPS = {
+        "status": "status__in",
+        "owner_email": "owner_email",
+        "mentor_email": "mentor_email",
+        "created_before": "created_datetime__lt",
+        "active": "active",
+    }
+
+    status = serializers.ListField(child=serializers.ChoiceField(choices=Ticket.StatusType.choices), required=False)
+    owner_email = serializers.EmailField(required=False)
+    mentor_email = serializers.EmailField(required=False, allow_blank=True)
+    created_before = serializers.DateTimeField(required=False)
+    active = serializers.BooleanField(required=False)
+
+    # the queryset filters for the validated fields
+    @classmethod
+    def filters(cls, data):
+        return {cls.LOOKUPS[field]: value for field, value in data.items()}
+
+
+# a change to the tickets with the given ids and/or matching the filter: a status to move them to and/or whether
+# they are active
+class TicketBulkSerializer(serializers.Serializer):
+    MAX_IDS = 5000
+
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=MAX_IDS)
+    filter = TicketBulkFilterSerializer(required=False)
+    status = serializers.ChoiceField(choices=Ticket.BULK_STATUSES, required=False)
+    active = serializers.BooleanField(required=False)
+
+    def validate(self, data):
+        if "ids" not in data and "filter" not in data:
+            raise serializers.ValidationError("Select the tickets with ids or a filter.")
+        if "status" not in data and "active" not in data:
+            raise serializers.ValidationError("Give a status or active to change the tickets to.")
+        return data
+
+    # the queryset filters selecting the tickets to change
+    def filters(self):
+        filters = TicketBulkFilterSerializer.filters(self.validated_data.get("filter", {}))
+        if "ids" in self.validated_data:
+            filters["pk__in"] = self.validated_data["ids"]
+        return filters
+
+
 class FeedbackSerializer(serializers.ModelSerializer):
-    ticket_url = serializers.HyperlinkedIdentityField(
+    ticket_url = TemplatedHyperlinkedIdentityField(
         view_name="ticket-detail", source="url")
 
     class Meta:
@@ -46,7 +122,7 @@ class FeedbackSerializer(serializers.ModelSerializer):
 
 
 class FeedbackEditableSerializer(serializers.ModelSerializer):
-    ticket_url = serializers.HyperlinkedIdentityField(
+    ticket_url = TemplatedHyperlinkedIdentityField(
         view_name="ticket-detail", source="url")
 
     class Meta:
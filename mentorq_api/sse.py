@@ -0,0 +1,308 @@
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from mentorq_api import events
+from mentorq_api.models import Ticket, DeletedTicket, ChangeSequence
+from mentorq_main.asgi_utils import cors_send, header_dict, bearer_token, send_json
+from mentorq_user.authentication import MentorqTokenUser, MentorqStatelessJWTAuthentication
+
+
+logger = logging.getLogger("mentorq.events")
+
+
+# the event as a user with the given LCS profile may see it, None if they can't see it at all
+# (the same rules as TicketViewSet.get_queryset)
+def visible_event(event, lcs_profile):
+    if event["event"] == "reset":
+        return event
+    user_roles = lcs_profile["role"]
+    data = event["data"]
+    if not (user_roles["organizer"] or user_roles["director"] or user_roles["mentor"]) \
+            and data["owner_email"] != lcs_profile["email"]:
+        return None
+    if user_roles["mentor"] and not (user_roles["director"]) and data.get("status") == Ticket.StatusType.CLOSED:
+        # mentors don't see closed tickets, they are only told that the ticket left the queue
+        return dict(event, data={"id": data["id"], "version": data["version"], "status": data["status"]})
+    return event
+
+
+# the changes after since up to version as events, in version order: "updated" for the tickets changed since then (with
+# the latest version of each) and "deleted" for the ones deleted since then, None if there are more than limit
+# owner_email limits them to the tickets of one owner
+def feed_events(since, version, limit, owner_email=None):
+    changed = {"version__gt": since, "version__lte": version}
+    tickets = Ticket.objects.filter(**changed).order_by("version")
+    deleted = DeletedTicket.objects.filter(**changed).order_by("version")
+    if owner_email is not None:
+        tickets = tickets.filter(owner_email=owner_email)
+        deleted = deleted.filter(owner_email=owner_email)
+    changes = [events.ticket_event("updated", ticket) for ticket in tickets[:limit + 1]]
+    changes += [events.deleted_event(ticket.ticket_id, ticket.owner_email, ticket.version)
+                for ticket in deleted[:limit + 1]]
+    if len(changes) > limit:
+        return None
+    return sorted(changes, key=lambda event: event["id"])
+
+
+# the events a user missed since the given version, read from the ticket versions and the deleted tickets
+# returns (events, version of the latest committed change), events is None if more than limit changes were missed
+def replay(since, lcs_profile, limit):
+    try:
+        user_roles = lcs_profile["role"]
+        version = ChangeSequence.current_value(ChangeSequence.TICKETS)
+        owner_email = None
+        if not (user_roles["organizer"] or user_roles["director"] or user_roles["mentor"]):
+            owner_email = lcs_profile["email"]
+        missed = feed_events(since, version, limit, owner_email)
+        if missed is None:
+            return None, version
+        return [event for event in map(lambda event: visible_event(event, lcs_profile), missed) if event], version
+    finally:
+        # the thread this runs in is reused for other work
+        close_old_connections()
+
+
+def reset_event(version):
+    return {"id": version, "event": "reset", "data": {"version": version}}
+
+
+# reads the change sequence of a ChangeFeedBroker from the event loop of its subscribers, for as long as the loop has
+# any
+class FeedPoller:
+    def __init__(self, broker, loop):
+        self.broker = broker
+        self.loop = loop
+        # the latest version delivered, None until the first read
+        self.version = None
+        # done once the first version is read, events committed from then on are delivered
+        self.started = loop.create_future()
+        self.wake = asyncio.Event()
+        self.task = loop.create_task(self.run())
+
+    async def run(self):
+        while True:
+            subscriptions = self.broker.subscriptions_on(self.loop)
+            if not subscriptions:
+                self.broker.stop_poller(self)
+                return
+            try:
+                self.version, changes = await sync_to_async(self.broker.read)(self.version)
+            except Exception as e:
+                if not self.started.done():
+                    # the subscribers that wait for the first read fail along with it
+                    self.broker.stop_poller(self)
+                    self.started.set_exception(e)
+                    return
+                logger.exception("Reading the ticket changes failed")
+                changes = []
+            if not self.started.done():
+                self.started.set_result(None)
+            for event in changes:
+                for subscription in self.broker.subscriptions_on(self.loop):
+                    subscription.deliver(event)
+            self.broker.forget(self.version)
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.broker.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+
+# pub/sub between processes through the database: every process polls the ticket change sequence (see
+# ChangeSequence) while it has subscribers, at least every MENTORQ_EVENT_POLL_INTERVAL seconds and right after it
+# publishes, and delivers the changes committed since, by any process, in version order
+# the events published in this process keep their type ("claimed", "closed", ...), changes made elsewhere arrive as
+# the "updated" and "deleted" events a resuming client replays, and a "reset" event if too many were made at once
+class ChangeFeedBroker(events.InProcessBroker):
+    def __init__(self, interval=None, limit=None):
+        super().__init__()
+        self.interval = interval if interval is not None \
+            else getattr(settings, "MENTORQ_EVENT_POLL_INTERVAL", 1.0)
+        self.limit = limit if limit is not None else getattr(settings, "MENTORQ_EVENT_REPLAY_LIMIT", 1000)
+        self._pollers = {}
+        # the events published here until the pollers read their changes, by version
+        self._published = {}
+
+    # must be called from the event loop that reads the subscription
+    def subscribe(self, size):
+        subscription = super().subscribe(size)
+        with self._lock:
+            poller = self._pollers.get(subscription.loop)
+            if poller is None:
+                poller = self._pollers[subscription.loop] = FeedPoller(self, subscription.loop)
+        subscription.started = poller.started
+        return subscription
+
+    def publish(self, event):
+        with self._lock:
+            pollers = list(self._pollers.values())
+            if pollers:
+                self._published[event["id"]] = event
+        for poller in pollers:
+            try:
+                poller.loop.call_soon_threadsafe(poller.wake.set)
+            except RuntimeError:
+                # the poller's loop has been closed
+                self.stop_poller(poller)
+
+    def subscriptions_on(self, loop):
+        with self._lock:
+            return [subscription for subscription in self._subscriptions if subscription.loop is loop]
+
+    def stop_poller(self, poller):
+        with self._lock:
+            if self._pollers.get(poller.loop) is poller:
+                del self._pollers[poller.loop]
+            if not self._pollers:
+                self._published.clear()
+
+    # drops the published events every poller has read
+    def forget(self, version):
+        with self._lock:
+            version = min([poller.version or 0 for poller in self._pollers.values()] + [version])
+            for published in [published for published in self._published if published <= version]:
+                del self._published[published]
+
+    # the latest version and the events after since up to it (none on the first read, when since is None)
+    def read(self, since):
+        try:
+            version = ChangeSequence.current_value(ChangeSequence.TICKETS)
+            if since is None or version <= since:
+                return version, []
+            changes = feed_events(since, version, self.limit)
+            if changes is None:
+                return version, [reset_event(version)]
+            with self._lock:
+                return version, [self._published.get(event["id"], event) for event in changes]
+        finally:
+            close_old_connections()
+
+
+def format_event(event):
+    return "id: {}\nevent: {}\ndata: {}\n\n".format(
+        event["id"], event["event"], json.dumps(event["data"], separators=(",", ":"))).encode()
+
+
+# ASGI app streaming ticket events to a client as server-sent events
+# clients authenticate with a Mentorq access token, either in the Authorization header or (since EventSource can't
+# set headers) in the access_token query parameter. They receive the events of the tickets they can see.
+# A client that passes the version it has seen as the Last-Event-ID header (EventSource does this when it
+# reconnects) or the last_event_id query parameter first receives the changes it missed. If it missed more than
+# MENTORQ_EVENT_REPLAY_LIMIT, it receives a "reset" event and should reload the ticket list.
+# An idle connection is a coroutine and a bounded queue, with no thread or database connection of its own.
+class TicketEventStream:
+    PATH = "/api/tickets/events/"
+    # the milliseconds EventSource waits before it reconnects
+    RETRY = 3000
+
+    def __init__(self, broker=None, keepalive=None, queue_size=None, replay_limit=None):
+        self._broker = broker
+        self.keepalive = keepalive if keepalive is not None else getattr(settings, "MENTORQ_EVENT_KEEPALIVE", 15)
+        self.queue_size = queue_size if queue_size is not None else getattr(settings, "MENTORQ_EVENT_QUEUE_SIZE", 100)
+        self.replay_limit = replay_limit if replay_limit is not None \
+            else getattr(settings, "MENTORQ_EVENT_REPLAY_LIMIT", 1000)
+
+    @property
+    def broker(self):
+        return self._broker or events.get_broker()
+
+    async def __call__(self, scope, receive, send):
+        # every answer gets the CORS headers, so that EventSource can connect from the frontend's origin
+        send = cors_send(scope, send)
+        if scope["method"] != "GET":
+            return await send_json(send, 405, {"detail": "Method \"{}\" not allowed.".format(scope["method"])})
+        headers = header_dict(scope)
+        query = parse_qs(scope.get("query_string", b"").decode())
+        lcs_profile = self.authenticate(headers, query)
+        if lcs_profile is None:
+            return await send_json(send, 401, {"detail": "Given token not valid for any token type"})
+        try:
+            last_event_id = headers.get("last-event-id") or query.get("last_event_id", [None])[0]
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            return await send_json(send, 400, {"detail": "Last-Event-ID must be a version number."})
+
+        # subscribing before the replay means no event falls between the two
+        subscription = self.broker.subscribe(self.queue_size)
+        try:
+            await subscription.wait_started()
+        except Exception:
+            subscription.close()
+            raise
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                # stops proxies (e.g. nginx) from buffering the stream
+                (b"x-accel-buffering", b"no"),
+            ]})
+            await self.send_body(send, "retry: {}\n\n".format(self.RETRY).encode())
+            version = 0
+            if last_event_id is not None:
+                missed, version = await sync_to_async(replay)(last_event_id, lcs_profile, self.replay_limit)
+                if missed is None:
+                    missed = [reset_event(version)]
+                for event in missed:
+                    await self.send_body(send, format_event(event))
+            await self.stream(send, subscription, disconnected, lcs_profile, version)
+        finally:
+            subscription.close()
+            client_gone = disconnected.done()
+            disconnected.cancel()
+        if not client_gone:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    # sends events until the client disconnects or falls too far behind, events up to version were replayed already
+    async def stream(self, send, subscription, disconnected, lcs_profile, version):
+        while True:
+            next_event = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, timeout=self.keepalive,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if next_event not in done:
+                next_event.cancel()
+                if disconnected in done:
+                    return
+                # a comment keeps proxies from closing the idle connection
+                await self.send_body(send, b": keepalive\n\n")
+                continue
+            event = next_event.result()
+            if event is None:
+                # the client fell behind and resumes from its Last-Event-ID when it reconnects
+                return
+            if event["id"] <= version:
+                continue
+            event = visible_event(event, lcs_profile)
+            if event is not None:
+                await self.send_body(send, format_event(event))
+
+    # the LCS profile from the claims of the access token, None if the token isn't valid
+    @staticmethod
+    def authenticate(headers, query):
+        token = bearer_token(headers) or query.get("access_token", [None])[0]
+        if not token:
+            return None
+        try:
+            validated_token = AccessToken(token)
+        except TokenError:
+            return None
+        if not all(claim in validated_token for claim in MentorqStatelessJWTAuthentication.REQUIRED_CLAIMS):
+            return None
+        return MentorqTokenUser(validated_token).lcs_profile
+
+    @staticmethod
+    async def wait_for_disconnect(receive):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    @staticmethod
+    async def send_body(send, body):
+        await send({"type": "http.response.body", "body": body, "more_body": True})
@@ -1,36 +1,124 @@
-from datetime import timedelta
+import hashlib
 
 import lcs_client
-from django.db.models import Avg
+from django.db.models import Count, Max
+from django.utils.cache import patch_vary_headers
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import parse_etags
 from rest_framework import mixins, viewsets
 from rest_framework.decorators import action
-from rest_framework.exceptions import PermissionDenied, NotAuthenticated, NotFound
+from rest_framework.exceptions import APIException, PermissionDenied, NotAuthenticated, NotFound, ValidationError
 from rest_framework.response import Response
 from django.db.models import Q
 
-from mentorq_api.models import Ticket, Feedback
+from mentorq_api import events, rollup
+from mentorq_api.models import Ticket, Feedback, TicketStats, MentorRating, TicketConflict, ChangeSequence, \
+    DeletedTicket, InvalidTransition
 from mentorq_api.serializers import TicketSerializer, TicketEditableSerializer, FeedbackSerializer, \
-    FeedbackEditableSerializer
+    FeedbackEditableSerializer, TicketBulkSerializer
+from mentorq_main.timing import timed
+from mentorq_user.lcs import dm_link_cache
 
 import json
 
 
+# returned when a ticket changed between being read and written, e.g. when another mentor claimed it first
+class Conflict(APIException):
+    status_code = 409
+    default_detail = "The ticket was changed by somebody else, reload it and try again."
+    default_code = "conflict"
+
+
 class LCSAuthenticatedMixin:
     def initial(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             raise NotAuthenticated
         # the lcs profile is stored in as arguments
-
+        # (the lcs user is only built when a view actually uses it, since building it costs a round trip to LCS)
         self.kwargs["lcs_profile"] = request.user.lcs_profile
-        self.kwargs["lcs_user"] = request.user.lcs_user
+        self.kwargs["lcs_user"] = SimpleLazyObject(lambda: request.user.lcs_user)
         return super().initial(request, *args, **kwargs)
 
 
+# answers GETs with an ETag and If-None-Match requests for an unchanged response with a 304, before serializing it
+# the ETag of a list is built from the highest version and the number of the objects in it, the ETag of a single
+# object from its version, together with everything else the body depends on (the user, the URL and the media type)
+class ConditionalGetMixin:
+    # the field holding the version of an object, changes to an object must increase it
+    version_field = "version"
+
+    def etag(self, *validators):
+        lcs_profile = self.kwargs["lcs_profile"]
+        key = json.dumps([lcs_profile["email"], lcs_profile["role"], self.request.get_host(),
+                          self.request.get_full_path(), self.request.accepted_media_type, validators],
+                         sort_keys=True, default=str)
+        return '"{}"'.format(hashlib.sha1(key.encode()).hexdigest())
+
+    # whether the client already has the response with the given ETag, if so the ETag is sent back with a 304
+    def not_modified(self, etag):
+        self.response_etag = etag
+        if_none_match = self.request.META.get("HTTP_IF_NONE_MATCH")
+        if not if_none_match:
+            return False
+        etags = parse_etags(if_none_match)
+        return "*" in etags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in etags)
+
+    def not_modified_response(self):
+        return Response(status=304)
+
+    def version_of(self, obj):
+        for name in self.version_field.split("__"):
+            obj = getattr(obj, name)
+        return obj
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None and "HTTP_IF_NONE_MATCH" in request.META:
+            # a single aggregate tells whether the list changed, without fetching it
+            validators = queryset.aggregate(version=Max(self.version_field), count=Count("pk"))
+            if self.not_modified(self.etag(validators["version"], validators["count"])):
+                return self.not_modified_response()
+        objects = list(page if page is not None else queryset)
+        validators = [max(map(self.version_of, objects), default=None), len(objects)]
+        if page is not None:
+            validators.append(self.paginator.has_next)
+        if self.not_modified(self.etag(*validators)):
+            return self.not_modified_response()
+        with timed("serialize"):
+            data = self.get_serializer(objects, many=True).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        if self.not_modified(self.etag(self.version_of(instance))):
+            return self.not_modified_response()
+        with timed("serialize"):
+            return Response(self.get_serializer(instance).data)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        etag = getattr(self, "response_etag", None)
+        if etag is not None and response.status_code in (200, 304):
+            response["ETag"] = etag
+            # the body depends on who is asking
+            patch_vary_headers(response, ["Authorization"])
+        return response
+
+
 # view for the /tickets endpoint
-class TicketViewSet(LCSAuthenticatedMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
+class TicketViewSet(LCSAuthenticatedMixin, ConditionalGetMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
                     mixins.UpdateModelMixin, viewsets.GenericViewSet):
-    queryset = Ticket.objects.all()
+    # the feedback is joined in since TicketSerializer links to it
+    queryset = Ticket.objects.select_related("feedback")
     serializer_class = TicketSerializer
+    # the order pages are returned in when a client asks for a paginated list
+    cursor_ordering = ("created_datetime", "id")
+    # the actions that move a ticket to another status and the fields they respond with
+    TRANSITION_ACTIONS = ("claim", "release", "close", "cancel")
+    TRANSITION_FIELDS = ("id", "status", "mentor", "mentor_email", "claimed_datetime", "closed_datetime", "version")
 
     def get_serializer_class(self):
         serializer_class = self.serializer_class
@@ -41,13 +129,11 @@ class TicketViewSet(LCSAuthenticatedMixin, mixins.CreateModelMixin, mixins.Retri
     # queryset is filtered according to user's role within LCS
     def get_queryset(self):
         lcs_profile = self.kwargs.get("lcs_profile")
-        user_roles = lcs_profile["role"]
         queryset = super().get_queryset()
-        if not (user_roles["organizer"] or user_roles["director"] or user_roles["mentor"]):
-            queryset = queryset.filter(owner_email=lcs_profile["email"])
-        if user_roles["mentor"] and not (user_roles["director"]):
-            queryset = queryset.exclude(status=Ticket.StatusType.CLOSED)
-        return queryset
+        if getattr(self, "action", None) in self.TRANSITION_ACTIONS:
+            # transitions only need the fields they check and the fields of the event they publish
+            queryset = queryset.select_related(None).only(*events.TICKET_FIELDS)
+        return queryset.visible_to(lcs_profile)
 
     def perform_create(self, serializer):
         if self.kwargs.get("lcs_profile")["email"] != serializer.validated_data["owner_email"]:
@@ -55,56 +141,145 @@ class TicketViewSet(LCSAuthenticatedMixin, mixins.CreateModelMixin, mixins.Retri
                 "You cannot create a ticket on behalf of another user")
         super().perform_create(serializer)
 
+    def perform_update(self, serializer):
+        try:
+            super().perform_update(serializer)
+        except InvalidTransition as e:
+            raise Conflict(str(e))
+        except TicketConflict:
+            raise Conflict
+
+    # moves the ticket to status with a single conditional update, responding with only the fields a transition changes
+    # answers 409 if the ticket can't make the transition, e.g. when another mentor claimed it first
+    def transition(self, ticket, status, **changes):
+        if ticket.status not in Ticket.TRANSITIONS[status][0]:
+            raise Conflict("The ticket is {} and can't be moved to {}.".format(ticket.status, status))
+        if not ticket.transition(status, **changes):
+            raise Conflict
+        return Response({field: getattr(ticket, field) for field in self.TRANSITION_FIELDS})
+
+    # the name a mentor claims a ticket under, unless the request gives one
+    @staticmethod
+    def mentor_name(request, lcs_profile):
+        if "mentor" in request.data:
+            return str(request.data["mentor"])[:255]
+        if "first_name" in lcs_profile:
+            return " ".join(filter(None, (lcs_profile["first_name"], lcs_profile.get("last_name"))))[:255]
+        return getattr(request.user, "name", "")
+
+    # mentors (and directors) claim an open ticket for themselves
+    @action(methods=["post"], detail=True, url_path="claim", url_name="claim")
+    def claim(self, request, *args, **kwargs):
+        lcs_profile = kwargs["lcs_profile"]
+        if not (lcs_profile["role"]["mentor"] or lcs_profile["role"]["director"]):
+            raise PermissionDenied("Only mentors can claim tickets")
+        return self.transition(self.get_object(), Ticket.StatusType.CLAIMED, mentor_email=lcs_profile["email"],
+                               mentor=self.mentor_name(request, lcs_profile))
+
+    # the mentor who claimed a ticket (or a director) puts it back in the queue
+    @action(methods=["post"], detail=True, url_path="release", url_name="release")
+    def release(self, request, *args, **kwargs):
+        lcs_profile = kwargs["lcs_profile"]
+        ticket = self.get_object()
+        if not (lcs_profile["role"]["director"] or lcs_profile["email"] == ticket.mentor_email):
+            raise PermissionDenied("Only the mentor who claimed the ticket can release it")
+        return self.transition(ticket, Ticket.StatusType.OPEN, mentor_email="", mentor="")
+
+    # the owner, the mentor who claimed the ticket or a director closes it
+    @action(methods=["post"], detail=True, url_path="close", url_name="close")
+    def close(self, request, *args, **kwargs):
+        lcs_profile = kwargs["lcs_profile"]
+        ticket = self.get_object()
+        if not (lcs_profile["role"]["director"] or lcs_profile["email"] in (ticket.owner_email, ticket.mentor_email)):
+            raise PermissionDenied("Only the owner or the mentor of the ticket can close it")
+        return self.transition(ticket, Ticket.StatusType.CLOSED)
+
+    # the owner or a director cancels a ticket that hasn't been closed
+    @action(methods=["post"], detail=True, url_path="cancel", url_name="cancel")
+    def cancel(self, request, *args, **kwargs):
+        lcs_profile = kwargs["lcs_profile"]
+        ticket = self.get_object()
+        if not (lcs_profile["role"]["director"] or lcs_profile["email"] == ticket.owner_email):
+            raise PermissionDenied("Only the owner of the ticket can cancel it")
+        return self.transition(ticket, Ticket.StatusType.CANCELLED)
+
+    # directors close or cancel the tickets with the given ids or matching a filter, and/or set whether they are
+    # active, in one request (e.g. every stale ticket at the end of an event), see TicketQuerySet.bulk_change
+    # responds with the number of changed tickets, how many were in each status and the version of the change, and
+    # the given ids that weren't changed (because they don't exist or can't make the transition)
+    @action(methods=["post"], detail=False, url_path="bulk", url_name="bulk")
+    def bulk(self, request, *args, **kwargs):
+        if not kwargs["lcs_profile"]["role"]["director"]:
+            raise PermissionDenied("Only directors can change tickets in bulk")
+        serializer = TicketBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        summary = Ticket.objects.filter(**serializer.filters()).bulk_change(
+            serializer.validated_data.get("status"), serializer.validated_data.get("active"))
+        changed = set(summary.pop("ids"))
+        if "ids" in serializer.validated_data:
+            summary["skipped"] = sorted(set(serializer.validated_data["ids"]) - changed)
+        return Response(summary)
+
+    # the tickets that changed since the version a client last saw, so that polling clients only download the changes
+    # responds with the version to pass as since next time, the changed tickets the user can see and the ids of
+    # tickets the user should drop
+    @action(methods=["get"], detail=False, url_path="changes", url_name="changes")
+    def get_changes(self, request, *args, **kwargs):
+        try:
+            since = int(request.query_params.get("since", 0))
+        except ValueError:
+            raise ValidationError({"since": "Must be a version number."})
+        lcs_profile = kwargs["lcs_profile"]
+        user_roles = lcs_profile["role"]
+        # every change up to the latest committed version has been committed, later ones are left for the next poll
+        version = ChangeSequence.current_value(ChangeSequence.TICKETS)
+        changed = {"version__gt": since, "version__lte": version}
+
+        tickets = self.get_queryset().filter(**changed).order_by("version")
+        deleted = DeletedTicket.objects.filter(**changed).order_by("version")
+        if not (user_roles["organizer"] or user_roles["director"] or user_roles["mentor"]):
+            deleted = deleted.filter(owner_email=lcs_profile["email"])
+        removed = list(deleted.values_list("ticket_id", flat=True))
+        if user_roles["mentor"] and not (user_roles["director"]):
+            # closed tickets leave the mentors' list (see get_queryset)
+            removed += Ticket.objects.filter(status=Ticket.StatusType.CLOSED, **changed).order_by("version") \
+                .values_list("id", flat=True)
+        with timed("serialize"):
+            data = self.get_serializer(tickets, many=True).data
+        return Response({
+            "version": version,
+            "tickets": data,
+            "removed": removed,
+        })
+
     # Get stats about tickets
+    # the stats are read from the rollup that is maintained as tickets and feedback are written
     @action(methods=["get"], detail=False, url_path="stats", url_name="stats")
     def get_stats(self, request, *args, **kwargs):
         roles = kwargs["lcs_profile"]["role"]
-
-        total_tickets = Ticket.objects.count()
-
-        claimed_datetime_deltas = list(map(lambda ticket: ticket.claimed_datetime - ticket.created_datetime,
-                                           Ticket.objects.exclude(claimed_datetime__isnull=True).only(
-                                               "created_datetime",
-                                               "claimed_datetime")))
-        num_of_claimed_datetime_deltas = len(claimed_datetime_deltas)
-        closed_datetime_deltas = list(map(lambda ticket: ticket.closed_datetime - ticket.created_datetime,
-                                          Ticket.objects.exclude(Q(closed_datetime__isnull=True) | Q(active=False)).only("created_datetime",
-                                                                                                                         "closed_datetime")))
-        num_of_closed_datetime_deltas = len(closed_datetime_deltas)
-        average_claimed_datetime = (sum(claimed_datetime_deltas, timedelta(
-            0)) / num_of_claimed_datetime_deltas) if num_of_claimed_datetime_deltas > 0 else None
-        average_closed_datetime = (sum(closed_datetime_deltas, timedelta(
-            0)) / num_of_closed_datetime_deltas) if num_of_closed_datetime_deltas > 0 else None
+        stats = TicketStats.load()
+        if self.not_modified(self.etag(*[getattr(stats, counter) for counter in rollup.COUNTERS])):
+            return self.not_modified_response()
 
         # Stats for director
         if roles["director"]:
-            tickets_open = Ticket.objects.filter(status="OPEN").count()
-            tickets_cancelled = Ticket.objects.filter(
-                status="CANCELLED").count()
-            tickets_claimed = Ticket.objects.filter(status="CLAIMED").count()
-            tickets_closed = Ticket.objects.filter(status="CLOSED").count()
-            number_of_mentors = Ticket.objects.values(
-                'mentor_email').exclude(mentor_email='').distinct().count()
-            number_of_users = Ticket.objects.values(
-                'owner_email').exclude(owner_email="").distinct().count()
-
             return Response(
-                {"average_claimed_datetime_seconds": average_claimed_datetime,
-                 "average_closed_datetime_seconds": average_closed_datetime,
-                 "Total tickets": total_tickets,
-                 "Open tickets": tickets_open,
-                 "Claimed tickets": tickets_claimed,
-                 "Closed Tickets": tickets_closed,
-                 "Cancelled Tickets": tickets_cancelled,
-                 "Number of mentors": number_of_mentors,
-                 "Number of users": number_of_users,
-                 "Average Rating": Feedback.objects.all().aggregate(Avg('rating'))})
+                {"average_claimed_datetime_seconds": stats.average_claimed_datetime,
+                 "average_closed_datetime_seconds": stats.average_closed_datetime,
+                 "Total tickets": stats.total_tickets,
+                 "Open tickets": stats.open_tickets,
+                 "Claimed tickets": stats.claimed_tickets,
+                 "Closed Tickets": stats.closed_tickets,
+                 "Cancelled Tickets": stats.cancelled_tickets,
+                 "Number of mentors": stats.mentors,
+                 "Number of users": stats.users,
+                 "Average Rating": {"rating__avg": stats.average_rating}})
 
         # Stats for everyone
         return Response(
-            {"average_claimed_datetime_seconds": average_claimed_datetime,
-             "average_closed_datetime_seconds": average_closed_datetime,
-             "Total tickets": total_tickets, })
+            {"average_claimed_datetime_seconds": stats.average_claimed_datetime,
+             "average_closed_datetime_seconds": stats.average_closed_datetime,
+             "Total tickets": stats.total_tickets, })
 
     @action(methods=["get"], detail=True, url_path="slack-dm", url_name="slack-dm")
     def get_slack_dm(self, request, *args, **kwargs):
@@ -119,27 +294,26 @@ class TicketViewSet(LCSAuthenticatedMixin, mixins.CreateModelMixin, mixins.Retri
             other_email = owner_email
         else:
             other_email = mentor_email
-        try:
-            return Response(lcs_user.create_dm_link_to(other_email))
-        except lcs_client.CredentialError as c:
-            statusCode = c.response.json()["statusCode"]
-            body = c.response.json()["body"]
-            return Response(body, status=statusCode)
-        except lcs_client.RequestError as r:
-            statusCode = r.response.json()["statusCode"]
-            body = r.response.json()["body"]
-            return Response(body, status=statusCode)
-        except lcs_client.InternalServerError as i:
-            statusCode = i.response.json()["statusCode"]
-            body = i.response.json()["body"]
-            return Response(body, status=statusCode)
+
+        # the link is cached for the pair, LCS (and so the lcs user) is only needed on a miss
+        def fetch():
+            try:
+                return 200, lcs_user.create_dm_link_to(other_email)
+            except (lcs_client.CredentialError, lcs_client.RequestError, lcs_client.InternalServerError) as e:
+                return e.response.json()["statusCode"], e.response.json()["body"]
+
+        statusCode, body = dm_link_cache.get(request_email, other_email, fetch)
+        return Response(body, status=statusCode)
 
 
 # view for the /feedback endpoint
-class FeedbackViewSet(LCSAuthenticatedMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
+class FeedbackViewSet(LCSAuthenticatedMixin, ConditionalGetMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin,
                       mixins.UpdateModelMixin, viewsets.GenericViewSet):
-    queryset = Feedback.objects.all()
+    # the version of a ticket covers its feedback
+    queryset = Feedback.objects.select_related("ticket")
+    version_field = "ticket__version"
     serializer_class = FeedbackSerializer
+    cursor_ordering = ("ticket__created_datetime", "ticket_id")
     LEADERBOARD_DEFAULT_SIZE = 5
 
     def get_serializer_class(self):
@@ -188,18 +362,10 @@ class FeedbackViewSet(LCSAuthenticatedMixin, mixins.CreateModelMixin, mixins.Ret
                 "Cannot leave feedback for a ticket with no mentor")
         return super().perform_create(serializer)
 
+    # the leaderboard is ranked from the per-mentor rating totals
     @action(methods=["get"], detail=False, url_path="leaderboard", url_name="leaderboard")
     def get_leaderboard(self, request, *args, **kwargs):
         limit = int(self.request.query_params.get(
             "limit", FeedbackViewSet.LEADERBOARD_DEFAULT_SIZE))
-        queryset = Feedback.objects.values("ticket__mentor_email") \
-            .annotate(average_rating=Avg("rating")) \
-            .order_by("-average_rating")
-        queryset = queryset[:min(len(queryset), limit)]
-        leaderboard = []
-        for elem in queryset:
-            mentor = Ticket.objects.filter(
-                mentor_email__exact=elem["ticket__mentor_email"])[0].mentor_email
-            leaderboard.append(
-                {"mentor": mentor, "average_rating": elem["average_rating"]})
+        leaderboard = MentorRating.leaderboard(max(limit, 0))
         return Response(leaderboard, content_type="application/json")
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mentorq_main.settings.local')
+
+django_application = get_asgi_application()
+
+# imported once Django is set up
+from mentorq_api.async_views import SLACK_DM_PATH, slack_dm  # noqa: E402
+from mentorq_api.sse import TicketEventStream  # noqa: E402
+from mentorq_main import metrics  # noqa: E402
+from mentorq_main.asgi_utils import cors_send, read_body, replay_body  # noqa: E402
+from mentorq_user.async_views import TOKEN_PATH, obtain_token  # noqa: E402
+from mentorq_user.lcs_async import close_client  # noqa: E402
+
+event_stream = TicketEventStream()
+
+
+# the ticket event stream and the endpoints that wait on LCS are served directly (the latter fall back to Django for
+# anything but the common case), everything else goes to Django
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http":
+        if scope["path"] == TicketEventStream.PATH:
+            return await event_stream(scope, receive, send)
+        if scope["path"] == TOKEN_PATH and scope["method"] == "POST":
+            body = await read_body(receive)
+            if await observed("mentorq_token_obtain_pair", obtain_token, scope, send, body):
+                return
+            receive = replay_body(body, receive)
+        match = SLACK_DM_PATH.match(scope["path"])
+        if match and scope["method"] == "GET" and \
+                await observed("ticket-slack-dm", slack_dm, scope, send, match["pk"]):
+            return
+    return await django_application(scope, receive, send)
+
+
+# answers the server's startup and shutdown messages, sizing the worker's thread pool on startup and closing the LCS
+# client of its loop on shutdown
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Django's views and the database calls run in the loop's default thread pool
+            asyncio.get_event_loop().set_default_executor(ThreadPoolExecutor(settings.WORKER_THREADS))
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+# calls view(scope, send, *args), recording the request in the metrics (under the name of the Django view it stands
+# in for) if the view answered it
+# the response gets the same CORS headers as the ones Django sends
+async def observed(name, view, scope, send, *args):
+    send = cors_send(scope, send)
+    if not metrics.enabled():
+        return await view(scope, send, *args)
+    status = []
+
+    async def send_observed(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        await send(message)
+
+    start = time.perf_counter()
+    answered = await view(scope, send_observed, *args)
+    if answered:
+        metrics.observe_request(name, scope["method"], status[0] if status else 500, time.perf_counter() - start)
+    return answered
@@ -0,0 +1,107 @@
+import asyncio
+import io
+import json
+
+from corsheaders.middleware import CorsMiddleware
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse
+
+# helpers for the parts of the API that are served as plain ASGI apps next to Django (see mentorq_main.asgi)
+
+
+def header_dict(scope):
+    return {name.decode("latin1").lower(): value.decode("latin1") for name, value in scope["headers"]}
+
+
+# the token of an "Authorization: Bearer <token>" header, None if there is none
+def bearer_token(headers):
+    authorization = headers.get("authorization", "").split()
+    if len(authorization) == 2 and authorization[0] == "Bearer":
+        return authorization[1]
+    return None
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            return body
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+# a receive callable that hands out an already read body again, so that the request can still be passed on
+def replay_body(body, receive):
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+
+# the CORS headers the Django stack adds to a response to the request of scope (corsheaders' CorsMiddleware, with
+# the CORS_* settings), for the responses that are sent without going through Django
+def cors_headers(scope):
+    response = CorsMiddleware().process_response(ASGIRequest(scope, io.BytesIO()), HttpResponse())
+    return [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in response.items()
+            if name.lower().startswith("access-control-") or name.lower() == "vary"]
+
+
+# wraps send so that the response it starts gets the CORS headers (and Origin added to its Vary header)
+def cors_send(scope, send):
+    async def send_with_cors(message):
+        if message["type"] == "http.response.start":
+            headers = list(message.get("headers", []))
+            for name, value in cors_headers(scope):
+                vary = [n for n, (header, _) in enumerate(headers) if header.lower() == b"vary"]
+                if name == b"vary" and vary:
+                    headers[vary[0]] = (b"vary", headers[vary[0]][1] + b", " + value)
+                else:
+                    headers.append((name, value))
+            message = dict(message, headers=headers)
+        await send(message)
+
+    return send_with_cors
+
+
+async def send_json(send, status, data):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"vary", b"Accept")]})
+    await send({"type": "http.response.body", "body": json.dumps(data).encode()})
+
+
+# sends a request to an ASGI app in-process, returning (status, headers, body) of the response
+async def call(application, method, path, headers=(), body=b""):
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"testserver")] + [(name.lower().encode(), value.encode()) for name, value in headers],
+        "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+    }
+    received = asyncio.Event()
+    response = {"headers": [], "body": b""}
+
+    async def receive():
+        if not received.is_set():
+            received.set()
+            return {"type": "http.request", "body": body, "more_body": False}
+        # the client stays connected until the response is complete
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = [(name.decode(), value.decode()) for name, value in message.get("headers", [])]
+        else:
+            response["body"] += message.get("body", b"")
+
+    await application(scope, receive, send)
+    return response["status"], dict(response["headers"]), response["body"]
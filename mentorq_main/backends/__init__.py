@@ -0,0 +1,23 @@
+# database backends that keep their connections in a per-process pool (see mentorq_main.backends.pool)
+# this module is imported by the settings, so it must not import Django
+
+# the pooled backend replacing each of Django's backends
+POOLED_ENGINES = {
+    "django.db.backends.sqlite3": "mentorq_main.backends.sqlite3",
+    "django.db.backends.postgresql": "mentorq_main.backends.postgresql",
+    "django.db.backends.postgresql_psycopg2": "mentorq_main.backends.postgresql",
+}
+
+
+# returns the DATABASES setting with every database that has a pooled backend switched to it
+def pooled_databases(databases, pool_options):
+    pooled = {}
+    for alias, database in databases.items():
+        database = dict(database)
+        if database.get("ENGINE") in POOLED_ENGINES:
+            database["ENGINE"] = POOLED_ENGINES[database["ENGINE"]]
+            database["POOL"] = dict(pool_options, **database.get("POOL", {}))
+            # Django hands the connection back at the end of every request, the pool keeps it open
+            database["CONN_MAX_AGE"] = 0
+        pooled[alias] = database
+    return pooled
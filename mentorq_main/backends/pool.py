@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+# Per-process pools of open database connections, used by the backends in mentorq_main.backends
+# Django closes its connection at the end of every request (CONN_MAX_AGE = 0), the pooled backends hand it back to
+# the pool instead, and the next request (in any thread) takes it again instead of opening a new connection.
+# Pool options, under "POOL" in the database settings:
+# - MAX_CONNECTIONS: open connections per process, at least the number of threads serving requests
+# - IDLE_TIMEOUT: seconds an unused connection stays open
+# - PRE_PING: whether a connection is checked with a round trip before it is reused
+# - TIMEOUT: seconds to wait for a connection when all of them are in use
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+# thread-safe counters of what a pool did
+class PoolStats:
+    FIELDS = ("created", "reused", "closed_idle", "ping_failures", "discarded", "waits", "timeouts")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+
+    def incr(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class ConnectionPool:
+    def __init__(self, max_connections=10, idle_timeout=300, pre_ping=True, timeout=10):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.pre_ping = pre_ping
+        self.timeout = timeout
+        # (connection, released at), the most recently released connection is reused first so that the others can
+        # time out when the load goes down
+        self._idle = deque()
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self.stats = PoolStats()
+
+    # returns an open connection, reusing an idle one or calling connect() for a new one
+    # ping(connection) returns whether a reused connection still works, close(connection) closes one
+    def acquire(self, connect, ping, close):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._condition:
+            while True:
+                expired = self._take_expired()
+                if self._idle:
+                    connection = self._idle.pop()[0]
+                    break
+                if self._in_use + len(self._idle) < self.max_connections:
+                    connection = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats.incr("timeouts")
+                    raise PoolExhausted("All {} database connections are in use".format(self.max_connections))
+                if not waited:
+                    waited = True
+                    self.stats.incr("waits")
+                self._condition.wait(remaining)
+            self._in_use += 1
+        self._close_all(expired, close, "closed_idle")
+
+        if connection is not None:
+            if not self.pre_ping or ping(connection):
+                self.stats.incr("reused")
+                return connection
+            self.stats.incr("ping_failures")
+            self._close_all([connection], close)
+        try:
+            connection = connect()
+        except BaseException:
+            self._checked_in()
+            raise
+        self.stats.incr("created")
+        return connection
+
+    # takes a connection back, reset(connection) makes it ready for the next user and raises if it can't
+    def release(self, connection, reset, close):
+        try:
+            reset(connection)
+        except Exception:
+            return self.discard(connection, close)
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._in_use -= 1
+            self._condition.notify()
+
+    # closes a connection that was taken from the pool instead of taking it back
+    def discard(self, connection, close):
+        self.stats.incr("discarded")
+        self._close_all([connection], close)
+        self._checked_in()
+
+    # closes the idle connections (e.g. before the process forks)
+    def close_idle(self, close):
+        with self._condition:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+        self._close_all(idle, close)
+
+    def snapshot(self):
+        with self._condition:
+            state = {"in_use": self._in_use, "idle": len(self._idle), "max_connections": self.max_connections}
+        return dict(state, **self.stats.snapshot())
+
+    def _checked_in(self):
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify()
+
+    # removes the connections that have been idle for longer than the idle timeout, called with the lock held
+    def _take_expired(self):
+        expired = []
+        now = time.monotonic()
+        while self._idle and now - self._idle[0][1] >= self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def _close_all(self, connections, close, stat=None):
+        for connection in connections:
+            if stat:
+                self.stats.incr(stat)
+            try:
+                close(connection)
+            except Exception:
+                pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+# the connections a forked process inherited from its parent, they belong to the parent and are kept referenced so
+# that they are never closed (and their sessions ended) from the child
+_inherited = []
+
+
+# the pool of the connections with the given parameters
+def get_pool(alias, conn_params, options):
+    global _pools_pid
+    # a test database or a settings change gives the same alias other parameters, and so another pool
+    key = (alias, repr(sorted(conn_params.items(), key=lambda item: item[0])))
+    with _pools_lock:
+        if os.getpid() != _pools_pid:
+            _inherited.extend(_pools.values())
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                max_connections=options.get("MAX_CONNECTIONS", 10), idle_timeout=options.get("IDLE_TIMEOUT", 300),
+                pre_ping=options.get("PRE_PING", True), timeout=options.get("TIMEOUT", 10))
+        return pool
+
+
+# the state and counters of the pools of this process, by database alias
+def pool_stats():
+    with _pools_lock:
+        pools = list(_pools.items())
+    stats = {}
+    for (alias, _), pool in pools:
+        snapshot = pool.snapshot()
+        if alias in stats:
+            snapshot = {field: value + stats[alias][field] for field, value in snapshot.items()}
+        stats[alias] = snapshot
+    return stats
+
+
+# closes the idle connections of every pool
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle(lambda connection: connection.close())
+
+
+# takes the connections of a Django database wrapper from its pool
+# the backend provides ping_connection(connection) and reset_connection(connection)
+class PooledDatabaseWrapperMixin:
+    pool = None
+    # the pool and connection the wrapper has taken
+    checkout = None
+
+    def get_new_connection(self, conn_params):
+        if not self.pooled():
+            return super().get_new_connection(conn_params)
+        self.pool = get_pool(self.alias, conn_params, self.settings_dict.get("POOL", {}))
+        try:
+            connection = self.pool.acquire(
+                lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params),
+                self.ping_connection, self.close_connection)
+        except PoolExhausted as e:
+            raise self.Database.OperationalError(str(e))
+        if self.checkout is None:
+            # Django keeps a connection per thread, a thread that ends without closing its connection would hold on
+            # to it for good, so the connection goes back to the pool (closed) once the wrapper is garbage collected
+            self.checkout = [None, None]
+            weakref.finalize(self, self.return_leaked, self.checkout, self.close_connection)
+        self.checkout[:] = [self.pool, connection]
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        self.checkout[:] = [None, None]
+        with self.wrap_database_errors:
+            if self.in_atomic_block or (self.errors_occurred and not self.is_usable()):
+                # Django keeps using a connection that is closed in an atomic block until the block exits
+                self.pool.discard(self.connection, self.close_connection)
+            else:
+                self.pool.release(self.connection, self.reset_connection, self.close_connection)
+
+    def pooled(self):
+        return True
+
+    @staticmethod
+    def return_leaked(checkout, close):
+        pool, connection = checkout
+        if connection is not None:
+            pool.discard(connection, close)
+
+    @staticmethod
+    def close_connection(connection):
+        connection.close()
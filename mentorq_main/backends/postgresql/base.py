@@ -0,0 +1,28 @@
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from mentorq_main.backends.pool import PooledDatabaseWrapperMixin
+
+
+# PostgreSQL (psycopg2) with pooled connections
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    @staticmethod
+    def ping_connection(connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            # the ping opens a transaction when the connection isn't in autocommit mode
+            DatabaseWrapper.reset_connection(connection)
+        except base.Database.Error:
+            return False
+        return True
+
+    # a connection goes back to the pool outside of a transaction, one that is broken is closed instead
+    @staticmethod
+    def reset_connection(connection):
+        if connection.closed:
+            raise base.Database.InterfaceError("connection already closed")
+        if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
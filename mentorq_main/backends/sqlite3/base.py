@@ -0,0 +1,23 @@
+from django.db.backends.sqlite3 import base
+
+from mentorq_main.backends.pool import PooledDatabaseWrapperMixin
+
+
+# SQLite with pooled connections, a stand-in for the PostgreSQL pool in development and tests
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    # Django never closes connections to in-memory databases (e.g. the test database), they don't go through the pool
+    def pooled(self):
+        return not self.is_in_memory_db()
+
+    @staticmethod
+    def ping_connection(connection):
+        try:
+            connection.execute("SELECT 1").close()
+        except base.Database.Error:
+            return False
+        return True
+
+    @staticmethod
+    def reset_connection(connection):
+        if connection.in_transaction:
+            connection.rollback()
@@ -0,0 +1,224 @@
+import functools
+import hmac
+import os
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+from mentorq_main.backends.pool import pool_stats
+
+# Prometheus metrics, served at /metrics when MENTORQ_METRICS is set
+# With several worker processes (gunicorn), prometheus_client keeps the values in files in the directory named by the
+# prometheus_multiproc_dir environment variable, and whichever worker is scraped adds up the files of all of them
+# (gunicorn.conf.py sets it up). With a single process the values are kept in memory.
+# prometheus_client is only imported once a metric is recorded or served, so that it isn't loaded when
+# MENTORQ_METRICS isn't set.
+
+DB_QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+
+# the metrics recorded by this process
+class Metrics:
+    def __init__(self):
+        from prometheus_client import Counter, Histogram
+
+        self.request_latency = Histogram("mentorq_request_duration_seconds", "Time spent serving a request",
+                                         ["view", "method", "status"])
+        self.request_db_queries = Histogram("mentorq_request_db_queries", "SQL queries made by a request",
+                                            ["view", "method"], buckets=DB_QUERY_BUCKETS)
+        self.db_queries = Counter("mentorq_db_queries_total", "SQL queries made", ["view"])
+        self.lcs_latency = Histogram("mentorq_lcs_request_duration_seconds", "Time spent calling LCS", ["endpoint"])
+        self.lcs_errors = Counter("mentorq_lcs_errors_total", "LCS calls that failed", ["endpoint", "kind"])
+        self.lcs_retries = Counter("mentorq_lcs_retries_total", "LCS calls that were retried", ["endpoint"])
+        self.lcs_breaker_opens = Counter("mentorq_lcs_breaker_opens_total", "Times the LCS circuit breaker opened")
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+# the metrics of the process, registered with prometheus_client on first use
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+    return _metrics
+
+
+def enabled():
+    return getattr(settings, "MENTORQ_METRICS", False)
+
+
+# the label of the view a request was routed to, e.g. ticket-list or mentorq_token_obtain_pair
+def view_label(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else "unmatched"
+
+
+# records a request, queries is the number of SQL queries it made (None if they weren't counted)
+def observe_request(view, method, status, seconds, queries=None):
+    metrics = get_metrics()
+    metrics.request_latency.labels(view, method, str(status)).observe(seconds)
+    if queries is not None:
+        metrics.request_db_queries.labels(view, method).observe(queries)
+        if queries:
+            metrics.db_queries.labels(view).inc(queries)
+
+
+# records a call to LCS, error is the kind of failure (timeout, connection, unavailable or server_error) if any
+def observe_lcs(endpoint, seconds, error=None):
+    if not enabled():
+        return
+    metrics = get_metrics()
+    metrics.lcs_latency.labels(endpoint).observe(seconds)
+    if error:
+        metrics.lcs_errors.labels(endpoint, error).inc()
+
+
+def count_lcs_retry(endpoint):
+    if enabled():
+        get_metrics().lcs_retries.labels(endpoint).inc()
+
+
+def count_lcs_breaker_open():
+    if enabled():
+        get_metrics().lcs_breaker_opens.inc()
+
+
+# the kind of failure of an LCS call that raised error or answered with status_code (and the statusCode in body)
+def lcs_error_kind(error=None, status_code=200, content=b""):
+    # (imported here since mentorq_user.lcs_transport imports this module)
+    from mentorq_user.lcs_transport import LCSUnavailable, SERVER_ERROR_BODY
+
+    if isinstance(error, LCSUnavailable):
+        return "unavailable"
+    if isinstance(error, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "connection"
+    if error is not None:
+        return "error"
+    if status_code >= 500 or SERVER_ERROR_BODY.match(content[:64]):
+        return "server_error"
+    return None
+
+
+# wraps an lcs_client compatible post/get function so that its calls are measured
+def instrument_lcs(function):
+    @functools.wraps(function)
+    def wrapper(endpoint, *args, **kwargs):
+        if not enabled():
+            return function(endpoint, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            response = function(endpoint, *args, **kwargs)
+        except Exception as e:
+            observe_lcs(endpoint, time.perf_counter() - start, lcs_error_kind(e))
+            raise
+        observe_lcs(endpoint, time.perf_counter() - start,
+                    lcs_error_kind(status_code=response.status_code, content=response.content))
+        return response
+
+    return wrapper
+
+
+# records the latency and the number of SQL queries of every request
+# only installed when MENTORQ_METRICS is set
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0]
+        start = time.perf_counter()
+        try:
+            with connections["default"].execute_wrapper(functools.partial(self.count_query, queries)):
+                response = self.get_response(request)
+        except Exception:
+            observe_request(view_label(request), request.method, 500, time.perf_counter() - start, queries[0])
+            raise
+        observe_request(view_label(request), request.method, response.status_code, time.perf_counter() - start,
+                        queries[0])
+        return response
+
+    @staticmethod
+    def count_query(queries, execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+
+# reads the current number of tickets in each active status from the rollup when scraped
+class TicketCollector:
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+
+        from mentorq_api.models import Ticket, TicketStats
+
+        stats = TicketStats.load()
+        gauge = GaugeMetricFamily("mentorq_tickets", "Tickets by status", labels=["status"])
+        gauge.add_metric([Ticket.StatusType.OPEN.value], stats.open_tickets)
+        gauge.add_metric([Ticket.StatusType.CLAIMED.value], stats.claimed_tickets)
+        yield gauge
+
+
+# reads the state and counters of the database connection pools (see MENTORQ_DB_POOL) when scraped
+# the pools belong to each process, so the series are labelled with the process that was scraped
+class PoolCollector:
+    GAUGES = (("in_use", "Pooled database connections in use"),
+              ("idle", "Pooled database connections open and idle"))
+    COUNTERS = (("waits", "Connection requests that waited for a pooled connection"),
+                ("timeouts", "Connection requests that found every pooled connection in use"),
+                ("ping_failures", "Pooled connections that failed their check before reuse"))
+
+    def collect(self):
+        from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+        stats = pool_stats()
+        pid = str(os.getpid())
+        for field, documentation in self.GAUGES:
+            gauge = GaugeMetricFamily("mentorq_db_pool_" + field, documentation, labels=["alias", "pid"])
+            for alias, snapshot in stats.items():
+                gauge.add_metric([alias, pid], snapshot[field])
+            yield gauge
+        for field, documentation in self.COUNTERS:
+            counter = CounterMetricFamily("mentorq_db_pool_" + field, documentation, labels=["alias", "pid"])
+            for alias, snapshot in stats.items():
+                counter.add_metric([alias, pid], snapshot[field])
+            yield counter
+
+
+def registry():
+    from prometheus_client import CollectorRegistry, REGISTRY, multiprocess
+
+    if "prometheus_multiproc_dir" in os.environ:
+        collected = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collected)
+        return collected
+    return REGISTRY
+
+
+# the /metrics endpoint, requests must carry MENTORQ_METRICS_TOKEN as a bearer token if it is set
+def metrics_view(request):
+    if not enabled():
+        raise Http404()
+    token = getattr(settings, "MENTORQ_METRICS_TOKEN", None)
+    if token and not hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", ""), "Bearer " + token):
+        return HttpResponse(status=401)
+    from prometheus_client import CollectorRegistry, generate_latest
+    from prometheus_client.exposition import CONTENT_TYPE_LATEST
+
+    # (the metrics of the process are registered even if none were recorded yet)
+    get_metrics()
+    scraped = CollectorRegistry(auto_describe=True)
+    scraped.register(TicketCollector())
+    scraped.register(PoolCollector())
+    return HttpResponse(generate_latest(registry()) + generate_latest(scraped), content_type=CONTENT_TYPE_LATEST)
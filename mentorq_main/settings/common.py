@@ -18,8 +18,16 @@ INSTALLED_APPS = [
     'mentorq_user.apps.MentorqUserConfig',
     'corsheaders',
 ]
+# if MENTORQ_DISABLE_ADMIN is set, the admin (and its imports) is left out, e.g. for API-only workers
+MENTORQ_DISABLE_ADMIN = bool(os.getenv("MENTORQ_DISABLE_ADMIN"))
+if MENTORQ_DISABLE_ADMIN:
+    INSTALLED_APPS.remove('django.contrib.admin')
 
 MIDDLEWARE = [
+    # first, so that it times everything else (only installed when MENTORQ_SERVER_TIMING is set)
+    'mentorq_main.timing.ServerTimingMiddleware',
+    # (only installed when MENTORQ_METRICS is set)
+    'mentorq_main.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -31,6 +39,25 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# if MENTORQ_SERVER_TIMING is set, responses get a Server-Timing header with the time spent in the database, LCS and
+# serialization, and every request is logged with the same timings
+MENTORQ_SERVER_TIMING = bool(os.getenv("MENTORQ_SERVER_TIMING"))
+# requests slower than this are logged as warnings, and this fraction of them with the queries they made
+MENTORQ_SLOW_REQUEST_MS = int(os.getenv("MENTORQ_SLOW_REQUEST_MS", 500))
+MENTORQ_SLOW_REQUEST_SAMPLE_RATE = float(os.getenv("MENTORQ_SLOW_REQUEST_SAMPLE_RATE", 1))
+
+# if MENTORQ_METRICS is set, request, database and LCS metrics are collected and served in the Prometheus format at
+# /metrics, to requests with MENTORQ_METRICS_TOKEN as a bearer token if it is set
+MENTORQ_METRICS = bool(os.getenv("MENTORQ_METRICS"))
+MENTORQ_METRICS_TOKEN = os.getenv("MENTORQ_METRICS_TOKEN")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {"mentorq": {"handlers": ["console"], "level": os.getenv("MENTORQ_LOG_LEVEL", "INFO")}},
+}
+
 ROOT_URLCONF = 'mentorq_main.urls'
 
 TEMPLATES = [
@@ -58,6 +85,38 @@ DATABASES = {
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
+# a local PostgreSQL database is used instead when POSTGRES_DB is set
+if os.getenv("POSTGRES_DB"):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.getenv("POSTGRES_DB"),
+        'USER': os.getenv("POSTGRES_USER", ""),
+        'PASSWORD': os.getenv("POSTGRES_PASSWORD", ""),
+        'HOST': os.getenv("POSTGRES_HOST", "localhost"),
+        'PORT': os.getenv("POSTGRES_PORT", "5432"),
+    }
+
+# the threads of each worker process that run the synchronous work: Django's views and the database calls of the async
+# endpoints on the ASGI entrypoint (see mentorq_main.asgi), the request threads of sync gunicorn workers
+WORKER_THREADS = int(os.getenv("GUNICORN_THREADS", 8))
+
+# if MENTORQ_DB_POOL is set, the database connections of each process are kept open in a pool and reused by the
+# following requests (see mentorq_main.backends.pool)
+MENTORQ_DB_POOL = bool(os.getenv("MENTORQ_DB_POOL"))
+DB_POOL_OPTIONS = {
+    # per process, by default the threads of a worker plus a couple for management work
+    'MAX_CONNECTIONS': int(os.getenv("DB_POOL_MAX_CONNECTIONS", WORKER_THREADS + 2)),
+    # seconds an unused connection stays open
+    'IDLE_TIMEOUT': float(os.getenv("DB_POOL_IDLE_TIMEOUT", 300)),
+    # connections are checked with a round trip before they are reused, unless DB_POOL_PRE_PING=0
+    'PRE_PING': os.getenv("DB_POOL_PRE_PING", "1") != "0",
+    # seconds a request waits for a connection when all of them are in use
+    'TIMEOUT': float(os.getenv("DB_POOL_TIMEOUT", 10)),
+}
+if MENTORQ_DB_POOL:
+    from mentorq_main.backends import pooled_databases
+
+    DATABASES = pooled_databases(DATABASES, DB_POOL_OPTIONS)
 
 # custom authentication backend for Mentorq
 AUTHENTICATION_BACKENDS = ["mentorq_user.backends.MentorqUserBackend", "django.contrib.auth.backends.ModelBackend"]
@@ -80,6 +139,10 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# if MENTORQ_STATELESS_AUTH is set, JWT requests are authorized from the role claims in the token
+# instead of looking the user up in the database and fetching their profile from LCS
+MENTORQ_STATELESS_AUTH = bool(os.getenv("MENTORQ_STATELESS_AUTH"))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -87,9 +150,76 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication'
+        'mentorq_user.authentication.MentorqStatelessJWTAuthentication' if MENTORQ_STATELESS_AUTH
+        else 'rest_framework_simplejwt.authentication.JWTAuthentication'
     ),
+    # the JSON renderer times the rendering of responses (see mentorq_main.timing)
+    'DEFAULT_RENDERER_CLASSES': (
+        'mentorq_main.timing.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    # list endpoints are only paginated when a request asks for it with ?page_size= or ?cursor=
+    'DEFAULT_PAGINATION_CLASS': 'mentorq_api.pagination.KeysetCursorPagination',
+    'PAGE_SIZE': int(os.getenv("MENTORQ_PAGE_SIZE", 100)),
 }
+# ticket event stream (see mentorq_api.sse)
+# the pub/sub events are published to, the default reaches the clients of every process through the change sequence,
+# mentorq_api.events.InProcessBroker only reaches the clients connected to the same process
+MENTORQ_EVENT_BROKER = os.getenv("MENTORQ_EVENT_BROKER", "mentorq_api.sse.ChangeFeedBroker")
+# seconds between the reads of the change sequence of each process with clients, for the changes other processes made
+MENTORQ_EVENT_POLL_INTERVAL = float(os.getenv("MENTORQ_EVENT_POLL_INTERVAL", 1))
+# seconds between keepalives on idle streams
+MENTORQ_EVENT_KEEPALIVE = float(os.getenv("MENTORQ_EVENT_KEEPALIVE", 15))
+# events held for a slow client before its stream is closed (it then resumes from its Last-Event-ID)
+MENTORQ_EVENT_QUEUE_SIZE = int(os.getenv("MENTORQ_EVENT_QUEUE_SIZE", 100))
+# changes replayed to a resuming client before it is told to reload the ticket list instead
+MENTORQ_EVENT_REPLAY_LIMIT = int(os.getenv("MENTORQ_EVENT_REPLAY_LIMIT", 1000))
+
+# ticket archive (see mentorq_api.archive)
+# closed, cancelled and inactive tickets are archived once they finished this many hours ago
+MENTORQ_ARCHIVE_AFTER_HOURS = float(os.getenv("MENTORQ_ARCHIVE_AFTER_HOURS", 48))
+# tickets moved per transaction
+MENTORQ_ARCHIVE_BATCH_SIZE = int(os.getenv("MENTORQ_ARCHIVE_BATCH_SIZE", 500))
+
+# LCS profile cache (values are in seconds)
+# profiles younger than the TTL are served from the cache, profiles within the stale window are served while
+# being refreshed in the background
+LCS_PROFILE_CACHE_ALIAS = os.getenv("LCS_PROFILE_CACHE_ALIAS", "default")
+LCS_PROFILE_CACHE_TTL = int(os.getenv("LCS_PROFILE_CACHE_TTL", 60))
+LCS_PROFILE_CACHE_STALE_TTL = int(os.getenv("LCS_PROFILE_CACHE_STALE_TTL", 240))
+# profiles are kept for this much longer and only served while LCS can't be reached
+LCS_PROFILE_CACHE_OUTAGE_TTL = int(os.getenv("LCS_PROFILE_CACHE_OUTAGE_TTL", 3600))
+# Slack DM links are cached per pair of users (in the same cache), errors LCS answers for a pair for a shorter time
+LCS_DM_LINK_CACHE_TTL = int(os.getenv("LCS_DM_LINK_CACHE_TTL", 3600))
+LCS_DM_LINK_CACHE_ERROR_TTL = int(os.getenv("LCS_DM_LINK_CACHE_ERROR_TTL", 15))
+
+# LCS deployment used by lcs_client, defaults to https://api.hackru.org
+LCS_ROOT_URL = os.getenv("LCS_ROOT_URL")
+# the transport lcs_client calls go through (see mentorq_user.lcs_transport)
+# connections kept open to LCS per process, and seconds to wait for a connection and for an answer
+LCS_POOL_SIZE = int(os.getenv("LCS_POOL_SIZE", 10))
+LCS_CONNECT_TIMEOUT = float(os.getenv("LCS_CONNECT_TIMEOUT", 2))
+LCS_READ_TIMEOUT = float(os.getenv("LCS_READ_TIMEOUT", 5))
+# retries of calls that got no answer, after a random delay of up to LCS_RETRY_BACKOFF seconds, doubled for every
+# retry up to LCS_RETRY_BACKOFF_MAX
+LCS_RETRIES = int(os.getenv("LCS_RETRIES", 2))
+LCS_RETRY_BACKOFF = float(os.getenv("LCS_RETRY_BACKOFF", 0.1))
+LCS_RETRY_BACKOFF_MAX = float(os.getenv("LCS_RETRY_BACKOFF_MAX", 1))
+# failed calls in a row after which calls fail right away, and seconds until LCS is tried again
+LCS_BREAKER_THRESHOLD = int(os.getenv("LCS_BREAKER_THRESHOLD", 5))
+LCS_BREAKER_RESET = float(os.getenv("LCS_BREAKER_RESET", 30))
+# seconds the ASGI entrypoint waits for LCS before giving up (see mentorq_user.lcs_async)
+LCS_ASYNC_TIMEOUT = float(os.getenv("LCS_ASYNC_TIMEOUT", 10))
+# if LCS_FAKE is set, lcs_client calls are answered in-process by mentorq_user.fake_lcs instead of LCS
+LCS_FAKE = bool(os.getenv("LCS_FAKE"))
+# optional JSON file with the fake users, see mentorq_user.fake_lcs.DEFAULT_FIXTURES for the format
+LCS_FAKE_FIXTURES = os.getenv("LCS_FAKE_FIXTURES")
+# seconds added to every fake LCS call (plus up to LCS_FAKE_JITTER extra seconds)
+LCS_FAKE_LATENCY = float(os.getenv("LCS_FAKE_LATENCY", 0))
+LCS_FAKE_JITTER = float(os.getenv("LCS_FAKE_JITTER", 0))
+# fraction of fake LCS calls that fail with an internal server error
+LCS_FAKE_ERROR_RATE = float(os.getenv("LCS_FAKE_ERROR_RATE", 0))
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 
@@ -4,3 +4,9 @@ import django_heroku
 DEBUG = False
 
 django_heroku.settings(locals())
+
+# django_heroku configures the database from DATABASE_URL
+if MENTORQ_DB_POOL:
+    from mentorq_main.backends import pooled_databases
+
+    DATABASES = pooled_databases(DATABASES, DB_POOL_OPTIONS)
@@ -0,0 +1,143 @@
+import contextvars
+import functools
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.renderers import JSONRenderer
+
+# Per-request timings, sent back in a Server-Timing header and logged (see ServerTimingMiddleware)
+# - db: SQL queries, timed by a database execute wrapper
+# - lcs: lcs_client calls, timed by the transport installed with mentorq_user.lcs.install_transport
+# - serialize: building the response data in the views (see timed) and rendering it to JSON (see TimedJSONRenderer)
+# - total: the whole request, from the first middleware on
+
+logger = logging.getLogger("mentorq.timing")
+
+# the timings of the request being handled, None when they aren't recorded
+_current = contextvars.ContextVar("mentorq_request_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.start = time.perf_counter()
+        # name: [count, seconds]
+        self.durations = {}
+        self.queries = []
+
+    def add(self, name, seconds):
+        entry = self.durations.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def count(self, name):
+        return self.durations.get(name, (0, 0.0))[0]
+
+    def milliseconds(self, name):
+        return self.durations.get(name, (0, 0.0))[1] * 1000
+
+
+# times the block, adding its duration to the given name in the timings of the current request (if recorded)
+class timed:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = _current.get()
+        if self.timings is not None:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.name, time.perf_counter() - self.start)
+
+
+# wraps function so that its calls are timed under the given name
+def timed_function(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return function(*args, **kwargs)
+        with timed(name):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+# the JSON renderer of the API (DEFAULT_RENDERER_CLASSES), adds the time spent rendering responses to serialize
+class TimedJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timed("serialize"):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+# adds a Server-Timing header with the time spent in the database, LCS and serialization to every response, and logs
+# a line with the same timings
+# requests slower than MENTORQ_SLOW_REQUEST_MS are logged as warnings, a sample of them (MENTORQ_SLOW_REQUEST_SAMPLE_RATE)
+# with every query they made
+# only installed when MENTORQ_SERVER_TIMING is set, otherwise Django leaves it out of the middleware chain
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, "MENTORQ_SERVER_TIMING", False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.slow_seconds = getattr(settings, "MENTORQ_SLOW_REQUEST_MS", 500) / 1000
+        self.sample_rate = getattr(settings, "MENTORQ_SLOW_REQUEST_SAMPLE_RATE", 1.0)
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(functools.partial(self.time_query, timings)))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - timings.start
+        response["Server-Timing"] = self.header(timings, total)
+        self.log(request, response, timings, total)
+        return response
+
+    @staticmethod
+    def time_query(timings, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            timings.add("db", seconds)
+            timings.queries.append((sql, seconds))
+
+    @staticmethod
+    def header(timings, total):
+        metrics = ['total;dur={:.1f}'.format(total * 1000),
+                   'db;dur={:.1f};desc="{} queries"'.format(timings.milliseconds("db"), timings.count("db")),
+                   'lcs;dur={:.1f};desc="{} calls"'.format(timings.milliseconds("lcs"), timings.count("lcs")),
+                   'serialize;dur={:.1f}'.format(timings.milliseconds("serialize"))]
+        return ", ".join(metrics)
+
+    def log(self, request, response, timings, total):
+        line = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 1),
+            "db_ms": round(timings.milliseconds("db"), 1),
+            "db_queries": timings.count("db"),
+            "lcs_ms": round(timings.milliseconds("lcs"), 1),
+            "lcs_calls": timings.count("lcs"),
+            "serialize_ms": round(timings.milliseconds("serialize"), 1),
+        }
+        if total < self.slow_seconds:
+            logger.info(json.dumps(line))
+            return
+        line["slow"] = True
+        if random.random() < self.sample_rate:
+            line["queries"] = [{"sql": sql, "ms": round(seconds * 1000, 2)} for sql, seconds in timings.queries]
+        logger.warning(json.dumps(line))
@@ -1,16 +1,16 @@
-import os
-
-from django.contrib import admin
+from django.apps import apps
 from django.urls import path, include
-from lcs_client import set_testing
+
+from mentorq_main.metrics import metrics_view
 
 urlpatterns = [
     path('api/', include('mentorq_api.urls')),
-    path('admin/', admin.site.urls),
+    # Prometheus metrics, a 404 unless MENTORQ_METRICS is set
+    path('metrics', metrics_view, name='metrics'),
 ]
 
-# if the environment var LCS_DEV is set, it will use the dev lcs endpoint
-# doesn't matter what the actual value is, it just has to be set
-if os.getenv("LCS_DEV"):
-    set_testing(True)
-    print("Set testing mode successfully")
+# the admin can be left out of deployments that don't use it (see MENTORQ_DISABLE_ADMIN)
+if apps.is_installed('django.contrib.admin'):
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))
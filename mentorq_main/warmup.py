@@ -0,0 +1,46 @@
+from django.db import connections
+
+# the requests the API gets most, resolving them loads the URLconf and imports every view
+WARMUP_PATHS = (
+    "/api/tickets/",
+    "/api/tickets/1/",
+    "/api/tickets/stats/",
+    "/api/feedback/",
+    "/api/feedback/leaderboard/",
+    "/api/auth/token/",
+)
+# the URLs the serializers link to, reversing them builds the reverse lookup tables
+WARMUP_URL_NAMES = ("ticket-list", "ticket-detail", "feedback-detail")
+
+
+# does the one-off work the first request of a process would otherwise pay for: loading the URLconf and the views,
+# building the reverse URL lookups, building the serializer fields (which fills the model metadata caches) and loading the translations
+# run before gunicorn forks its workers, so nothing here may touch the database (see gunicorn.conf.py)
+def warm_up():
+    from django.urls import get_resolver, reverse
+    from django.utils import translation
+    from rest_framework.settings import api_settings
+
+    from mentorq_api.serializers import (TicketSerializer, TicketEditableSerializer, FeedbackSerializer,
+                                         FeedbackEditableSerializer)
+    from mentorq_user.serializers import MentorqTokenObtainPairSerializer
+
+    resolver = get_resolver()
+    for path in WARMUP_PATHS:
+        resolver.resolve(path)
+    for name in WARMUP_URL_NAMES:
+        reverse(name, kwargs={"pk": 1} if name.endswith("-detail") else None)
+    for serializer_class in (TicketSerializer, TicketEditableSerializer, FeedbackSerializer,
+                             FeedbackEditableSerializer, MentorqTokenObtainPairSerializer):
+        serializer_class().fields
+    # the settings are imported on first access
+    for setting in ("DEFAULT_AUTHENTICATION_CLASSES", "DEFAULT_PERMISSION_CLASSES", "DEFAULT_RENDERER_CLASSES",
+                    "DEFAULT_PARSER_CLASSES", "DEFAULT_PAGINATION_CLASS", "DEFAULT_CONTENT_NEGOTIATION_CLASS"):
+        getattr(api_settings, setting)
+    translation.gettext("Invalid credentials provided. Error: ")
+
+
+# opens the database connections of a process ahead of its first request
+def connect():
+    for connection in connections.all():
+        connection.ensure_connection()
@@ -0,0 +1,8 @@
+from uvicorn.workers import UvicornWorker as BaseUvicornWorker
+
+
+# gunicorn worker serving mentorq_main.asgi:application with uvicorn (see gunicorn.conf.py)
+# uvicorn's own worker requires uvloop and httptools, this one uses them when they are installed and the asyncio loop
+# and h11 otherwise
+class UvicornWorker(BaseUvicornWorker):
+    CONFIG_KWARGS = {"loop": "auto", "http": "auto"}
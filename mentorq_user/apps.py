@@ -1,5 +1,30 @@
+import logging
+import os
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class MentorqUserConfig(AppConfig):
     name = 'mentorq_user'
+
+    def ready(self):
+        import lcs_client
+
+        # if the environment var LCS_DEV is set, it will use the dev lcs endpoint
+        # doesn't matter what the actual value is, it just has to be set
+        # (set here rather than in the URLconf, which is only loaded by the first request)
+        if os.getenv("LCS_DEV"):
+            lcs_client.set_testing(True)
+            logging.getLogger(__name__).info("Set testing mode successfully")
+        # points lcs_client at another LCS deployment (e.g. a server started with `manage.py runfakelcs`)
+        if settings.LCS_ROOT_URL:
+            lcs_client.set_root_url(settings.LCS_ROOT_URL)
+        # answers every lcs_client call with an in-process fake LCS instead of the real service, or else sends them
+        # through the pooled transport with timeouts, retries and a circuit breaker
+        if settings.LCS_FAKE:
+            from mentorq_user import fake_lcs
+            fake_lcs.from_settings().install()
+        else:
+            from mentorq_user.lcs import reset_transport
+            reset_transport()
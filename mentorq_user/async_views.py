@@ -0,0 +1,98 @@
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils.translation import ugettext_lazy as _
+from lcs_client import InternalServerError, RequestError, CredentialError
+from rest_framework import serializers
+
+from mentorq_main.asgi_utils import header_dict, send_json
+from mentorq_user import lcs_async
+from mentorq_user.backends import MentorqUserBackend
+from mentorq_user.lcs import profile_cache
+from mentorq_user.lcs_transport import lcs_unavailable
+from mentorq_user.serializers import MentorqTokenObtainPairSerializer
+
+TOKEN_PATH = "/api/auth/token/"
+
+
+# the email and lcs token of a token request, None if the body isn't one this view handles
+def credentials(scope, body):
+    content_type = header_dict(scope).get("content-type", "").split(";")[0].strip()
+    try:
+        if content_type == "application/json":
+            data = json.loads(body.decode())
+        elif content_type == "application/x-www-form-urlencoded":
+            data = {key: values[-1] for key, values in parse_qs(body.decode()).items()}
+        else:
+            return None
+        email = serializers.EmailField().run_validation(data.get("email"))
+        lcs_token = serializers.CharField().run_validation(data.get("lcs_token"))
+    except (ValueError, AttributeError, serializers.ValidationError):
+        return None
+    return email, lcs_token
+
+
+# the user logging in (created or given the new token as needed) and their cached profile, None if it has to be
+# fetched
+def login_user(email, lcs_token):
+    try:
+        return MentorqUserBackend.get_or_update_user(email, lcs_token), profile_cache.peek(email, lcs_token)
+    finally:
+        # the thread this runs in is reused for other work
+        close_old_connections()
+
+
+def issue_tokens(user, profile, store=True):
+    if store:
+        profile_cache.set(user.email, user.lcs_token, profile)
+    else:
+        user.lcs_profile = profile
+    # the tokens are built from the profile just cached
+    refresh = MentorqTokenObtainPairSerializer.get_token(user)
+    return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+
+# ASGI version of MentorqTokenObtainPairView: the calls to LCS are made without holding a thread, only the user lookup
+# and the signing of the tokens run in one
+# returns False for requests it leaves to Django (bodies that aren't well formed JSON or form data with an email and
+# a token), which answers them with the same errors as before
+async def obtain_token(scope, send, body):
+    credentials_given = credentials(scope, body)
+    if credentials_given is None:
+        return False
+    email, lcs_token = credentials_given
+    # the cached profile of credentials LCS has recently validated, used while LCS can't be reached
+    outage_profile = None
+    try:
+        await lcs_async.validate_token(lcs_token)
+    except (InternalServerError, RequestError, CredentialError) as e:
+        msg = _("Invalid credentials provided. Error: ")
+        return await unauthorized(send, str(msg) + e.response.json()["body"])
+    except Exception as e:
+        if lcs_unavailable(e):
+            outage_profile = await sync_to_async(profile_cache.fallback)(email, lcs_token)
+        if outage_profile is None:
+            return await unauthorized(send, str(_("There was an authentication error. Please try again later")))
+
+    user, profile = await sync_to_async(login_user)(email, lcs_token)
+    # (an outage profile isn't cached again, so that it expires on time)
+    if profile is None and outage_profile is not None:
+        await send_json(send, 200, await sync_to_async(issue_tokens)(user, outage_profile, False))
+        return True
+    if profile is None:
+        try:
+            profile = await lcs_async.get_profile(lcs_token, email)
+        except (InternalServerError, RequestError, CredentialError) as e:
+            msg = "The following error occurred during authentication: " + e.response.json()["body"]
+            return await unauthorized(send, str(_(msg)))
+        except Exception:
+            return await unauthorized(send, str(_("There was an authentication error. Please try again later")))
+    await send_json(send, 200, await sync_to_async(issue_tokens)(user, profile))
+    return True
+
+
+async def unauthorized(send, detail):
+    await send_json(send, 401, {"detail": detail})
+    return True
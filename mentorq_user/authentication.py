@@ -0,0 +1,50 @@
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+from mentorq_user.models import MentorqUser
+
+
+# lightweight user that is built entirely from the claims of a signed Mentorq JWT
+# the roles are the ones LCS reported when the token was issued, so a role change in LCS
+# only takes effect once the user obtains a new token
+class MentorqTokenUser(TokenUser):
+    def __str__(self):
+        return self.email
+
+    @cached_property
+    def email(self):
+        return self.token["email"]
+
+    @cached_property
+    def name(self):
+        return self.token.get("name", "")
+
+    # the subset of the LCS profile that Mentorq uses for authorization
+    @cached_property
+    def lcs_profile(self):
+        return {
+            "email": self.email,
+            "role": {
+                "director": self.token["director"],
+                "mentor": self.token["mentor"],
+                "organizer": self.token["organizer"],
+            },
+        }
+
+    # operations that really need LCS (e.g. slack DMs) load the stored LCS token on demand
+    @cached_property
+    def lcs_user(self):
+        return MentorqUser.objects.get(pk=self.id).lcs_user
+
+
+# JWT authentication that authorizes requests from the token claims alone, without a database lookup of the user
+class MentorqStatelessJWTAuthentication(JWTAuthentication):
+    # the claims that must be present for a token to be used statelessly
+    REQUIRED_CLAIMS = ("email", "director", "mentor", "organizer")
+
+    def get_user(self, validated_token):
+        # tokens issued before these claims were added still go through the database
+        if not all(claim in validated_token for claim in self.REQUIRED_CLAIMS):
+            return super().get_user(validated_token)
+        return MentorqTokenUser(validated_token)
@@ -1,7 +1,11 @@
+import requests
+from django.db import transaction
 from django.utils.translation import ugettext_lazy as _
 from lcs_client import validate_token, RequestError, CredentialError, InternalServerError
 from rest_framework import exceptions
 
+from mentorq_user.lcs import profile_cache
+from mentorq_user.lcs_transport import lcs_unavailable
 from mentorq_user.models import MentorqUser
 
 
@@ -18,14 +22,31 @@ class MentorqUserBackend:
         except (InternalServerError, RequestError, CredentialError) as e:
             msg = _("Invalid credentials provided. Error: ")
             raise exceptions.AuthenticationFailed(msg + e.response.json()["body"])
+        except requests.exceptions.RequestException as e:
+            # while LCS can't be reached, credentials it has recently validated (whose profile is still cached)
+            # are accepted
+            if not lcs_unavailable(e) or profile_cache.fallback(email, lcs_token) is None:
+                msg = _("There was an authentication error. Please try again later")
+                raise exceptions.AuthenticationFailed(msg)
         except:
             msg = _("There was an authentication error. Please try again later")
             raise exceptions.AuthenticationFailed(msg)
 
         # if there is no error, a Mentorq user is fetched (to be used for JWT)
-        user, created = MentorqUser.objects.update_or_create(email=email, defaults={'lcs_token': lcs_token})
+        return self.get_or_update_user(email, lcs_token)
 
-        # finally, the associated user is returned
+    # returns the Mentorq user with the given email once its LCS token has been validated, creating the user or
+    # storing the new token as needed
+    @staticmethod
+    def get_or_update_user(email, lcs_token):
+        with transaction.atomic():
+            user, created = MentorqUser.objects.select_for_update().get_or_create(
+                email=email, defaults={'lcs_token': lcs_token})
+            # a new token means the profile cached for the old one must not be served anymore
+            if not created and user.lcs_token != lcs_token:
+                profile_cache.invalidate(user.email, user.lcs_token)
+                user.lcs_token = lcs_token
+                user.save(update_fields=["lcs_token"])
         return user
 
     # method responsible for getting the user given a user id
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.conf import settings
+
+from mentorq_user.lcs import install_transport, reset_transport
+from mentorq_user.lcs_async import install_async_transport, reset_async_transport
+
+ROLES = ("hacker", "volunteer", "judge", "sponsor", "mentor", "organizer", "director")
+
+
+# builds an LCS-style profile for a fixture user with the given roles
+def make_profile(email, first_name, last_name="", roles=("hacker",)):
+    return {
+        "email": email,
+        "first_name": first_name,
+        "last_name": last_name,
+        "role": {role: role in roles for role in ROLES},
+    }
+
+
+# the users every FakeLCS knows about unless other fixtures are given
+DEFAULT_FIXTURES = [
+    {"password": "hacker", "token": "hacker-token",
+     "profile": make_profile("hacker@example.com", "Hacker")},
+    {"password": "mentor", "token": "mentor-token",
+     "profile": make_profile("mentor@example.com", "Mentor", "Person", roles=("mentor",))},
+    {"password": "organizer", "token": "organizer-token",
+     "profile": make_profile("organizer@example.com", "Organizer", roles=("organizer",))},
+    {"password": "director", "token": "director-token",
+     "profile": make_profile("director@example.com", "Director", roles=("organizer", "director"))},
+]
+
+
+# in-process stand-in for the parts of LCS that lcs_client uses (/authorize, /validate, /read and /slack-dm)
+# latency (plus up to jitter extra seconds) is added to every call and error_rate of the calls fail with a 500
+class FakeLCS:
+    def __init__(self, fixtures=None, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._users = {}
+        self._tokens = {}
+        self.calls = {}
+        for fixture in DEFAULT_FIXTURES if fixtures is None else fixtures:
+            self.add_user(fixture["profile"], password=fixture.get("password"), token=fixture.get("token"))
+
+    # registers a user, returning the LCS token they are logged in with
+    def add_user(self, profile, password=None, token=None):
+        token = token or secrets.token_hex(16)
+        with self._lock:
+            self._users[profile["email"]] = {"profile": profile, "password": password}
+            self._tokens[token] = profile["email"]
+        return token
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = {}
+
+    # handles a call to endpoint with a json payload, returning the (statusCode, body) LCS would answer with
+    def handle(self, endpoint, payload):
+        failed, delay = self._start(endpoint)
+        if delay:
+            time.sleep(delay)
+        return self._answer(endpoint, payload, failed)
+
+    # the same as handle, waiting out the latency without blocking the event loop
+    async def handle_async(self, endpoint, payload):
+        failed, delay = self._start(endpoint)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._answer(endpoint, payload, failed)
+
+    # counts the call, returning whether it fails and how long it takes
+    def _start(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            failed = self._random.random() < self.error_rate
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        return failed, delay
+
+    def _answer(self, endpoint, payload, failed):
+        if failed:
+            return 500, "Internal server error"
+        handler = getattr(self, "_" + endpoint.strip("/").replace("-", "_"), None)
+        if handler is None:
+            return 404, "Unknown endpoint"
+        return handler(payload or {})
+
+    # lcs_client compatible post/get functions
+    def post(self, endpoint, *args, **kwargs):
+        return self._response(*self.handle(endpoint, kwargs.get("json")))
+
+    def get(self, endpoint, *args, **kwargs):
+        return self._response(*self.handle(endpoint, kwargs.get("params")))
+
+    # mentorq_user.lcs_async compatible post coroutine
+    async def post_async(self, endpoint, payload):
+        status_code, body = await self.handle_async(endpoint, payload)
+        return 200, json.dumps({"statusCode": status_code, "body": body}).encode()
+
+    def install(self):
+        install_transport(self.post, self.get)
+        install_async_transport(self.post_async)
+        return self
+
+    def uninstall(self):
+        reset_transport()
+        reset_async_transport()
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *exc_info):
+        self.uninstall()
+
+    def _user_for_token(self, token):
+        with self._lock:
+            email = self._tokens.get(token)
+            return self._users.get(email) if email else None
+
+    def _authorize(self, payload):
+        with self._lock:
+            user = self._users.get(payload.get("email"))
+        if user is None or user["password"] is None or user["password"] != payload.get("password"):
+            return 403, "Invalid email or password"
+        token = self.add_user(user["profile"], password=user["password"])
+        return 200, {"token": token, "valid_until": time.time() + 3 * 24 * 60 * 60}
+
+    def _validate(self, payload):
+        user = self._user_for_token(payload.get("token"))
+        if user is None:
+            return 403, "Invalid token"
+        return 200, user["profile"]
+
+    def _read(self, payload):
+        user = self._user_for_token(payload.get("token"))
+        if user is None:
+            return 403, "Invalid token"
+        email = (payload.get("query") or {}).get("email")
+        # only directors and organizers may read somebody else's profile
+        if email and email != user["profile"]["email"] and \
+                (user["profile"]["role"]["director"] or user["profile"]["role"]["organizer"]):
+            with self._lock:
+                other = self._users.get(email)
+            return 200, [other["profile"]] if other else []
+        return 200, [user["profile"]]
+
+    def _slack_dm(self, payload):
+        user = self._user_for_token(payload.get("token"))
+        if user is None:
+            return 403, "Invalid token"
+        with self._lock:
+            other = self._users.get(payload.get("other_email"))
+        if other is None:
+            return 400, "Could not find the other user on slack"
+        pair = sorted([user["profile"]["email"], other["profile"]["email"]])
+        return 200, {"slack_dm_link": "https://hackru.slack.com/app_redirect?channel=fake-" + "-".join(pair)}
+
+    # LCS always answers with a 200 and puts the actual status code in the body
+    @staticmethod
+    def _response(status_code, body):
+        response = requests.models.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps({"statusCode": status_code, "body": body}).encode()
+        return response
+
+
+# serves a FakeLCS over HTTP so that lcs_client can be pointed at it with LCS_ROOT_URL
+class FakeLCSRequestHandler(BaseHTTPRequestHandler):
+    fake_lcs = None
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        # the stage prefix (/dev or /prod) that lcs_client adds is ignored
+        endpoint = "/" + self.path.strip("/").split("/")[-1]
+        status_code, body = self.fake_lcs.handle(endpoint, payload)
+        content = json.dumps({"statusCode": status_code, "body": body}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(fake_lcs, host="127.0.0.1", port=0):
+    handler = type("BoundFakeLCSRequestHandler", (FakeLCSRequestHandler,), {"fake_lcs": fake_lcs})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+# builds the FakeLCS described by the LCS_FAKE_* settings
+def from_settings():
+    fixtures = None
+    if getattr(settings, "LCS_FAKE_FIXTURES", None):
+        with open(settings.LCS_FAKE_FIXTURES) as fixtures_file:
+            fixtures = json.load(fixtures_file)
+    return FakeLCS(fixtures=fixtures,
+                   latency=getattr(settings, "LCS_FAKE_LATENCY", 0.0),
+                   jitter=getattr(settings, "LCS_FAKE_JITTER", 0.0),
+                   error_rate=getattr(settings, "LCS_FAKE_ERROR_RATE", 0.0))
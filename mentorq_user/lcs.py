@@ -0,0 +1,296 @@
+import asyncio
+import hashlib
+import threading
+import time
+
+import lcs_client
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from mentorq_main.metrics import instrument_lcs
+from mentorq_main.timing import timed_function
+from mentorq_user.lcs_transport import get_transport, lcs_unavailable
+
+# the functions lcs_client ships with, which open a new connection for every call and have no timeout
+DEFAULT_TRANSPORT = (lcs_client.post, lcs_client.get)
+
+
+# points every lcs_client call at another transport
+# post and get take the same arguments as lcs_client.post/get and must return a requests-style response
+# (the calls are timed for the Server-Timing header and measured for the metrics, see mentorq_main.timing and
+# mentorq_main.metrics)
+def install_transport(post, get):
+    lcs_client.post = timed_function("lcs", instrument_lcs(post))
+    lcs_client.get = timed_function("lcs", instrument_lcs(get))
+
+
+# restores the shared pooled transport with retries and a circuit breaker (see mentorq_user.lcs_transport)
+def reset_transport():
+    transport = get_transport()
+    install_transport(transport.post, transport.get)
+
+
+# thread-safe hit/miss counters for a cache
+class CacheStats:
+    FIELDS = ("hits", "stale_hits", "outage_hits", "misses", "refreshes", "refresh_errors", "invalidations")
+
+    def __init__(self, fields=None):
+        self.fields = fields or self.FIELDS
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    # returns a copy of the current counters as a dict
+    def snapshot(self):
+        with self._lock:
+            return {field: getattr(self, field) for field in self.fields}
+
+    def reset(self):
+        with self._lock:
+            for field in self.fields:
+                setattr(self, field, 0)
+
+
+# caches LCS profiles in Django's cache framework, keyed by email and LCS token
+# entries younger than the TTL are served as is, entries older than the TTL but still within the stale window are
+# served while a background thread refreshes them (stale-while-revalidate), anything older is fetched synchronously
+# entries are kept for another outage TTL, they are only served when LCS can't be reached to fetch them again
+class LCSProfileCache:
+    KEY_PREFIX = "mentorq:lcs_profile:"
+
+    def __init__(self, alias=None, ttl=None, stale_ttl=None, outage_ttl=None):
+        self._alias = alias
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self._outage_ttl = outage_ttl
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+        self.stats = CacheStats()
+
+    @property
+    def cache(self):
+        return caches[self._alias or getattr(settings, "LCS_PROFILE_CACHE_ALIAS", "default")]
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else getattr(settings, "LCS_PROFILE_CACHE_TTL", 60)
+
+    @property
+    def stale_ttl(self):
+        return self._stale_ttl if self._stale_ttl is not None else getattr(settings, "LCS_PROFILE_CACHE_STALE_TTL", 240)
+
+    @property
+    def outage_ttl(self):
+        if self._outage_ttl is not None:
+            return self._outage_ttl
+        return getattr(settings, "LCS_PROFILE_CACHE_OUTAGE_TTL", 3600)
+
+    # the token is hashed so that raw LCS tokens never end up in the cache backend
+    def key(self, email, lcs_token):
+        digest = hashlib.sha256("{}:{}".format(email.lower(), lcs_token).encode()).hexdigest()
+        return self.KEY_PREFIX + digest
+
+    # returns the cached profile for the given credentials, calling fetch() to obtain it when it is missing or expired
+    def get(self, email, lcs_token, fetch):
+        key = self.key(email, lcs_token)
+        entry = self.cache.get(key)
+        if entry is not None:
+            profile, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                self.stats.incr("hits")
+                return profile
+            if age < self.ttl + self.stale_ttl:
+                self.stats.incr("stale_hits")
+                self._refresh_in_background(key, fetch)
+                return profile
+        self.stats.incr("misses")
+        try:
+            profile = fetch()
+        except Exception as e:
+            if entry is None or not lcs_unavailable(e) or time.time() - entry[1] >= self.max_age:
+                raise
+            self.stats.incr("outage_hits")
+            return entry[0]
+        self._store(key, profile)
+        return profile
+
+    # returns the cached profile (fresh or stale) for the given credentials, None if there is none
+    def peek(self, email, lcs_token):
+        entry = self.cache.get(self.key(email, lcs_token))
+        if entry is None or time.time() - entry[1] >= self.ttl + self.stale_ttl:
+            return None
+        self.stats.incr("hits")
+        return entry[0]
+
+    # returns the cached profile for the given credentials while LCS is unavailable, including entries that are only
+    # kept for outages, None if there is none
+    def fallback(self, email, lcs_token):
+        entry = self.cache.get(self.key(email, lcs_token))
+        if entry is None or time.time() - entry[1] >= self.max_age:
+            return None
+        self.stats.incr("outage_hits")
+        return entry[0]
+
+    def set(self, email, lcs_token, profile):
+        self._store(self.key(email, lcs_token), profile)
+
+    # drops the cached profile for the given credentials (e.g. when a user logs in with a new token)
+    def invalidate(self, email, lcs_token):
+        self.stats.incr("invalidations")
+        self.cache.delete(self.key(email, lcs_token))
+
+    @property
+    def max_age(self):
+        return self.ttl + self.stale_ttl + self.outage_ttl
+
+    def _store(self, key, profile):
+        self.cache.set(key, (profile, time.time()), timeout=self.max_age)
+
+    # refreshes a stale entry on a daemon thread, making sure that only one refresh per key is in flight
+    def _refresh_in_background(self, key, fetch):
+        with self._refreshing_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._store(key, fetch())
+                self.stats.incr("refreshes")
+            except Exception:
+                # the stale entry stays in place until it expires, the next miss will surface the error
+                self.stats.incr("refresh_errors")
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="lcs-profile-refresh", daemon=True).start()
+
+
+# the process-wide profile cache used by MentorqUser
+profile_cache = LCSProfileCache()
+
+
+# caches the Slack DM links LCS creates, keyed by the (unordered) pair of emails since both sides of a ticket get the
+# same link
+# a lookup is an LCS answer as (status code, body): links are kept for the TTL and errors about the pair (e.g. one of
+# them isn't on Slack) for the shorter error TTL, errors about the credentials of the user asking aren't cached
+# concurrent lookups of a pair that isn't cached wait for the first one instead of calling LCS as well
+class LCSDMLinkCache:
+    KEY_PREFIX = "mentorq:slack_dm:"
+    UNCACHED_STATUS_CODES = (401, 403)
+
+    def __init__(self, alias=None, ttl=None, error_ttl=None):
+        self._alias = alias
+        self._ttl = ttl
+        self._error_ttl = error_ttl
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        self._in_flight_async = {}
+        self.stats = CacheStats(fields=("hits", "error_hits", "misses", "coalesced", "errors"))
+
+    @property
+    def cache(self):
+        return caches[self._alias or getattr(settings, "LCS_PROFILE_CACHE_ALIAS", "default")]
+
+    @property
+    def ttl(self):
+        return self._ttl if self._ttl is not None else getattr(settings, "LCS_DM_LINK_CACHE_TTL", 3600)
+
+    @property
+    def error_ttl(self):
+        return self._error_ttl if self._error_ttl is not None else getattr(settings, "LCS_DM_LINK_CACHE_ERROR_TTL", 15)
+
+    def key(self, email, other_email):
+        pair = ":".join(sorted(((email or "").lower(), (other_email or "").lower())))
+        return self.KEY_PREFIX + hashlib.sha256(pair.encode()).hexdigest()
+
+    # returns the cached (status code, body) for the pair, None if there is none
+    def lookup(self, email, other_email):
+        answer = self.cache.get(self.key(email, other_email))
+        if answer is not None:
+            self.stats.incr("hits" if answer[0] == 200 else "error_hits")
+        return answer
+
+    def store(self, email, other_email, status_code, body):
+        if self.cacheable(status_code):
+            ttl = self.ttl if status_code == 200 else self.error_ttl
+            self.cache.set(self.key(email, other_email), (status_code, body), timeout=ttl)
+
+    def cacheable(self, status_code):
+        return status_code not in self.UNCACHED_STATUS_CODES
+
+    # returns the (status code, body) for the pair, calling fetch() to obtain it from LCS when it isn't cached
+    def get(self, email, other_email, fetch):
+        answer = self.lookup(email, other_email)
+        if answer is not None:
+            return answer
+        key = self.key(email, other_email)
+        with self._in_flight_lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = {"done": threading.Event(), "answer": None}
+        if not leader:
+            flight["done"].wait()
+            answer = flight["answer"]
+            # an answer that is only valid for the credentials of the other request (or none at all) is fetched again
+            if answer is not None and self.cacheable(answer[0]):
+                self.stats.incr("coalesced")
+                return answer
+            return self._fetch(email, other_email, fetch)
+        try:
+            flight["answer"] = self._fetch(email, other_email, fetch)
+            return flight["answer"]
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[key]
+            flight["done"].set()
+
+    # the same as get for a coroutine fetch(), the cache is only read and written on a thread
+    async def get_async(self, email, other_email, fetch):
+        answer = await sync_to_async(self.lookup)(email, other_email)
+        if answer is not None:
+            return answer
+        key = self.key(email, other_email)
+        flight = self._in_flight_async.get(key)
+        if flight is not None and not flight.get_loop().is_closed():
+            answer = await asyncio.shield(flight)
+            if answer is not None and self.cacheable(answer[0]):
+                self.stats.incr("coalesced")
+                return answer
+            return await self._fetch_async(email, other_email, fetch)
+        flight = self._in_flight_async[key] = asyncio.get_event_loop().create_future()
+        answer = None
+        try:
+            answer = await self._fetch_async(email, other_email, fetch)
+            return answer
+        finally:
+            if self._in_flight_async.get(key) is flight:
+                del self._in_flight_async[key]
+            flight.set_result(answer)
+
+    def _fetch(self, email, other_email, fetch):
+        self.stats.incr("misses")
+        status_code, body = fetch()
+        if status_code != 200:
+            self.stats.incr("errors")
+        self.store(email, other_email, status_code, body)
+        return status_code, body
+
+    async def _fetch_async(self, email, other_email, fetch):
+        self.stats.incr("misses")
+        status_code, body = await fetch()
+        if status_code != 200:
+            self.stats.incr("errors")
+        await sync_to_async(self.store)(email, other_email, status_code, body)
+        return status_code, body
+
+
+# the process-wide cache of Slack DM links used by TicketViewSet.get_slack_dm
+dm_link_cache = LCSDMLinkCache()
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import lcs_client
+import requests
+from django.conf import settings
+from lcs_client import InternalServerError, RequestError, CredentialError
+
+from mentorq_main.metrics import lcs_error_kind, observe_lcs
+from mentorq_user.lcs_transport import get_transport
+
+# Non-blocking versions of the lcs_client calls Mentorq makes, for the ASGI entrypoint
+# They talk to the same LCS API (lcs_client.get_base_url(), so LCS_ROOT_URL and LCS_DEV apply) and raise the same
+# lcs_client errors, whose response is a requests.Response like the one lcs_client would have received
+
+
+# sends a request to LCS with a shared httpx client, returning the status code and the content of the response
+# the request goes through the retries, circuit breaker and counters of the shared transport
+async def httpx_post(endpoint, json):
+    response = await get_transport().call_async(endpoint, lambda: _send(endpoint, json))
+    return response.status_code, response.content
+
+
+# httpx errors are raised as the requests errors the shared transport handles
+async def _send(endpoint, json):
+    import httpx
+
+    try:
+        return await (await _client()).post(lcs_client.get_base_url() + endpoint, json=json)
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.Timeout(str(e)) from e
+    except httpx.TransportError as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+
+
+# the client of each event loop, with the async generator that closes it (see _closing)
+_clients = {}
+
+
+# one client (and connection pool) per event loop, since the connections belong to the loop that opened them
+async def _client():
+    loop = asyncio.get_event_loop()
+    if loop not in _clients:
+        # only the ASGI entrypoint needs httpx, WSGI workers don't import it
+        import httpx
+
+        # drops the clients of loops that were closed without shutting down their async generators
+        for closed_loop in [other for other in _clients if other.is_closed()]:
+            del _clients[closed_loop]
+        timeout = httpx.Timeout(getattr(settings, "LCS_ASYNC_TIMEOUT", 10.0),
+                                connect=getattr(settings, "LCS_CONNECT_TIMEOUT", 2.0))
+        client = httpx.AsyncClient(timeout=timeout)
+        closing = _closing(client)
+        # started here, the generator is registered with the loop
+        await closing.__anext__()
+        _clients[loop] = client, closing
+    return _clients[loop][0]
+
+
+# closes the client and drops it once the generator is closed, which the loop does when it shuts down its async generators
+# (asyncio.run does before closing the loop), so clients aren't left open when the loop goes away
+async def _closing(client):
+    try:
+        yield
+    finally:
+        _clients.pop(asyncio.get_event_loop(), None)
+        await client.aclose()
+
+
+# closes the client of the running event loop, for the ASGI lifespan shutdown
+async def close_client():
+    entry = _clients.get(asyncio.get_event_loop())
+    if entry is not None:
+        await entry[1].aclose()
+
+
+# the coroutine every call goes through, see install_async_transport
+_post = httpx_post
+
+
+# points every call at another transport, post is a coroutine taking (endpoint, json) and returning
+# (status code, content)
+def install_async_transport(post):
+    global _post
+    _post = post
+
+
+def reset_async_transport():
+    install_async_transport(httpx_post)
+
+
+async def post(endpoint, json):
+    start = time.perf_counter()
+    try:
+        status_code, content = await _post(endpoint, json)
+    except Exception as e:
+        observe_lcs(endpoint, time.perf_counter() - start, lcs_error_kind(e))
+        raise
+    observe_lcs(endpoint, time.perf_counter() - start, lcs_error_kind(status_code=status_code, content=content))
+    response = requests.models.Response()
+    response.status_code = status_code
+    response.headers["Content-Type"] = "application/json"
+    response._content = content
+    InternalServerError.check(response)
+    RequestError.check(response)
+    CredentialError.check(response)
+    return response.json()["body"]
+
+
+async def validate_token(token):
+    return await post("/validate", {"token": token})
+
+
+async def get_profile(auth_token, user_email=None):
+    data = {"token": auth_token}
+    if user_email is not None:
+        data["query"] = {"email": user_email}
+    return (await post("/read", data))[0]
+
+
+async def create_dm_link_between(token, other_user_email):
+    return (await post("/slack-dm", {"token": token, "other_email": other_user_email}))["slack_dm_link"]
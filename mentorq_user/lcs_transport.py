@@ -0,0 +1,263 @@
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+
+import lcs_client
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from mentorq_main.metrics import count_lcs_breaker_open, count_lcs_retry
+
+# The transport every lcs_client call goes through (see mentorq_user.lcs.install_transport)
+# - requests share a keep-alive connection pool instead of opening a connection each
+# - every request has a connect and a read timeout (LCS_CONNECT_TIMEOUT, LCS_READ_TIMEOUT)
+# - requests that fail without an answer (connection errors, timeouts, 502/503/504 from the gateway) are retried up to
+#   LCS_RETRIES times with jittered exponential backoff
+# - after LCS_BREAKER_THRESHOLD failed requests in a row the circuit breaker opens and calls fail right away with
+#   LCSUnavailable for LCS_BREAKER_RESET seconds, then a single request is let through to probe LCS
+# While LCS is down, profiles that are still in the profile cache are served from it (see mentorq_user.lcs).
+
+RETRIED_STATUS_CODES = (502, 503, 504)
+# the start of the body of an LCS answer whose status is a server error
+SERVER_ERROR_BODY = re.compile(rb'\s*\{\s*"statusCode"\s*:\s*5\d\d\b')
+
+
+# raised instead of calling LCS while the circuit breaker is open
+# a ConnectionError so that code handling an unreachable LCS handles it too
+class LCSUnavailable(requests.exceptions.ConnectionError):
+    pass
+
+
+# whether an error (or the error it was raised while handling) means that LCS couldn't be reached
+def lcs_unavailable(error):
+    while error is not None:
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+# thread-safe counters of the calls to LCS
+class TransportStats:
+    FIELDS = ("requests", "failures", "retries", "timeouts", "connection_errors", "server_errors", "short_circuits",
+              "breaker_opens", "latency_seconds")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, field, amount=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    # records a request to an endpoint that took the given seconds
+    def observe(self, endpoint, seconds):
+        with self._lock:
+            self.requests += 1
+            self.latency_seconds += seconds
+            count, total, slowest = self.endpoints.get(endpoint, (0, 0.0, 0.0))
+            self.endpoints[endpoint] = (count + 1, total + seconds, max(slowest, seconds))
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {field: getattr(self, field) for field in self.FIELDS}
+            snapshot["endpoints"] = {endpoint: {"requests": count, "latency_seconds": total, "max_seconds": slowest}
+                                     for endpoint, (count, total, slowest) in self.endpoints.items()}
+        return snapshot
+
+    def reset(self):
+        with self._lock:
+            for field in self.FIELDS:
+                setattr(self, field, 0)
+            self.endpoints = {}
+
+
+# closed: calls go through; open: calls fail fast until reset_after seconds have passed; half-open: one call probes
+# LCS and closes the breaker if it succeeds or opens it again if it fails
+class CircuitBreaker:
+    def __init__(self, threshold, reset_after):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self._opened_at >= self.reset_after:
+                return "half-open"
+            return "open"
+
+    # whether a call may go to LCS
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.reset_after:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    # returns whether the failure opened the breaker
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._opened_at is None and self._failures >= self.threshold):
+                self._opened_at = time.monotonic()
+                self._probing = False
+                return True
+            return False
+
+
+class LCSTransport:
+    def __init__(self, base_url=None, connect_timeout=None, read_timeout=None, retries=None, backoff=None,
+                 backoff_max=None, pool_size=None, breaker_threshold=None, breaker_reset=None):
+        self.base_url = base_url
+        self.timeout = (self._setting(connect_timeout, "LCS_CONNECT_TIMEOUT", 2.0),
+                        self._setting(read_timeout, "LCS_READ_TIMEOUT", 5.0))
+        self.retries = self._setting(retries, "LCS_RETRIES", 2)
+        self.backoff = self._setting(backoff, "LCS_RETRY_BACKOFF", 0.1)
+        self.backoff_max = self._setting(backoff_max, "LCS_RETRY_BACKOFF_MAX", 1.0)
+        self.pool_size = self._setting(pool_size, "LCS_POOL_SIZE", 10)
+        self.breaker = CircuitBreaker(self._setting(breaker_threshold, "LCS_BREAKER_THRESHOLD", 5),
+                                      self._setting(breaker_reset, "LCS_BREAKER_RESET", 30.0))
+        self.stats = TransportStats()
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+        self._random = random.Random()
+
+    @staticmethod
+    def _setting(value, name, default):
+        return value if value is not None else getattr(settings, name, default)
+
+    # the session is created per process, a forked worker doesn't reuse its parent's connections
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None or self._session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session, self._session_pid = session, os.getpid()
+            return self._session
+
+    # lcs_client.post/get compatible
+    def post(self, endpoint, *args, **kwargs):
+        return self.request("POST", endpoint, *args, **kwargs)
+
+    def get(self, endpoint, *args, **kwargs):
+        return self.request("GET", endpoint, *args, **kwargs)
+
+    def request(self, method, endpoint, *args, **kwargs):
+        url = (self.base_url or lcs_client.get_base_url()) + endpoint
+        kwargs.setdefault("timeout", self.timeout)
+        return self.call(endpoint, lambda: self.session.request(method, url, *args, **kwargs))
+
+    # sends a request with send() under the retry and circuit breaker policy, returning its response
+    def call(self, endpoint, send):
+        self.check_breaker()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = send()
+            except requests.exceptions.RequestException as e:
+                if not self.retry_error(endpoint, start, e, attempt):
+                    raise
+            else:
+                if not self.retry_response(endpoint, start, response, attempt):
+                    return response
+            attempt += 1
+            time.sleep(self.delay(attempt))
+
+    # the same as call, for a coroutine send() (which raises requests exceptions as well)
+    async def call_async(self, endpoint, send):
+        self.check_breaker()
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = await send()
+            except requests.exceptions.RequestException as e:
+                if not self.retry_error(endpoint, start, e, attempt):
+                    raise
+            else:
+                if not self.retry_response(endpoint, start, response, attempt):
+                    return response
+            attempt += 1
+            await asyncio.sleep(self.delay(attempt))
+
+    # raises LCSUnavailable while the breaker is open
+    def check_breaker(self):
+        if not self.breaker.allow():
+            self.stats.incr("short_circuits")
+            raise LCSUnavailable("LCS is unavailable, retrying in at most {} seconds".format(self.breaker.reset_after))
+
+    # records a request that failed without an answer, returning whether it should be retried
+    def retry_error(self, endpoint, start, error, attempt):
+        self.stats.observe(endpoint, time.perf_counter() - start)
+        if isinstance(error, requests.exceptions.Timeout):
+            self.stats.incr("timeouts")
+        elif isinstance(error, requests.exceptions.ConnectionError):
+            self.stats.incr("connection_errors")
+        if attempt < self.retries and lcs_unavailable(error):
+            self.stats.incr("retries")
+            count_lcs_retry(endpoint)
+            return True
+        self.record_failure()
+        return False
+
+    # records a request that got an answer, returning whether it should be retried
+    # LCS answers with a 200 and puts its status in the body, a 5xx in either place means that LCS is failing
+    def retry_response(self, endpoint, start, response, attempt):
+        self.stats.observe(endpoint, time.perf_counter() - start)
+        if response.status_code >= 500 or SERVER_ERROR_BODY.match(response.content[:64]):
+            self.stats.incr("server_errors")
+            if attempt < self.retries and response.status_code in RETRIED_STATUS_CODES:
+                self.stats.incr("retries")
+                count_lcs_retry(endpoint)
+                return True
+            self.record_failure()
+        else:
+            self.breaker.record_success()
+        return False
+
+    def record_failure(self):
+        self.stats.incr("failures")
+        if self.breaker.record_failure():
+            self.stats.incr("breaker_opens")
+            count_lcs_breaker_open()
+
+    # full jitter: a random delay up to the exponential backoff for the attempt
+    def delay(self, attempt):
+        return self._random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt - 1)))
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+# the transport shared by the whole process
+def get_transport():
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = LCSTransport()
+    return _transport
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from mentorq_user import fake_lcs
+
+
+# serves a fake LCS over HTTP, point Mentorq at it with LCS_ROOT_URL=http://<addr>:<port>
+class Command(BaseCommand):
+    help = "Runs a local stand-in for the LCS API"
+
+    def add_arguments(self, parser):
+        parser.add_argument("addrport", nargs="?", default="127.0.0.1:8001")
+        parser.add_argument("--latency", type=float, help="seconds added to every call")
+        parser.add_argument("--jitter", type=float, help="up to this many extra seconds added to every call")
+        parser.add_argument("--error-rate", type=float, help="fraction of calls that fail with a 500")
+
+    def handle(self, *args, **options):
+        host, _, port = options["addrport"].rpartition(":")
+        lcs = fake_lcs.from_settings()
+        for option in ("latency", "jitter", "error_rate"):
+            if options[option] is not None:
+                setattr(lcs, option, options[option])
+        server = fake_lcs.make_server(lcs, host=host or "127.0.0.1", port=int(port))
+        self.stdout.write("Fake LCS listening on http://{}:{}".format(*server.server_address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
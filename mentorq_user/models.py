@@ -6,6 +6,7 @@ from django.utils.translation import ugettext_lazy as _
 from lcs_client import InternalServerError, RequestError, CredentialError, User
 from rest_framework.exceptions import AuthenticationFailed
 
+from mentorq_user.lcs import profile_cache
 from mentorq_user.managers import MentorqUserManager
 
 
@@ -37,6 +38,7 @@ class MentorqUser(AbstractBaseUser, PermissionsMixin):
         except:
             raise AuthenticationFailed(detail=_("There was an authentication error. Please try again later"))
 
+    # the profile is served from the shared profile cache, LCS is only contacted on a miss
     @cached_property
     def lcs_profile(self):
-        return self.lcs_user.profile()
+        return profile_cache.get(self.email, self.lcs_token, lambda: self.lcs_user.profile())
@@ -50,8 +50,10 @@ class MentorqTokenObtainPairSerializer(MentorqTokenObtainSerializer):
     @classmethod
     def get_token(cls, user):
         refresh_token = RefreshToken.for_user(user)
+        refresh_token["email"] = user.lcs_profile["email"]
         refresh_token["director"] = user.lcs_profile["role"]["director"]
         refresh_token["mentor"] = user.lcs_profile["role"]["mentor"]
+        refresh_token["organizer"] = user.lcs_profile["role"]["organizer"]
         name = user.lcs_profile["first_name"]
         if user.lcs_profile["last_name"]:
             name += " " + user.lcs_profile["last_name"]
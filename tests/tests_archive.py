@@ -0,0 +1,89 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from mentorq_api import archive, rollup
+from mentorq_api.models import Ticket, Feedback, TicketStats, MentorRating, ArchivedTicket, ArchivedFeedback, \
+    ChangeSequence
+from tests.utils import client_for
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        long_ago = timezone.now() - timedelta(days=3)
+
+        def ticket(title, status, active=True, old=True):
+            ticket = Ticket.objects.create(owner_email="hacker@example.com", title=title, location="table",
+                                           status=status, active=active, mentor="Mentor",
+                                           mentor_email="mentor@example.com")
+            if old:
+                # created_datetime is set on insert, the tickets are made older afterwards
+                closed = long_ago + timedelta(hours=1) if status == Ticket.StatusType.CLOSED else None
+                Ticket.objects.filter(pk=ticket.pk).update(created_datetime=long_ago, claimed_datetime=long_ago,
+                                                           closed_datetime=closed)
+            return ticket
+
+        self.closed = ticket("closed", Ticket.StatusType.CLOSED)
+        Feedback.objects.create(ticket=self.closed, rating=2, comments="slow")
+        self.cancelled = ticket("cancelled", Ticket.StatusType.CANCELLED)
+        self.inactive = ticket("inactive", Ticket.StatusType.CLAIMED, active=False)
+        self.kept = [ticket("open", Ticket.StatusType.OPEN), ticket("claimed", Ticket.StatusType.CLAIMED),
+                     ticket("recent", Ticket.StatusType.CLOSED, old=False)]
+        Feedback.objects.create(ticket=self.kept[2], rating=5, comments="great")
+        TicketStats.rebuild()
+        MentorRating.rebuild()
+
+    @staticmethod
+    def stats():
+        return {counter: getattr(TicketStats.load(), counter) for counter in rollup.COUNTERS}
+
+    '''
+     Tests that finished tickets and their feedback are moved to the archive and still count in the stats
+    '''
+
+    def test_archive(self):
+        stats = self.stats()
+        leaderboard = MentorRating.leaderboard()
+        since = ChangeSequence.current_value(ChangeSequence.TICKETS)
+
+        self.assertEqual(archive.archive_tickets(timedelta(hours=1), batch_size=2), 3)
+        archived = [self.closed.pk, self.cancelled.pk, self.inactive.pk]
+        self.assertEqual(sorted(Ticket.objects.values_list("pk", flat=True)), [ticket.pk for ticket in self.kept])
+        self.assertEqual(sorted(ArchivedTicket.objects.values_list("pk", flat=True)), archived)
+        self.assertEqual(ArchivedTicket.objects.get(pk=self.inactive.pk).status, Ticket.StatusType.CLAIMED)
+        self.assertEqual(list(ArchivedFeedback.objects.values_list("ticket_id", "rating")), [(self.closed.pk, 2)])
+        self.assertEqual(Feedback.objects.count(), 1)
+
+        # archiving leaves the rollups alone and rebuilding them gives the same stats
+        self.assertEqual(self.stats(), stats)
+        self.assertEqual(TicketStats.verify(), [])
+        self.assertEqual(MentorRating.verify(), [])
+        TicketStats.rebuild()
+        MentorRating.rebuild()
+        self.assertEqual(self.stats(), stats)
+        self.assertEqual(MentorRating.leaderboard(), leaderboard)
+
+        # clients polling for changes drop the archived tickets
+        changes = client_for("director@example.com", director=True).get("/api/tickets/changes/", {"since": since})
+        self.assertEqual(sorted(changes.data["removed"]), archived)
+
+        self.assertEqual(archive.archive_tickets(timedelta(hours=1)), 0)
+
+    '''
+     Tests that the command only counts the tickets on a dry run and archives them otherwise
+    '''
+
+    def test_command(self):
+        output = StringIO()
+        call_command("archive_tickets", "--older-than-hours", "1", "--dry-run", stdout=output)
+        self.assertIn("3 tickets would be archived", output.getvalue())
+        self.assertEqual(ArchivedTicket.objects.count(), 0)
+        call_command("archive_tickets", "--older-than-hours", "1", stdout=output)
+        self.assertIn("Archived 3 tickets", output.getvalue())
+        self.assertEqual(ArchivedTicket.objects.count(), 3)
+        # tickets that finished more recently than the default threshold are kept
+        call_command("archive_tickets", stdout=output)
+        self.assertEqual(Ticket.objects.count(), 3)
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import time
+
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+
+from mentorq_api.models import Ticket, TicketStats
+from mentorq_main.asgi import application
+from mentorq_main.asgi_utils import call
+from mentorq_user import lcs_async
+from mentorq_user.fake_lcs import FakeLCS
+from mentorq_user.models import MentorqUser
+from mentorq_user.serializers import MentorqTokenObtainPairSerializer
+from tests.utils import access_token
+
+'''
+The endpoints the ASGI entrypoint serves without Django, against the in-process fake LCS
+'''
+
+
+# uses TransactionTestCase since the database work of the async views runs in other threads
+class AsyncLCSTestCase(TransactionTestCase):
+    def setUp(self):
+        TicketStats.rebuild()
+        cache.clear()
+        self.lcs = FakeLCS().install()
+        self.addCleanup(self.lcs.uninstall)
+
+    def post_token(self, body, content_type="application/json"):
+        return asyncio.run(call(application, "POST", "/api/auth/token/", [("Content-Type", content_type)], body))
+
+    def get(self, path, access_token):
+        return asyncio.run(call(application, "GET", path, [("Authorization", "Bearer " + access_token)]))
+
+    def claimed_ticket(self):
+        hacker = MentorqUser.objects.create(email="hacker@example.com", lcs_token="hacker-token")
+        mentor = MentorqUser.objects.create(email="mentor@example.com", lcs_token="mentor-token")
+        ticket = Ticket.objects.create(owner_email="hacker@example.com", owner="Hacker", title="Help",
+                                       location="Table 1", status=Ticket.StatusType.CLAIMED, mentor="Mentor",
+                                       mentor_email="mentor@example.com")
+        return ticket, hacker, mentor
+
+    @staticmethod
+    def token_for(user):
+        return str(MentorqTokenObtainPairSerializer.get_token(user).access_token)
+
+    '''
+     Tests that tokens are issued with the role claims from LCS and that the profile is cached for later requests
+    '''
+
+    def test_obtain_token(self):
+        status, _, body = self.post_token(json.dumps({"email": "mentor@example.com",
+                                                      "lcs_token": "mentor-token"}).encode())
+        self.assertEqual(status, 200, body)
+        access = json.loads(body)["access"]
+        self.assertEqual(self.lcs.calls, {"/validate": 1, "/read": 1})
+        self.assertEqual(MentorqUser.objects.get(email="mentor@example.com").lcs_token, "mentor-token")
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer " + access)
+        self.assertEqual(client.get("/api/tickets/").status_code, 200)
+        self.assertEqual(self.lcs.calls.get("/read"), 1)
+
+    '''
+     Tests that invalid LCS tokens get the same error as from Django
+    '''
+
+    def test_invalid_token(self):
+        body = {"email": "hacker@example.com", "lcs_token": "nope"}
+        status, _, content = self.post_token(json.dumps(body).encode())
+        self.assertEqual(status, 401)
+        self.assertEqual(json.loads(content), APIClient().post("/api/auth/token/", body).json())
+
+    '''
+     Tests that requests the async view doesn't handle are answered by Django
+    '''
+
+    def test_delegated(self):
+        status, _, body = self.post_token(b"email=hacker%40example.com&lcs_token=hacker-token",
+                                          "application/x-www-form-urlencoded")
+        self.assertEqual(status, 200, body)
+        status, _, body = self.post_token(json.dumps({"email": "not an email", "lcs_token": "x"}).encode())
+        self.assertEqual(status, 400)
+        self.assertIn("email", json.loads(body))
+
+    '''
+     Tests that the DM link goes to the other side of the ticket
+    '''
+
+    def test_slack_dm(self):
+        ticket, hacker, mentor = self.claimed_ticket()
+        path = "/api/tickets/{}/slack-dm/".format(ticket.pk)
+        status, _, body = self.get(path, self.token_for(mentor))
+        self.assertEqual(status, 200, body)
+        self.assertEqual(json.loads(body),
+                         "https://hackru.slack.com/app_redirect?channel=fake-hacker@example.com-mentor@example.com")
+        self.assertEqual(self.lcs.calls.get("/slack-dm"), 1)
+        self.assertEqual(self.get(path, self.token_for(hacker))[2], body)
+
+    '''
+     Tests that the endpoints served without Django send the same CORS headers as Django
+    '''
+
+    def test_cors(self):
+        ticket, hacker, mentor = self.claimed_ticket()
+        origin = ("Origin", "https://mentorq.example.com")
+        body = json.dumps({"email": "mentor@example.com", "lcs_token": "mentor-token"}).encode()
+        django_response = APIClient().post("/api/auth/token/", body, content_type="application/json",
+                                           HTTP_ORIGIN=origin[1])
+        self.assertEqual(django_response["Access-Control-Allow-Origin"], "*")
+
+        status, headers, _ = asyncio.run(call(application, "POST", "/api/auth/token/",
+                                              [("Content-Type", "application/json"), origin], body))
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["access-control-allow-origin"], django_response["Access-Control-Allow-Origin"])
+        self.assertEqual(headers["vary"], "Accept, Origin")
+
+        status, headers, _ = asyncio.run(call(application, "GET", "/api/tickets/{}/slack-dm/".format(ticket.pk),
+                                              [("Authorization", "Bearer " + self.token_for(mentor)), origin]))
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["access-control-allow-origin"], "*")
+
+    '''
+     Tests that the lifespan messages are answered and that the LCS client is closed on shutdown
+    '''
+
+    def test_lifespan(self):
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        async def serve():
+            client = await lcs_async._client()
+            await application({"type": "lifespan"}, receive, send)
+            return client
+
+        client = asyncio.run(serve())
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+        self.assertTrue(client.is_closed)
+
+    '''
+     Tests that tickets the user can't see and missing credentials are answered by Django
+    '''
+
+    def test_slack_dm_delegated(self):
+        ticket, hacker, mentor = self.claimed_ticket()
+        other = MentorqUser.objects.create(email="organizer@example.com", lcs_token="nope")
+        path = "/api/tickets/{}/slack-dm/".format(ticket.pk)
+        self.assertEqual(self.get("/api/tickets/{}/slack-dm/".format(ticket.pk + 1), self.token_for(mentor))[0],
+                         404)
+        self.assertEqual(asyncio.run(call(application, "GET", path))[0], APIClient().get(path).status_code)
+        for token in ("invalid", str(access_token("organizer@example.com", organizer=True, user_id=other.pk))):
+            # (the profile can't be read with the token stored for other)
+            status = APIClient().get(path, HTTP_AUTHORIZATION="Bearer " + token).status_code
+            self.assertIn(status, (401, 403))
+            self.assertEqual(self.get(path, token)[0], status)
+
+    '''
+     Tests that requests waiting on LCS don't hold each other up
+    '''
+
+    def test_concurrent(self):
+        ticket, hacker, mentor = self.claimed_ticket()
+        path = "/api/tickets/{}/slack-dm/".format(ticket.pk)
+        mentor_token = self.token_for(mentor)
+        # caches the profile
+        self.get(path, mentor_token)
+        self.lcs.latency = 0.2
+
+        async def send_all():
+            return await asyncio.gather(*(call(application, "GET", path, [("Authorization", "Bearer " + mentor_token)])
+                                          for _ in range(20)))
+
+        start = time.perf_counter()
+        responses = asyncio.run(send_all())
+        self.assertEqual({status for status, _, _ in responses}, {200})
+        self.assertLess(time.perf_counter() - start, 2)
@@ -0,0 +1,144 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from mentorq_api.models import Ticket, Feedback, TicketStats, MentorRating, ChangeSequence
+from tests.utils import client_for
+
+
+class BulkTestCase(TestCase):
+    def setUp(self):
+        self.director = client_for("director@example.com", director=True)
+
+    # adds count tickets in each active status and a closed one with feedback
+    def populate(self, count):
+        for i in range(count):
+            Ticket.objects.create(owner_email="hacker{}@example.com".format(i), title="open", location="table")
+            Ticket.objects.create(owner_email="hacker{}@example.com".format(i), title="claimed", location="table",
+                                  status=Ticket.StatusType.CLAIMED, mentor="Mentor",
+                                  mentor_email="mentor{}@example.com".format(i % 3))
+        closed = Ticket.objects.create(owner_email="hacker@example.com", title="closed", location="table",
+                                       status=Ticket.StatusType.CLOSED, mentor="Mentor",
+                                       mentor_email="mentor@example.com")
+        Feedback.objects.create(ticket=closed, rating=4, comments="thanks")
+
+    def bulk(self, data):
+        return self.director.post("/api/tickets/bulk/", data, format="json")
+
+    '''
+     Tests that closing the tickets matching a filter closes the ones that can be closed and keeps the rollup right
+    '''
+
+    def test_close(self):
+        self.populate(5)
+        versions = dict(Ticket.objects.values_list("id", "version"))
+        since = ChangeSequence.current_value(ChangeSequence.TICKETS)
+        response = self.bulk({"filter": {"created_before": (timezone.now() + timedelta(minutes=1)).isoformat()},
+                              "status": "CLOSED"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["updated"], 10)
+        self.assertEqual(response.data["previous_status"], {"OPEN": 5, "CLAIMED": 5})
+        self.assertNotIn("skipped", response.data)
+
+        closed = Ticket.objects.filter(title__in=("open", "claimed"))
+        self.assertFalse(closed.exclude(status=Ticket.StatusType.CLOSED).exists())
+        self.assertFalse(closed.filter(closed_datetime__isnull=True).exists())
+        # every changed ticket has its own new version, the ticket that was closed already is left alone
+        new_versions = [ticket.version for ticket in closed]
+        self.assertEqual(len(set(new_versions)), 10)
+        self.assertTrue(all(version > since for version in new_versions))
+        self.assertEqual(max(new_versions), response.data["version"])
+        untouched = Ticket.objects.get(title="closed")
+        self.assertEqual(untouched.version, versions[untouched.pk])
+        self.assertEqual(TicketStats.verify(), [])
+        self.assertEqual(MentorRating.verify(), [])
+
+        changes = self.director.get("/api/tickets/changes/", {"since": since}).data
+        self.assertEqual(len(changes["tickets"]), 10)
+
+    '''
+     Tests cancelling and deactivating tickets by id, reporting the ids that weren't changed
+    '''
+
+    def test_ids(self):
+        self.populate(2)
+        open_ids = list(Ticket.objects.filter(title="open").values_list("id", flat=True))
+        closed_id = Ticket.objects.get(title="closed").pk
+        response = self.bulk({"ids": open_ids + [closed_id, 12345], "status": "CANCELLED", "active": False})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["updated"], 2)
+        self.assertEqual(response.data["skipped"], sorted([closed_id, 12345]))
+        self.assertEqual(set(Ticket.objects.filter(pk__in=open_ids).values_list("status", "active")),
+                         {(Ticket.StatusType.CANCELLED, False)})
+        self.assertTrue(Ticket.objects.get(pk=closed_id).active)
+
+        response = self.bulk({"filter": {"status": ["CLOSED"]}, "active": False})
+        self.assertEqual((response.data["updated"], response.data["previous_status"]), (1, {"CLOSED": 1}))
+        self.assertFalse(Ticket.objects.get(pk=closed_id).active)
+        # tickets that are inactive already aren't changed again
+        self.assertEqual(self.bulk({"filter": {"status": ["CLOSED"]}, "active": False}).data["updated"], 0)
+        self.assertEqual(TicketStats.verify(), [])
+
+    '''
+     Tests that a bulk change makes as many queries for a few tickets as for many
+    '''
+
+    def test_queries(self):
+        counts = []
+        for count in (2, 50):
+            self.populate(count)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.bulk({"filter": {"status": ["OPEN", "CLAIMED"]}, "status": "CLOSED"})
+            self.assertEqual(response.data["updated"], 2 * count)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(TicketStats.verify(), [])
+
+    '''
+     Tests that tickets somebody else changes before they are marked are left out without an error
+    '''
+
+    def test_concurrent_change(self):
+        self.populate(2)
+        lock, next_value = ChangeSequence.lock, ChangeSequence.next_value
+
+        # another writer cancels the open tickets while the bulk change waits for the sequence
+        def cancel_first(name):
+            Ticket.objects.filter(status=Ticket.StatusType.OPEN).update(status=Ticket.StatusType.CANCELLED)
+            lock(name)
+
+        with mock.patch.object(ChangeSequence, "lock", side_effect=cancel_first):
+            response = self.bulk({"filter": {"status": ["OPEN"]}, "status": "CLOSED"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["updated"], 0)
+
+        # ... or after the span of the tickets to change was read
+        ids = list(Ticket.objects.filter(title="claimed").values_list("id", flat=True))
+
+        def cancel_later(name, count=1):
+            Ticket.objects.filter(pk__in=ids).update(status=Ticket.StatusType.CANCELLED)
+            return next_value(name, count)
+
+        with mock.patch.object(ChangeSequence, "next_value", side_effect=cancel_later):
+            response = self.bulk({"ids": ids, "status": "CLOSED"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["updated"], response.data["skipped"]), (0, ids))
+
+    '''
+     Tests that only directors can change tickets in bulk and that invalid changes are refused
+    '''
+
+    def test_invalid(self):
+        self.populate(1)
+        mentor = client_for("mentor@example.com", mentor=True)
+        self.assertEqual(mentor.post("/api/tickets/bulk/", {"ids": [1], "status": "CLOSED"}, format="json")
+                         .status_code, 403)
+        self.assertEqual(self.bulk({"status": "CLOSED"}).status_code, 400)
+        self.assertEqual(self.bulk({"filter": {}}).status_code, 400)
+        self.assertEqual(self.bulk({"filter": {}, "status": "CLAIMED"}).status_code, 400)
+        self.assertEqual(self.bulk({"filter": {"status": ["LOST"]}, "status": "CLOSED"}).status_code, 400)
+        self.assertFalse(Ticket.objects.filter(status=Ticket.StatusType.CLOSED).exclude(title="closed").exists())
@@ -0,0 +1,86 @@
+from django.test import TestCase
+
+from mentorq_api.models import Ticket, Feedback
+from tests.utils import client_for
+
+
+class ChangeFeedTestCase(TestCase):
+    def setUp(self):
+        self.hacker = client_for("hacker@example.com")
+        self.mentor = client_for("mentor@example.com", mentor=True)
+        self.director = client_for("director@example.com", director=True)
+        self.tickets = [Ticket.objects.create(owner_email="hacker{}@example.com".format("" if i % 2 else i),
+                                              title="ticket {}".format(i), location="table") for i in range(4)]
+
+    def changes(self, client, since):
+        response = client.get("/api/tickets/changes/", {"since": since})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    '''
+     Tests that versions increase with every change of a ticket
+    '''
+
+    def test_versions(self):
+        ticket = self.tickets[0]
+        versions = [ticket.version]
+        ticket.comment = "more details"
+        ticket.save()
+        versions.append(ticket.version)
+        ticket.transition(Ticket.StatusType.CLAIMED, mentor_email="mentor@example.com")
+        versions.append(Ticket.objects.get(pk=ticket.pk).version)
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertGreater(versions[1], max(other.version for other in self.tickets[1:]))
+
+    '''
+     Tests that a poll returns only what changed since the given version, with the role filtering of the list
+    '''
+
+    def test_changes(self):
+        everything = self.changes(self.director, 0)
+        self.assertEqual(len(everything["tickets"]), 4)
+        self.assertEqual(everything["version"], max(ticket.version for ticket in self.tickets))
+        self.assertEqual(len(self.changes(self.hacker, 0)["tickets"]), 2)
+
+        since = everything["version"]
+        self.assertEqual(self.changes(self.director, since), {"version": since, "tickets": [], "removed": []})
+        self.tickets[1].transition(Ticket.StatusType.CLAIMED, mentor_email="mentor@example.com")
+        changes = self.changes(self.director, since)
+        self.assertEqual([ticket["id"] for ticket in changes["tickets"]], [self.tickets[1].pk])
+        self.assertEqual(changes["tickets"][0]["status"], "CLAIMED")
+        self.assertEqual(changes["tickets"][0]["version"], changes["version"])
+        self.assertEqual(self.changes(self.hacker, since)["tickets"][0]["id"], self.tickets[1].pk)
+        self.assertEqual(self.changes(client_for("hacker0@example.com"), since)["tickets"], [])
+
+    '''
+     Tests that closed tickets are removed from the mentors' list and deleted tickets from everybody's
+    '''
+
+    def test_removed(self):
+        since = self.changes(self.director, 0)["version"]
+        pks = [ticket.pk for ticket in self.tickets]
+        self.tickets[1].transition(Ticket.StatusType.CLOSED)
+        self.tickets[3].delete()
+        self.tickets[0].delete()
+        self.assertEqual(self.changes(self.mentor, since)["removed"], [pks[3], pks[0], pks[1]])
+        self.assertEqual(self.changes(self.hacker, since)["removed"], [pks[3]])
+        changes = self.changes(self.director, since)
+        self.assertEqual([ticket["status"] for ticket in changes["tickets"]], ["CLOSED"])
+
+    '''
+     Tests that new feedback shows up as a change of its ticket
+    '''
+
+    def test_feedback_changes_ticket(self):
+        self.tickets[1].transition(Ticket.StatusType.CLOSED)
+        since = self.changes(self.director, 0)["version"]
+        Feedback.objects.create(ticket=self.tickets[1], rating=5, comments="")
+        ticket = self.changes(self.hacker, since)["tickets"][0]
+        self.assertTrue(ticket["feedback"])
+
+    '''
+     Tests that since must be a number
+    '''
+
+    def test_invalid_since(self):
+        self.assertEqual(self.director.get("/api/tickets/changes/", {"since": "yesterday"}).status_code, 400)
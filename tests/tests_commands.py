@@ -0,0 +1,75 @@
+import io
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
+from django.test import TransactionTestCase
+
+from mentorq_api.models import Ticket, Feedback, TicketStats, MentorRating
+
+'''
+Smoke tests of the seeding, rollup and load test management commands on a few tickets
+'''
+
+
+# uses TransactionTestCase since the load test's pollers make their requests from other threads
+class CommandsTestCase(TransactionTestCase):
+    def call(self, *args):
+        stdout = io.StringIO()
+        call_command(*args, stdout=stdout, stderr=io.StringIO())
+        return stdout.getvalue()
+
+    def seed(self):
+        self.call("seed_tickets", "--tickets", "30", "--hackers", "5", "--mentors", "3", "--event-hours", "2",
+                  "--batch-size", "12", "--feedback-rate", "1")
+
+    '''
+     Tests that seeded tickets keep their generated timestamps without changing how new tickets are created
+    '''
+
+    def test_seed_tickets(self):
+        self.seed()
+        self.assertEqual(Ticket.objects.count(), 30)
+        self.assertEqual(Feedback.objects.count(), Ticket.objects.filter(status=Ticket.StatusType.CLOSED).count())
+        self.assertEqual(len(set(Ticket.objects.values_list("created_datetime", flat=True))), 30)
+        # the claims are generated after the creation times, not after the insert
+        self.assertFalse(Ticket.objects.filter(claimed_datetime__lt=F("created_datetime")).exists())
+        self.assertEqual(len(set(Ticket.objects.values_list("version", flat=True))), 30)
+        self.assertEqual(TicketStats.verify(), [])
+        self.assertEqual(MentorRating.verify(), [])
+
+        self.assertTrue(Ticket._meta.get_field("created_datetime").auto_now_add)
+        ticket = Ticket.objects.create(owner_email="hacker@example.com", title="new", location="table")
+        self.assertGreater(ticket.created_datetime, Ticket.objects.exclude(pk=ticket.pk)
+                           .order_by("-created_datetime").first().created_datetime)
+
+        self.call("seed_tickets", "--tickets", "5", "--hackers", "5", "--mentors", "3", "--clear")
+        self.assertEqual(Ticket.objects.count(), 5)
+        self.assertEqual(TicketStats.verify(), [])
+
+    '''
+     Tests that rebuild_ticket_stats fixes rollups that are out of date and that --verify reports them
+    '''
+
+    def test_rebuild_ticket_stats(self):
+        self.seed()
+        self.assertIn("match", self.call("rebuild_ticket_stats", "--verify"))
+        TicketStats.objects.update(total_tickets=0)
+        with self.assertRaises(CommandError):
+            self.call("rebuild_ticket_stats", "--verify")
+        self.call("rebuild_ticket_stats")
+        self.assertEqual(TicketStats.verify(), [])
+
+    '''
+     Tests that a short load test against the seeded tickets gets answers and reports them
+    '''
+
+    def test_loadtest(self):
+        self.seed()
+        output = self.call("loadtest", "--concurrency", "2", "--duration", "0.5", "--hackers", "5", "--mentors",
+                           "3", "--mix", "mentor=0.5,director=0.5", "--lcs-latency", "0", "--lcs-jitter", "0")
+        self.assertIn("GET /api/tickets/", output)
+        total = [line for line in output.splitlines() if line.startswith("total")][0]
+        requests, errors = total.split()[1:3]
+        self.assertGreater(int(requests), 0)
+        self.assertEqual(int(errors), 0)
@@ -0,0 +1,217 @@
+import gc
+import os
+import tempfile
+import threading
+import unittest
+
+from django.db import connections, OperationalError
+from django.test import SimpleTestCase
+from prometheus_client import CollectorRegistry
+
+from mentorq_main.backends import pooled_databases
+from mentorq_main.backends.pool import ConnectionPool, PoolExhausted, pool_stats
+from mentorq_main.metrics import PoolCollector
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+
+    def close(self):
+        self.closed = True
+
+
+def ping(connection):
+    return not connection.broken
+
+
+def close(connection):
+    connection.close()
+
+
+class ConnectionPoolTestCase(SimpleTestCase):
+    '''
+     Tests that released connections are reused, most recently released first
+    '''
+
+    def test_reuse(self):
+        pool = ConnectionPool(max_connections=2)
+        first, second = pool.acquire(FakeConnection, ping, close), pool.acquire(FakeConnection, ping, close)
+        pool.release(first, lambda connection: None, close)
+        pool.release(second, lambda connection: None, close)
+        self.assertIs(pool.acquire(FakeConnection, ping, close), second)
+        self.assertEqual(pool.snapshot()["created"], 2)
+        self.assertEqual(pool.snapshot()["reused"], 1)
+        self.assertEqual(pool.snapshot()["in_use"], 1)
+        self.assertEqual(pool.snapshot()["idle"], 1)
+
+    '''
+     Tests that a request waits for a connection when all of them are in use and gives up after the timeout
+    '''
+
+    def test_max_connections(self):
+        pool = ConnectionPool(max_connections=1, timeout=0.05)
+        connection = pool.acquire(FakeConnection, ping, close)
+        with self.assertRaises(PoolExhausted):
+            pool.acquire(FakeConnection, ping, close)
+
+        pool.timeout = 5
+        threading.Timer(0.05, pool.release, (connection, lambda connection: None, close)).start()
+        self.assertIs(pool.acquire(FakeConnection, ping, close), connection)
+        self.assertEqual(pool.snapshot()["waits"], 2)
+        self.assertEqual(pool.snapshot()["timeouts"], 1)
+
+    '''
+     Tests that idle connections are closed after the idle timeout and broken ones are replaced
+    '''
+
+    def test_health(self):
+        pool = ConnectionPool(idle_timeout=0)
+        connection = pool.acquire(FakeConnection, ping, close)
+        pool.release(connection, lambda connection: None, close)
+        self.assertIsNot(pool.acquire(FakeConnection, ping, close), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.snapshot()["closed_idle"], 1)
+
+        pool = ConnectionPool()
+        connection = pool.acquire(FakeConnection, ping, close)
+        pool.release(connection, lambda connection: None, close)
+        connection.broken = True
+        self.assertIsNot(pool.acquire(FakeConnection, ping, close), connection)
+        self.assertEqual(pool.snapshot()["ping_failures"], 1)
+
+        def fail(connection):
+            raise ValueError()
+
+        other = pool.acquire(FakeConnection, ping, close)
+        pool.release(other, fail, close)
+        self.assertTrue(other.closed)
+        self.assertEqual(pool.snapshot()["idle"], 0)
+
+
+# runs the pooled backend against a database of its own
+class PooledBackendTestCase(SimpleTestCase):
+    ALIAS = "pooled"
+
+    def database(self):
+        self.path = tempfile.NamedTemporaryFile(suffix=".sqlite3", delete=False).name
+        self.addCleanup(os.remove, self.path)
+        return {"ENGINE": "django.db.backends.sqlite3", "NAME": self.path}
+
+    def setUp(self):
+        options = {"MAX_CONNECTIONS": 2, "IDLE_TIMEOUT": 300, "PRE_PING": True, "TIMEOUT": 0.1}
+        connections.databases[self.ALIAS] = pooled_databases({self.ALIAS: self.database()}, options)[self.ALIAS]
+        self.addCleanup(self.remove_alias)
+
+    def remove_alias(self):
+        connections[self.ALIAS].close()
+        del connections.databases[self.ALIAS]
+        delattr(connections._connections, self.ALIAS)
+
+    def query(self):
+        with connections[self.ALIAS].cursor() as cursor:
+            cursor.execute("SELECT 1")
+            return cursor.fetchone()[0]
+
+    '''
+     Tests that closing a connection (as Django does after each request) hands it to the next user
+    '''
+
+    def test_reuse(self):
+        self.assertEqual(self.query(), 1)
+        raw = connections[self.ALIAS].connection
+        connections[self.ALIAS].close()
+        self.assertEqual(self.query(), 1)
+        self.assertIs(connections[self.ALIAS].connection, raw)
+        pool = connections[self.ALIAS].pool
+        self.assertEqual(pool.snapshot()["created"], 1)
+        self.assertEqual(pool.snapshot()["reused"], 1)
+        self.assertIn(self.ALIAS, pool_stats())
+
+        connections[self.ALIAS].close()
+        used = []
+
+        def other_thread():
+            self.query()
+            used.append(connections[self.ALIAS].connection)
+            connections[self.ALIAS].close()
+
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+        self.assertIs(used[0], raw)
+
+    '''
+     Tests that connections of threads that end without closing them go back to the pool
+    '''
+
+    def test_leaked_connections(self):
+        self.query()
+        pool = connections[self.ALIAS].pool
+        connections[self.ALIAS].close()
+        threads = [threading.Thread(target=self.query) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gc.collect()
+        self.assertEqual(pool.snapshot()["in_use"], 0)
+
+        # a pool that stays exhausted fails the request instead of hanging it
+        blocked = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            self.query()
+            blocked.set()
+            release.wait()
+            connections[self.ALIAS].close()
+
+        holders = [threading.Thread(target=hold) for _ in range(2)]
+        for holder in holders:
+            holder.start()
+        blocked.wait()
+        try:
+            while pool.snapshot()["in_use"] < 2:
+                pass
+            with self.assertRaises(OperationalError):
+                self.query()
+        finally:
+            release.set()
+            for holder in holders:
+                holder.join()
+
+
+    '''
+     Tests that the state and counters of the pool are exported to Prometheus
+    '''
+
+    def test_metrics(self):
+        registry = CollectorRegistry()
+        registry.register(PoolCollector())
+        labels = {"alias": self.ALIAS, "pid": str(os.getpid())}
+        self.query()
+        # the pools of the other tests of this alias add up with this one
+        stats = pool_stats()[self.ALIAS]
+        for gauge in ("in_use", "idle"):
+            self.assertEqual(registry.get_sample_value("mentorq_db_pool_" + gauge, labels), stats[gauge])
+        for counter in ("waits", "timeouts", "ping_failures"):
+            self.assertEqual(registry.get_sample_value("mentorq_db_pool_{}_total".format(counter), labels),
+                             stats[counter])
+        in_use = registry.get_sample_value("mentorq_db_pool_in_use", labels)
+        connections[self.ALIAS].close()
+        self.assertEqual(registry.get_sample_value("mentorq_db_pool_in_use", labels), in_use - 1)
+
+
+@unittest.skipUnless(os.getenv("POSTGRES_TEST_DB"), "set POSTGRES_TEST_DB (and POSTGRES_USER, ...) to run")
+class PostgresPooledBackendTestCase(PooledBackendTestCase):
+    def database(self):
+        return {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_TEST_DB"),
+            "USER": os.getenv("POSTGRES_USER", ""),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+            "HOST": os.getenv("POSTGRES_HOST", "localhost"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+        }
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+
+from mentorq_api.models import Ticket
+from mentorq_user.fake_lcs import FakeLCS
+from mentorq_user.lcs import LCSDMLinkCache
+from mentorq_user.models import MentorqUser
+from mentorq_user.serializers import MentorqTokenObtainPairSerializer
+
+LINK = "https://hackru.slack.com/app_redirect?channel=fake-hacker@example.com-mentor@example.com"
+
+
+class SlackDMViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lcs = FakeLCS().install()
+        self.addCleanup(self.lcs.uninstall)
+
+    def client_for(self, email, lcs_token):
+        user = MentorqUser.objects.create(email=email, lcs_token=lcs_token)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer " + str(
+            MentorqTokenObtainPairSerializer.get_token(user).access_token))
+        return client
+
+    def ticket(self, owner_email="hacker@example.com"):
+        return Ticket.objects.create(owner_email=owner_email, owner="Hacker", title="Help", location="Table 1",
+                                     status=Ticket.StatusType.CLAIMED, mentor="Mentor",
+                                     mentor_email="mentor@example.com")
+
+    '''
+     Tests that both sides of a ticket get the link LCS created once for the pair
+    '''
+
+    def test_link_cached_for_pair(self):
+        path = "/api/tickets/{}/slack-dm/".format(self.ticket().pk)
+        hacker = self.client_for("hacker@example.com", "hacker-token")
+        mentor = self.client_for("mentor@example.com", "mentor-token")
+        for client in (mentor, mentor, hacker):
+            response = client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), LINK)
+        self.assertEqual(self.lcs.calls["/slack-dm"], 1)
+
+    '''
+     Tests that errors LCS answers for the pair are cached as well
+    '''
+
+    def test_errors(self):
+        path = "/api/tickets/{}/slack-dm/".format(self.ticket(owner_email="nobody@example.com").pk)
+        mentor = self.client_for("mentor@example.com", "mentor-token")
+        for _ in range(2):
+            self.assertEqual(mentor.get(path).status_code, 400)
+        self.assertEqual(self.lcs.calls["/slack-dm"], 1)
+
+
+class DMLinkCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.dm_link_cache = LCSDMLinkCache(ttl=60, error_ttl=60)
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        time.sleep(0.1)
+        return 200, LINK
+
+    '''
+     Tests that concurrent lookups of the same pair share one call to LCS
+    '''
+
+    def test_single_flight(self):
+        answers = []
+        threads = [threading.Thread(target=lambda email: answers.append(
+            self.dm_link_cache.get(email, "other@example.com", self.fetch)), args=(email,))
+            for email in ("a@example.com", "A@example.com") * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(answers, [(200, LINK)] * 8)
+        self.assertEqual(self.fetches, 1)
+        stats = self.dm_link_cache.stats.snapshot()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"] + stats["coalesced"], 7)
+
+    '''
+     Tests that errors about the credentials of the user asking aren't cached
+    '''
+
+    def test_credential_errors(self):
+        for _ in range(2):
+            self.assertEqual(self.dm_link_cache.get("a@example.com", "b@example.com", lambda: (403, "Invalid token")),
+                             (403, "Invalid token"))
+        self.assertEqual(self.dm_link_cache.stats.snapshot()["misses"], 2)
+
+    '''
+     Tests that concurrent coroutines share one call to LCS as well
+    '''
+
+    def test_single_flight_async(self):
+        async def fetch():
+            self.fetches += 1
+            await asyncio.sleep(0.1)
+            return 200, LINK
+
+        async def get_all():
+            return await asyncio.gather(*(self.dm_link_cache.get_async("a@example.com", "b@example.com", fetch)
+                                          for _ in range(8)))
+
+        self.assertEqual(asyncio.run(get_all()), [(200, LINK)] * 8)
+        self.assertEqual(self.fetches, 1)
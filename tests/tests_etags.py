@@ -0,0 +1,100 @@
+from django.test import TestCase
+
+from mentorq_api.models import Ticket, Feedback
+from tests.utils import client_for
+
+
+class ETagTestCase(TestCase):
+    def setUp(self):
+        self.hacker = client_for("hacker@example.com")
+        self.mentor = client_for("mentor@example.com", mentor=True)
+        self.director = client_for("director@example.com", director=True)
+        self.tickets = [Ticket.objects.create(owner_email="hacker@example.com", title="ticket {}".format(i),
+                                              location="table") for i in range(3)]
+
+    # fetches url, then fetches it again with the ETag it returned, returning both responses
+    def revalidate(self, client, url, queries=None):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response)
+        if queries is None:
+            return response, client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        with self.assertNumQueries(queries):
+            return response, client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    '''
+     Tests that an unchanged list is answered with a 304 from a single query, and a changed one with the new list
+    '''
+
+    def test_list(self):
+        response, revalidated = self.revalidate(self.mentor, "/api/tickets/", queries=1)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated.content, b"")
+        self.assertEqual(revalidated["ETag"], response["ETag"])
+        self.assertIn("Authorization", revalidated["Vary"])
+
+        self.tickets[0].transition(Ticket.StatusType.CLAIMED, mentor_email="mentor@example.com")
+        changed = self.mentor.get("/api/tickets/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+        self.assertEqual(changed.json()[0]["status"], "CLAIMED")
+
+        # closing takes the ticket out of the mentors' list
+        self.tickets[1].transition(Ticket.StatusType.CLOSED)
+        changed = self.mentor.get("/api/tickets/", HTTP_IF_NONE_MATCH=changed["ETag"])
+        self.assertEqual((changed.status_code, len(changed.json())), (200, 2))
+
+    '''
+     Tests that the ETag of a list is the same whether or not the client sent one
+    '''
+
+    def test_list_etag_stable(self):
+        etag = self.director.get("/api/tickets/")["ETag"]
+        self.assertEqual(self.director.get("/api/tickets/", HTTP_IF_NONE_MATCH='"other"')["ETag"], etag)
+
+    '''
+     Tests that users who get different bodies get different ETags
+    '''
+
+    def test_per_user(self):
+        etag = self.hacker.get("/api/tickets/")["ETag"]
+        self.assertNotEqual(self.director.get("/api/tickets/")["ETag"], etag)
+        self.assertEqual(self.director.get("/api/tickets/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    '''
+     Tests conditional GETs of a single ticket, a page and the stats
+    '''
+
+    def test_detail_page_and_stats(self):
+        url = "/api/tickets/{}/".format(self.tickets[0].pk)
+        response, revalidated = self.revalidate(self.hacker, url, queries=1)
+        self.assertEqual(revalidated.status_code, 304)
+        self.tickets[0].comment = "more details"
+        self.tickets[0].save()
+        self.assertEqual(self.hacker.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+        _, revalidated = self.revalidate(self.director, "/api/tickets/?page_size=2")
+        self.assertEqual(revalidated.status_code, 304)
+
+        response, revalidated = self.revalidate(self.director, "/api/tickets/stats/", queries=1)
+        self.assertEqual(revalidated.status_code, 304)
+        Ticket.objects.create(owner_email="hacker@example.com", title="ticket", location="table")
+        self.assertEqual(self.director.get("/api/tickets/stats/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code,
+                         200)
+
+    '''
+     Tests that feedback revalidates against the version of its ticket, which changes with the feedback
+    '''
+
+    def test_feedback(self):
+        self.tickets[0].transition(Ticket.StatusType.CLOSED)
+        feedback = Feedback.objects.create(ticket=self.tickets[0], rating=3, comments="")
+        etags = {}
+        for url in ("/api/feedback/", "/api/feedback/{}/".format(feedback.pk)):
+            response, revalidated = self.revalidate(self.director, url, queries=1)
+            self.assertEqual(revalidated.status_code, 304)
+            etags[url] = response["ETag"]
+        feedback.rating = 5
+        feedback.save()
+        for url, etag in etags.items():
+            self.assertEqual(self.director.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
@@ -0,0 +1,176 @@
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from mentorq_api.events import InProcessBroker, get_broker
+from mentorq_api.models import Ticket, TicketStats, ChangeSequence
+from mentorq_api.sse import TicketEventStream, visible_event
+from tests.utils import access_token, token_user
+
+
+class BrokerTestCase(TestCase):
+    '''
+     Tests that events published from other threads reach subscribers and that slow subscribers are dropped
+    '''
+
+    def test_publish(self):
+        broker = InProcessBroker()
+
+        async def subscribe():
+            subscription = broker.subscribe(2)
+            threading.Thread(target=broker.publish, args=({"id": 1},)).start()
+            self.assertEqual(await asyncio.wait_for(subscription.get(), 5), {"id": 1})
+            for event_id in range(2, 5):
+                broker.publish({"id": event_id})
+            await asyncio.sleep(0)
+            self.assertIsNone(await subscription.get())
+            self.assertTrue(subscription.queue.empty())
+            subscription.close()
+            self.assertEqual(broker.subscribers, 0)
+
+        asyncio.run(subscribe())
+
+    '''
+     Tests that events are filtered like the ticket list
+    '''
+
+    def test_visible_event(self):
+        event = {"id": 3, "event": "closed", "data": {"id": 1, "version": 3, "status": "CLOSED",
+                                                      "owner_email": "hacker@example.com", "title": "secret"}}
+        self.assertEqual(visible_event(event, token_user("hacker@example.com").lcs_profile), event)
+        self.assertIsNone(visible_event(event, token_user("other@example.com").lcs_profile))
+        self.assertEqual(visible_event(event, token_user("director@example.com", director=True).lcs_profile), event)
+        self.assertEqual(visible_event(event, token_user("mentor@example.com", mentor=True).lcs_profile)["data"],
+                         {"id": 1, "version": 3, "status": "CLOSED"})
+
+
+# uses TransactionTestCase since events are published once a transaction commits and the replay reads the database
+# from another thread
+class EventStreamTestCase(TransactionTestCase):
+    def setUp(self):
+        TicketStats.rebuild()
+        # the broker the models publish to
+        self.broker = get_broker()
+        self.stream = TicketEventStream(keepalive=0.05)
+
+    # runs the stream while calling act() (in a thread), returning the status and body the client received
+    # (the headers are kept in self.response_headers)
+    def run_stream(self, act=lambda: None, query="", headers=(), until=b""):
+        body = []
+
+        async def client():
+            disconnect = asyncio.Event()
+            sent = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                body.append(message)
+                sent.set()
+
+            scope = {"type": "http", "method": "GET", "path": TicketEventStream.PATH,
+                     "query_string": query.encode(), "headers": list(headers)}
+            task = asyncio.ensure_future(self.stream(scope, receive, send))
+            while self.broker.subscribers == 0 and not task.done():
+                await asyncio.sleep(0.01)
+            await sync_to_async(act)()
+            for _ in range(200):
+                if until in b"".join(message.get("body", b"") for message in body) or task.done():
+                    break
+                await asyncio.sleep(0.01)
+            disconnect.set()
+            await asyncio.wait_for(task, 5)
+
+        asyncio.run(client())
+        self.response_headers = dict(body[0].get("headers", []))
+        return body[0].get("status"), b"".join(message.get("body", b"") for message in body).decode()
+
+    def token(self, email, **roles):
+        return "access_token=" + str(access_token(email, **roles))
+
+    '''
+     Tests that requests without a valid token are rejected
+    '''
+
+    def test_unauthenticated(self):
+        self.assertEqual(self.run_stream()[0], 401)
+        self.assertEqual(self.run_stream(query="access_token=nope")[0], 401)
+
+    '''
+     Tests that the stream and its errors carry the CORS headers, so that EventSource can connect from another origin
+    '''
+
+    def test_cors(self):
+        origin = (b"origin", b"https://mentorq.example.com")
+        self.assertEqual(self.run_stream(headers=[origin])[0], 401)
+        self.assertEqual(self.response_headers[b"access-control-allow-origin"], b"*")
+        status, _ = self.run_stream(query=self.token("hacker@example.com"), headers=[origin], until=b"retry")
+        self.assertEqual(status, 200)
+        self.assertEqual(self.response_headers[b"access-control-allow-origin"], b"*")
+        self.assertEqual(self.response_headers[b"vary"], b"Origin")
+
+    '''
+     Tests that ticket changes are streamed to the clients that can see them, with keepalives in between
+    '''
+
+    def test_live_events(self):
+        ticket = Ticket.objects.create(owner_email="hacker@example.com", title="ticket", location="table")
+
+        def claim():
+            Ticket.objects.get(pk=ticket.pk).transition(Ticket.StatusType.CLAIMED, mentor_email="mentor@example.com")
+
+        status, body = self.run_stream(claim, query=self.token("hacker@example.com"), until=b"event: claimed")
+        self.assertEqual(status, 200)
+        self.assertIn("event: claimed", body)
+        self.assertIn('"mentor_email":"mentor@example.com"', body)
+
+        def close():
+            Ticket.objects.get(pk=ticket.pk).transition(Ticket.StatusType.CLOSED)
+
+        status, body = self.run_stream(close, query=self.token("other@example.com"), until=b": keepalive")
+        self.assertNotIn("event:", body)
+        self.assertIn(": keepalive", body)
+
+    '''
+     Tests that changes made by other processes, which aren't published in this one, reach the stream as well
+    '''
+
+    def test_other_process(self):
+        ticket = Ticket.objects.create(owner_email="hacker@example.com", title="ticket", location="table")
+
+        def rename():
+            with transaction.atomic():
+                Ticket.objects.filter(pk=ticket.pk).update(
+                    title="renamed", version=ChangeSequence.next_value(ChangeSequence.TICKETS))
+
+        status, body = self.run_stream(rename, query=self.token("hacker@example.com"), until=b"event: updated")
+        self.assertEqual(status, 200)
+        self.assertIn("event: updated", body)
+        self.assertIn('"title":"renamed"', body)
+        self.assertEqual(self.broker.subscribers, 0)
+
+    '''
+     Tests that a client resuming from a Last-Event-ID gets the changes it missed, or a reset if it missed too many
+    '''
+
+    def test_resume(self):
+        tickets = [Ticket.objects.create(owner_email="hacker@example.com", title="ticket", location="table")
+                   for _ in range(3)]
+        last_seen = tickets[0].version
+        tickets[2].delete()
+        headers = [(b"last-event-id", str(last_seen).encode())]
+        status, body = self.run_stream(query=self.token("director@example.com", director=True), headers=headers,
+                                       until=b"event: deleted")
+        self.assertEqual(body.count("event: updated"), 1)
+        self.assertIn("event: deleted", body)
+        self.assertNotIn('"id":{},'.format(tickets[0].pk), body.split("event: deleted")[0])
+
+        self.stream.replay_limit = 1
+        status, body = self.run_stream(query=self.token("director@example.com", director=True), headers=headers,
+                                       until=b"event: reset")
+        self.assertIn("event: reset", body)
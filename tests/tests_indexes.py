@@ -0,0 +1,85 @@
+import re
+
+from django.db import connection
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+
+from mentorq_api.models import Ticket
+from mentorq_api.views import TicketViewSet, FeedbackViewSet
+from tests.utils import token_user
+
+HACKER = token_user("hacker3@example.com")
+MENTOR = token_user("mentor@example.com", mentor=True)
+DIRECTOR = token_user("director@example.com", director=True, organizer=True)
+
+
+# returns the queryset a viewset lists for the given user
+def listed_queryset(viewset, user):
+    view = viewset(kwargs={"lcs_profile": user.lcs_profile}, request=APIRequestFactory().get("/"))
+    return view.get_queryset()
+
+
+class IndexTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        statuses = list(Ticket.StatusType)
+        Ticket.objects.bulk_create([
+            Ticket(owner_email="hacker{}@example.com".format(i % 50), title="ticket", location="table",
+                   status=statuses[i % len(statuses)], mentor_email="mentor{}@example.com".format(i % 7))
+            for i in range(500)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    # asserts that the query plan reads the ticket table through an index rather than scanning it
+    def assertUsesIndex(self, queryset):
+        if connection.vendor == "sqlite":
+            plan = queryset.explain()
+            table_steps = [line for line in plan.splitlines() if re.search(r"\bmentorq_api_ticket\b", line)]
+            self.assertTrue(table_steps, plan)
+            for step in table_steps:
+                self.assertRegex(step, r"USING (COVERING |INTEGER PRIMARY KEY|INDEX)", plan)
+        else:
+            plan = queryset.explain()
+            self.assertNotIn("Seq Scan on mentorq_api_ticket", plan, plan)
+
+    '''
+     Tests that hackers' ticket lists use the owner index
+    '''
+
+    def test_hacker_list(self):
+        queryset = listed_queryset(TicketViewSet, HACKER)
+        self.assertUsesIndex(queryset)
+        self.assertUsesIndex(queryset.order_by("created_datetime", "id"))
+
+    '''
+     Tests that mentors' ticket lists only read the index of tickets that aren't closed
+    '''
+
+    def test_mentor_list(self):
+        queryset = listed_queryset(TicketViewSet, MENTOR).order_by("created_datetime", "id")
+        self.assertUsesIndex(queryset)
+        self.assertIn("ticket_unclosed_idx", queryset.explain())
+
+    '''
+     Tests that directors page through the tickets along the creation index
+    '''
+
+    def test_director_pages(self):
+        queryset = listed_queryset(TicketViewSet, DIRECTOR).order_by("created_datetime", "id")
+        self.assertUsesIndex(queryset[:100])
+
+    '''
+     Tests that the status and mentor filters use their indexes
+    '''
+
+    def test_status_and_mentor_filters(self):
+        self.assertUsesIndex(Ticket.objects.filter(status=Ticket.StatusType.OPEN))
+        self.assertUsesIndex(Ticket.objects.filter(mentor_email="mentor1@example.com"))
+
+    '''
+     Tests that hackers' feedback lists find their tickets through the owner index
+    '''
+
+    def test_feedback_list(self):
+        self.assertUsesIndex(listed_queryset(FeedbackViewSet, HACKER))
@@ -0,0 +1,190 @@
+import asyncio
+import gc
+import socket
+import threading
+import time
+import warnings
+from unittest import mock
+
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from lcs_client import InternalServerError
+from rest_framework.test import APIClient
+
+from mentorq_user import lcs_async
+from mentorq_user.fake_lcs import FakeLCS, make_profile, make_server
+from mentorq_user.lcs import install_transport, profile_cache, reset_transport
+from mentorq_user.lcs_transport import LCSTransport, LCSUnavailable
+
+'''
+The transport lcs_client calls go through, against the fake LCS served over HTTP
+'''
+
+
+# a URL nothing listens on
+def closed_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return "http://127.0.0.1:{}".format(sock.getsockname()[1])
+
+
+class TransportTestCase(SimpleTestCase):
+    def setUp(self):
+        self.lcs = FakeLCS()
+        server = make_server(self.lcs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = "http://{}:{}".format(*server.server_address)
+
+    def transport(self, **kwargs):
+        options = dict(retries=2, backoff=0, breaker_threshold=5, breaker_reset=30)
+        options.update(kwargs)
+        return LCSTransport(**options)
+
+    '''
+     Tests that answered calls are returned as they are and counted by endpoint
+    '''
+
+    def test_request(self):
+        transport = self.transport(base_url=self.url)
+        for _ in range(3):
+            response = transport.post("/validate", json={"token": "mentor-token"})
+            self.assertEqual(response.json()["body"]["email"], "mentor@example.com")
+        stats = transport.stats.snapshot()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["endpoints"]["/validate"]["requests"], 3)
+        self.assertEqual(stats["failures"], 0)
+
+    '''
+     Tests that calls that get no answer are retried and then fail
+    '''
+
+    def test_retries(self):
+        transport = self.transport(base_url=closed_url())
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            transport.post("/validate", json={"token": "mentor-token"})
+        stats = transport.stats.snapshot()
+        self.assertEqual(stats["connection_errors"], 3)
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["failures"], 1)
+
+        self.lcs.latency = 0.3
+        transport = self.transport(base_url=self.url, read_timeout=0.05, retries=1)
+        with self.assertRaises(requests.exceptions.Timeout):
+            transport.post("/validate", json={"token": "mentor-token"})
+        self.assertEqual(transport.stats.snapshot()["timeouts"], 2)
+
+    '''
+     Tests that LCS errors are returned to lcs_client without retrying them but count as failures
+    '''
+
+    def test_server_errors(self):
+        self.lcs.error_rate = 1.0
+        transport = self.transport(base_url=self.url)
+        response = transport.post("/validate", json={"token": "mentor-token"})
+        with self.assertRaises(InternalServerError):
+            InternalServerError.check(response)
+        self.assertEqual(self.lcs.calls["/validate"], 1)
+        self.assertEqual(transport.stats.snapshot()["server_errors"], 1)
+        self.assertEqual(transport.stats.snapshot()["failures"], 1)
+
+    '''
+     Tests that the breaker fails calls fast once LCS keeps failing and lets them through again once it recovers
+    '''
+
+    def test_circuit_breaker(self):
+        transport = self.transport(base_url=closed_url(), retries=0, breaker_threshold=2, breaker_reset=0.1)
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                transport.post("/validate", json={"token": "mentor-token"})
+        self.assertEqual(transport.breaker.state, "open")
+        with self.assertRaises(LCSUnavailable):
+            transport.post("/validate", json={"token": "mentor-token"})
+        stats = transport.stats.snapshot()
+        self.assertEqual((stats["requests"], stats["short_circuits"], stats["breaker_opens"]), (2, 1, 1))
+
+        # a failed probe opens the breaker again, a successful one closes it
+        time.sleep(0.1)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            transport.post("/validate", json={"token": "mentor-token"})
+        self.assertEqual(transport.breaker.state, "open")
+        time.sleep(0.1)
+        transport.base_url = self.url
+        transport.post("/validate", json={"token": "mentor-token"})
+        self.assertEqual(transport.breaker.state, "closed")
+
+    '''
+     Tests that coroutines get the same retries
+    '''
+
+    def test_call_async(self):
+        transport = self.transport()
+        attempts = []
+
+        async def send():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise requests.exceptions.Timeout()
+            return transport.session.post(self.url + "/validate", json={"token": "mentor-token"})
+
+        response = asyncio.run(transport.call_async("/validate", send))
+        self.assertEqual(response.json()["statusCode"], 200)
+        self.assertEqual(transport.stats.snapshot()["retries"], 1)
+
+
+    '''
+     Tests that the httpx client of an event loop is closed when the loop shuts down, without warnings
+    '''
+
+    def test_async_client_closed(self):
+        async def send():
+            status_code, _ = await lcs_async.httpx_post("/validate", {"token": "mentor-token"})
+            return status_code, await lcs_async._client()
+
+        with mock.patch("lcs_client.get_base_url", return_value=self.url), \
+                warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            status_code, client = asyncio.run(send())
+            gc.collect()
+        self.assertEqual(status_code, 200)
+        self.assertTrue(client.is_closed)
+        self.assertFalse([warning for warning in caught if "Unclosed" in str(warning.message)])
+        self.assertEqual(len(lcs_async._clients), 0)
+
+
+class OutageTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.transport = LCSTransport(base_url=closed_url(), retries=0, breaker_threshold=1)
+        install_transport(self.transport.post, self.transport.get)
+        self.addCleanup(reset_transport)
+
+    def cache_profile(self, age):
+        profile = make_profile("mentor@example.com", "Mentor", roles=("mentor",))
+        key = profile_cache.key("mentor@example.com", "mentor-token")
+        profile_cache.cache.set(key, (profile, time.time() - age))
+
+    def obtain_token(self):
+        return APIClient().post("/api/auth/token/", {"email": "mentor@example.com", "lcs_token": "mentor-token"})
+
+    '''
+     Tests that credentials whose profile is still cached are accepted while LCS is down
+    '''
+
+    def test_cached_profile(self):
+        self.cache_profile(age=profile_cache.ttl + profile_cache.stale_ttl + 1)
+        response = self.obtain_token()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.transport.stats.snapshot()["requests"], 1)
+        self.assertGreaterEqual(profile_cache.stats.snapshot()["outage_hits"], 1)
+
+    '''
+     Tests that other credentials are still rejected while LCS is down
+    '''
+
+    def test_no_cached_profile(self):
+        self.assertEqual(self.obtain_token().status_code, 401)
+        self.cache_profile(age=profile_cache.max_age)
+        self.assertEqual(self.obtain_token().status_code, 401)
@@ -0,0 +1,52 @@
+from django.db.models import Avg
+from django.test import TestCase
+
+from mentorq_api.models import Ticket, Feedback, MentorRating
+from tests.utils import client_for
+
+
+# the leaderboard as it was computed before the mentor rating rollup
+def grouped_leaderboard(limit):
+    queryset = Feedback.objects.values("ticket__mentor_email").annotate(average_rating=Avg("rating")) \
+        .order_by("-average_rating", "ticket__mentor_email")
+    return [{"mentor": row["ticket__mentor_email"], "average_rating": row["average_rating"]}
+            for row in queryset[:limit]]
+
+
+class LeaderboardTestCase(TestCase):
+    def setUp(self):
+        self.client = client_for("director@example.com", director=True)
+        for i in range(12):
+            self.rate("mentor{}@example.com".format(i % 4), i % 5 + 1)
+
+    def rate(self, mentor_email, rating):
+        ticket = Ticket.objects.create(owner_email="hacker@example.com", title="ticket", location="table",
+                                       mentor_email=mentor_email, status=Ticket.StatusType.CLOSED)
+        return Feedback.objects.create(ticket=ticket, rating=rating, comments="")
+
+    '''
+     Tests that the leaderboard ranks like the grouped query, with a single query
+    '''
+
+    def test_ranking(self):
+        self.assertEqual(self.client.get("/api/feedback/leaderboard/").json(), grouped_leaderboard(5))
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/feedback/leaderboard/?limit=3")
+        self.assertEqual(response.json(), grouped_leaderboard(3))
+
+    '''
+     Tests that new feedback, changed ratings and reassigned tickets show up on the leaderboard
+    '''
+
+    def test_updates(self):
+        self.client.get("/api/feedback/leaderboard/")
+        feedback = self.rate("mentor9@example.com", 5)
+        self.assertEqual(self.client.get("/api/feedback/leaderboard/?limit=10").json(), grouped_leaderboard(10))
+        feedback = Feedback.objects.get(pk=feedback.pk)
+        feedback.rating = 1
+        feedback.save()
+        ticket = Ticket.objects.get(pk=feedback.pk)
+        ticket.mentor_email = "mentor0@example.com"
+        ticket.save()
+        self.assertEqual(self.client.get("/api/feedback/leaderboard/?limit=10").json(), grouped_leaderboard(10))
+        self.assertEqual(MentorRating.verify(), [])
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from prometheus_client import CollectorRegistry, REGISTRY, multiprocess
+from rest_framework.test import APIClient
+
+from mentorq_api.models import Ticket
+from mentorq_user.fake_lcs import FakeLCS
+from mentorq_user.models import MentorqUser
+from tests.utils import access_token
+
+
+def sample(name, registry=REGISTRY, **labels):
+    return registry.get_sample_value(name, labels) or 0
+
+
+@override_settings(MENTORQ_METRICS=True)
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lcs = FakeLCS().install()
+        self.addCleanup(self.lcs.uninstall)
+        user = MentorqUser.objects.create(email="mentor@example.com", lcs_token="mentor-token")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(
+            access_token("mentor@example.com", mentor=True, user_id=user.pk)))
+
+    '''
+     Tests that requests, their queries and the LCS calls they make are counted, and that the ticket gauges are served
+    '''
+
+    def test_metrics(self):
+        Ticket.objects.create(owner_email="hacker@example.com", owner="Hacker", title="Help", location="Table 1")
+        requests = sample("mentorq_request_duration_seconds_count", view="ticket-list", method="GET", status="200")
+        queries = sample("mentorq_db_queries_total", view="ticket-list")
+        lcs_calls = sample("mentorq_lcs_request_duration_seconds_count", endpoint="/read")
+        self.assertEqual(self.client.get("/api/tickets/").status_code, 200)
+
+        self.assertEqual(sample("mentorq_request_duration_seconds_count", view="ticket-list", method="GET",
+                                status="200"), requests + 1)
+        self.assertGreater(sample("mentorq_db_queries_total", view="ticket-list"), queries)
+        self.assertEqual(sample("mentorq_lcs_request_duration_seconds_count", endpoint="/read"), lcs_calls + 1)
+
+        response = APIClient().get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'mentorq_tickets{status="OPEN"} 1.0', response.content)
+        self.assertIn(b'mentorq_tickets{status="CLAIMED"} 0.0', response.content)
+        self.assertIn(b'mentorq_request_duration_seconds_bucket{le="0.005",method="GET",status="200",'
+                      b'view="ticket-list"}', response.content)
+
+    '''
+     Tests that failed LCS calls are counted by kind
+    '''
+
+    def test_lcs_errors(self):
+        self.lcs.error_rate = 1.0
+        errors = sample("mentorq_lcs_errors_total", endpoint="/validate", kind="server_error")
+        self.client.get("/api/tickets/")
+        self.assertEqual(sample("mentorq_lcs_errors_total", endpoint="/validate", kind="server_error"), errors + 1)
+
+    '''
+     Tests that the endpoint is only served with the token when one is set, and not at all when disabled
+    '''
+
+    def test_access(self):
+        with override_settings(MENTORQ_METRICS_TOKEN="secret"):
+            self.assertEqual(APIClient().get("/metrics").status_code, 401)
+            self.assertEqual(APIClient().get("/metrics", HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+        with override_settings(MENTORQ_METRICS=False):
+            self.assertEqual(APIClient().get("/metrics").status_code, 404)
+
+
+# records a request in a separate process
+CHILD = """
+from mentorq_main import metrics
+metrics.observe_request("ticket-list", "GET", 200, 0.05, 3)
+"""
+
+# loads the application and its URLs, and prints whether prometheus_client was imported
+BOOT = """
+import sys
+from mentorq_main import asgi, urls
+from mentorq_user import lcs, lcs_async, lcs_transport
+print("prometheus_client" in sys.modules)
+"""
+
+
+class MultiProcessMetricsTestCase(SimpleTestCase):
+    '''
+     Tests that the metrics of several worker processes add up
+    '''
+
+    def test_aggregation(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = dict(os.environ, prometheus_multiproc_dir=directory.name)
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", CHILD], env=env, cwd=settings.BASE_DIR, check=True)
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=directory.name)
+        labels = {"view": "ticket-list", "method": "GET", "status": "200"}
+        self.assertEqual(sample("mentorq_request_duration_seconds_count", registry, **labels), 2)
+        self.assertEqual(sample("mentorq_request_duration_seconds_sum", registry, **labels), 0.1)
+        self.assertEqual(sample("mentorq_db_queries_total", registry, view="ticket-list"), 6)
+
+    '''
+     Tests that prometheus_client isn't loaded when metrics are disabled
+    '''
+
+    def test_disabled(self):
+        env = {name: value for name, value in os.environ.items() if name != "MENTORQ_METRICS"}
+        child = subprocess.run([sys.executable, "-c", BOOT], env=env, cwd=settings.BASE_DIR, check=True,
+                               stdout=subprocess.PIPE)
+        self.assertEqual(child.stdout.strip(), b"False")
@@ -0,0 +1,132 @@
+import threading
+
+import jwt
+import lcs_client
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from mentorq_main.settings.local import SECRET_KEY
+from mentorq_user.fake_lcs import FakeLCS, make_server
+
+'''
+The same flows as tests_auth_token.py, but against the in-process fake LCS so that they run without network access
+'''
+
+
+def connect_to_mentorq(client, email, lcs_token):
+    result = client.post(path="/api/auth/token/", data={"email": email, "lcs_token": lcs_token})
+    assert result.status_code == 200, result.content
+    return result.json()
+
+
+class OfflineTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lcs = FakeLCS().install()
+        self.addCleanup(self.lcs.uninstall)
+        self.client = APIClient()
+
+    # logs in to the fake LCS and then to mentorq, returning the decoded refresh token
+    def login(self, email, password, client=None):
+        token = lcs_client.login(email=email, password=password)
+        tokens = connect_to_mentorq(client or self.client, email, token)
+        if client is not None:
+            client.credentials(HTTP_AUTHORIZATION="Bearer " + tokens["access"])
+        return jwt.decode(tokens["refresh"], SECRET_KEY)
+
+
+class OfflineAuthTestCase(OfflineTestCase):
+    '''
+     Tests that the role claims in the Mentorq token match the roles in LCS
+    '''
+
+    def test_roles(self):
+        self.assertFalse(self.login("hacker@example.com", "hacker")["mentor"])
+        self.assertTrue(self.login("mentor@example.com", "mentor")["mentor"])
+        director = self.login("director@example.com", "director")
+        self.assertTrue(director["director"])
+        self.assertTrue(director["organizer"])
+
+    '''
+     Tests that invalid LCS tokens are rejected
+    '''
+
+    def test_invalid_token(self):
+        result = self.client.post(path="/api/auth/token/", data={"email": "hacker@example.com", "lcs_token": "nope"})
+        self.assertEqual(result.status_code, 401)
+
+    '''
+     Tests that LCS errors surface as authentication failures
+    '''
+
+    def test_lcs_errors(self):
+        self.lcs.error_rate = 1.0
+        result = self.client.post(path="/api/auth/token/",
+                                  data={"email": "hacker@example.com", "lcs_token": "hacker-token"})
+        self.assertEqual(result.status_code, 401)
+
+
+class OfflineTicketTestCase(OfflineTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hacker, self.mentor, self.director = APIClient(), APIClient(), APIClient()
+        self.login("hacker@example.com", "hacker", self.hacker)
+        self.login("mentor@example.com", "mentor", self.mentor)
+        self.login("director@example.com", "director", self.director)
+
+    '''
+     Tests a ticket from creation through claim, close and feedback
+    '''
+
+    def test_ticket_lifecycle(self):
+        ticket = self.hacker.post("/api/tickets/", {
+            "owner_email": "hacker@example.com", "title": "segfault", "location": "table 4"
+        }).json()
+        self.assertEqual(ticket["status"], "OPEN")
+
+        response = self.mentor.patch("/api/tickets/{}/".format(ticket["id"]), {
+            "status": "CLAIMED", "mentor": "Mentor Person", "mentor_email": "mentor@example.com"
+        })
+        self.assertEqual(response.json()["status"], "CLAIMED")
+
+        response = self.mentor.get("/api/tickets/{}/slack-dm/".format(ticket["id"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("slack", response.json())
+
+        self.hacker.patch("/api/tickets/{}/".format(ticket["id"]), {"status": "CLOSED"})
+        response = self.hacker.post("/api/feedback/", {"ticket": ticket["id"], "rating": 5, "comments": "great"})
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.mentor.get("/api/tickets/").json(), [])
+        self.assertEqual(len(self.director.get("/api/feedback/").json()), 1)
+        self.assertEqual(self.director.get("/api/feedback/leaderboard/").json(),
+                         [{"mentor": "mentor@example.com", "average_rating": 5.0}])
+        stats = self.director.get("/api/tickets/stats/").json()
+        self.assertEqual(stats["Closed Tickets"], 1)
+
+    '''
+     Tests that hackers cannot open tickets for somebody else
+    '''
+
+    def test_create_on_behalf(self):
+        response = self.hacker.post("/api/tickets/", {
+            "owner_email": "mentor@example.com", "title": "segfault", "location": "table 4"
+        })
+        self.assertEqual(response.status_code, 403)
+
+
+class FakeLCSServerTestCase(TestCase):
+    '''
+     Tests that lcs_client can talk to the fake LCS over HTTP
+    '''
+
+    def test_http_server(self):
+        server = make_server(FakeLCS())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.addCleanup(lcs_client.set_root_url, lcs_client.LCS_ROOT_URL)
+        lcs_client.set_root_url("http://{}:{}".format(*server.server_address))
+        token = lcs_client.login(email="mentor@example.com", password="mentor")
+        self.assertTrue(lcs_client.User(token=token).profile()["role"]["mentor"])
@@ -0,0 +1,60 @@
+from django.test import TestCase
+
+from mentorq_api.models import Ticket, Feedback
+from tests.utils import client_for
+
+
+class PaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = client_for("director@example.com", director=True)
+        self.tickets = [Ticket.objects.create(owner_email="hacker@example.com", title="ticket {}".format(i),
+                                              location="table", status=Ticket.StatusType.CLOSED, mentor_email="m@x.co")
+                        for i in range(25)]
+        # tickets created in the same instant are ordered by id
+        Ticket.objects.filter(pk__in=[ticket.pk for ticket in self.tickets[5:15]]) \
+            .update(created_datetime=self.tickets[5].created_datetime)
+        for ticket in self.tickets:
+            Feedback.objects.create(ticket=ticket, rating=5, comments="")
+
+    def pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url).json()
+            ids += [row["id"] if "id" in row else row["ticket"] for row in response["results"]]
+            url = response["next"]
+            yield ids
+
+    '''
+     Tests that requests without pagination parameters still get the whole list
+    '''
+
+    def test_not_paginated_by_default(self):
+        self.assertEqual(len(self.client.get("/api/tickets/").json()), 25)
+
+    '''
+     Tests that pages cover every ticket exactly once, even with inserts and status changes in between
+    '''
+
+    def test_pages_are_stable(self):
+        for ids in self.pages("/api/tickets/?page_size=10"):
+            Ticket.objects.create(owner_email="hacker@example.com", title="late", location="table")
+            Ticket.objects.filter(pk=ids[-1]).update(status=Ticket.StatusType.OPEN)
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertTrue(set(ticket.pk for ticket in self.tickets) <= set(ids))
+
+    '''
+     Tests that feedback is paginated in the order of its tickets
+    '''
+
+    def test_feedback_pages(self):
+        for ids in self.pages("/api/feedback/?page_size=7"):
+            pass
+        self.assertEqual(ids, [ticket.pk for ticket in self.tickets])
+
+    '''
+     Tests that malformed cursors are rejected
+    '''
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/tickets/?cursor=garbage").status_code, 404)
@@ -0,0 +1,69 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from mentorq_user.backends import MentorqUserBackend
+from mentorq_user.lcs import LCSProfileCache
+from mentorq_user.models import MentorqUser
+
+PROFILE = {"email": "hacker@example.com", "role": {"director": False, "mentor": False, "organizer": False}}
+
+
+class ProfileCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.profile_cache = LCSProfileCache(ttl=60, stale_ttl=60)
+
+    '''
+     Tests that a profile is fetched once and then served from the cache
+    '''
+
+    def test_hit_after_miss(self):
+        fetch = mock.Mock(return_value=PROFILE)
+        self.assertEqual(self.profile_cache.get("hacker@example.com", "token", fetch), PROFILE)
+        self.assertEqual(self.profile_cache.get("hacker@example.com", "token", fetch), PROFILE)
+        fetch.assert_called_once()
+        self.assertEqual(self.profile_cache.stats.snapshot()["hits"], 1)
+        self.assertEqual(self.profile_cache.stats.snapshot()["misses"], 1)
+
+    '''
+     Tests that an expired entry is still served while it is refreshed in the background
+    '''
+
+    def test_stale_while_revalidate(self):
+        fetch = mock.Mock(return_value=PROFILE)
+        self.profile_cache.get("hacker@example.com", "token", fetch)
+        with mock.patch("mentorq_user.lcs.time.time", return_value=self._fetched_at() + 90), \
+                mock.patch.object(self.profile_cache, "_refresh_in_background") as refresh:
+            self.assertEqual(self.profile_cache.get("hacker@example.com", "token", fetch), PROFILE)
+            refresh.assert_called_once()
+        fetch.assert_called_once()
+        self.assertEqual(self.profile_cache.stats.snapshot()["stale_hits"], 1)
+
+    '''
+     Tests that entries past the stale window are fetched synchronously
+    '''
+
+    def test_expired_entry_is_refetched(self):
+        fetch = mock.Mock(return_value=PROFILE)
+        self.profile_cache.get("hacker@example.com", "token", fetch)
+        with mock.patch("mentorq_user.lcs.time.time", return_value=self._fetched_at() + 150):
+            self.profile_cache.get("hacker@example.com", "token", fetch)
+        self.assertEqual(fetch.call_count, 2)
+
+    '''
+     Tests that authenticating with a new token invalidates the profile cached for the old one
+    '''
+
+    @mock.patch("mentorq_user.backends.validate_token")
+    def test_new_token_invalidates(self, validate_token):
+        MentorqUser.objects.create_user(email="hacker@example.com", lcs_token="old")
+        with mock.patch("mentorq_user.backends.profile_cache") as profile_cache:
+            user = MentorqUserBackend().authenticate(None, email="hacker@example.com", lcs_token="new")
+            profile_cache.invalidate.assert_called_once_with("hacker@example.com", "old")
+        self.assertEqual(user.lcs_token, "new")
+        self.assertEqual(MentorqUser.objects.get(email="hacker@example.com").lcs_token, "new")
+
+    def _fetched_at(self):
+        return self.profile_cache.cache.get(self.profile_cache.key("hacker@example.com", "token"))[1]
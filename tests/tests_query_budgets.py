@@ -0,0 +1,201 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from mentorq_api.models import Ticket, Feedback, TicketStats, MentorRating
+from mentorq_user.fake_lcs import FakeLCS
+from mentorq_user.models import MentorqUser
+from mentorq_user.serializers import MentorqTokenObtainPairSerializer
+
+'''
+The number of SQL queries of every API route for every role, on a small event and on one with many more tickets
+A route must make as many queries on both (no query per ticket, feedback or mentor) and no more than its budget
+LCS is answered by the in-process fake LCS
+'''
+
+HACKER = "hacker@example.com"
+MENTOR = "mentor@example.com"
+DIRECTOR = "director@example.com"
+ROLES = {HACKER: "hacker-token", MENTOR: "mentor-token", DIRECTOR: "director-token"}
+
+# tickets of every kind added for the small event, and added again for the large one
+SMALL = 2
+GROWTH = 25
+
+# the most queries a route may make, by (route, method)
+# (authenticating a request costs a query, for the user the token was issued for, and a change to a ticket or feedback
+# also records the change, bumps the ticket's version and updates the rollups in the same transaction)
+BUDGETS = {
+    ("api-root", "GET"): 1,
+    ("ticket-list", "GET"): 2,
+    ("ticket-list", "POST"): 11,
+    ("ticket-detail", "GET"): 2,
+    ("ticket-detail", "PATCH"): 12,
+    ("ticket-changes", "GET"): 5,
+    ("ticket-stats", "GET"): 2,
+    ("ticket-claim", "POST"): 12,
+    ("ticket-release", "POST"): 13,
+    ("ticket-close", "POST"): 10,
+    ("ticket-cancel", "POST"): 10,
+    ("ticket-slack-dm", "GET"): 2,
+    ("ticket-bulk", "POST"): 15,
+    ("feedback-list", "GET"): 2,
+    ("feedback-list", "POST"): 15,
+    ("feedback-detail", "GET"): 2,
+    ("feedback-detail", "PATCH"): 14,
+    ("feedback-leaderboard", "GET"): 2,
+    ("mentorq_token_obtain_pair", "POST"): 4,
+    ("mentorq_token_refresh", "POST"): 0,
+}
+
+
+class QueryBudgetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lcs = FakeLCS().install()
+        self.addCleanup(self.lcs.uninstall)
+        self.users = {email: MentorqUser.objects.create(email=email, lcs_token=token)
+                      for email, token in ROLES.items()}
+        self.clients = {}
+        for email, user in self.users.items():
+            client = APIClient()
+            # (the profile is read from LCS and cached here, the routes are measured with the cached profile)
+            client.credentials(HTTP_AUTHORIZATION="Bearer " + str(
+                MentorqTokenObtainPairSerializer.get_token(user).access_token))
+            self.clients[email] = client
+
+    # adds count tickets of every kind, for the hacker and for other users
+    def populate(self, count):
+        for i in range(count):
+            for owner in (HACKER, "other{}@example.com".format(i)):
+                Ticket.objects.create(owner_email=owner, title="open", location="table")
+                Ticket.objects.create(owner_email=owner, title="claimed", location="table",
+                                      status=Ticket.StatusType.CLAIMED, mentor="Mentor", mentor_email=MENTOR)
+                Ticket.objects.create(owner_email=owner, title="cancelled", location="table",
+                                      status=Ticket.StatusType.CANCELLED)
+                closed = Ticket.objects.create(owner_email=owner, title="closed", location="table",
+                                               status=Ticket.StatusType.CLOSED, mentor="Mentor",
+                                               mentor_email="mentor{}@example.com".format(i))
+                Feedback.objects.create(ticket=closed, rating=4, comments="thanks")
+
+    def ticket(self, status=Ticket.StatusType.OPEN, owner=HACKER, mentor_email=""):
+        return Ticket.objects.create(owner_email=owner, title="measured", location="table", status=status,
+                                     mentor="Mentor" if mentor_email else "", mentor_email=mentor_email)
+
+    # the requests a user with the given email makes, as (route, method, path, data), with new objects to act on
+    def requests(self, email):
+        claimed = self.ticket(Ticket.StatusType.CLAIMED, mentor_email=MENTOR)
+        closed = self.ticket(Ticket.StatusType.CLOSED, mentor_email=MENTOR)
+        rated = self.ticket(Ticket.StatusType.CLOSED, mentor_email=MENTOR)
+        Feedback.objects.create(ticket=rated, rating=3, comments="ok")
+        requests = [
+            ("api-root", "GET", "/api/", None),
+            ("ticket-list", "GET", "/api/tickets/", None),
+            ("ticket-list", "GET", "/api/tickets/?page_size=10", None),
+            ("ticket-list", "POST", "/api/tickets/", {"owner_email": email, "title": "new", "location": "table"}),
+            ("ticket-detail", "GET", "/api/tickets/{}/".format(claimed.pk), None),
+            ("ticket-changes", "GET", "/api/tickets/changes/?since=0", None),
+            ("ticket-stats", "GET", "/api/tickets/stats/", None),
+            ("ticket-close", "POST", "/api/tickets/{}/close/".format(
+                self.ticket(Ticket.StatusType.CLAIMED, mentor_email=MENTOR).pk), None),
+            ("ticket-slack-dm", "GET", "/api/tickets/{}/slack-dm/".format(claimed.pk), None),
+            ("feedback-list", "GET", "/api/feedback/", None),
+            ("feedback-leaderboard", "GET", "/api/feedback/leaderboard/", None),
+        ]
+        if email in (MENTOR, DIRECTOR):
+            requests += [
+                ("ticket-detail", "PATCH", "/api/tickets/{}/".format(self.ticket().pk),
+                 {"status": "CLAIMED", "mentor": "Mentor", "mentor_email": MENTOR}),
+                ("ticket-claim", "POST", "/api/tickets/{}/claim/".format(self.ticket().pk), None),
+                ("ticket-release", "POST", "/api/tickets/{}/release/".format(
+                    self.ticket(Ticket.StatusType.CLAIMED, mentor_email=MENTOR).pk), None),
+            ]
+        if email in (HACKER, DIRECTOR):
+            requests += [
+                ("ticket-cancel", "POST", "/api/tickets/{}/cancel/".format(self.ticket().pk), None),
+                ("feedback-detail", "GET", "/api/feedback/{}/".format(rated.pk), None),
+                ("feedback-detail", "PATCH", "/api/feedback/{}/".format(rated.pk), {"rating": 5}),
+            ]
+        if email == DIRECTOR:
+            requests += [
+                ("ticket-bulk", "POST", "/api/tickets/bulk/",
+                 {"ids": [self.ticket().pk, self.ticket(Ticket.StatusType.CLAIMED, mentor_email=MENTOR).pk],
+                  "status": "CLOSED"}),
+                # (every open ticket of the hacker, more of them on the larger event)
+                ("ticket-bulk", "POST", "/api/tickets/bulk/",
+                 {"filter": {"owner_email": HACKER, "status": ["OPEN"]}, "status": "CANCELLED", "active": False}),
+            ]
+        if email == HACKER:
+            requests.append(("feedback-list", "POST", "/api/feedback/",
+                             {"ticket": closed.pk, "rating": 5, "comments": "great"}))
+        return requests
+
+    # the number of queries of every request, checking that each of them succeeded
+    def measure(self, email):
+        counts = []
+        for route, method, path, data in self.requests(email):
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(self.clients[email], method.lower())(path, data, format="json")
+            self.assertLess(response.status_code, 300, (route, method, path, response.content))
+            counts.append(((route, method, path), len(queries)))
+        # the rollups are kept right as the requests go, in the same transactions
+        self.assertEqual(TicketStats.verify(), [])
+        self.assertEqual(MentorRating.verify(), [])
+        return counts
+
+    def check(self, email):
+        self.populate(SMALL)
+        # the first requests of a user also add them to the participants of the rollup, which later ones don't
+        self.measure(email)
+        small = self.measure(email)
+        self.populate(GROWTH)
+        large = self.measure(email)
+        for (request, small_count), (_, large_count) in zip(small, large):
+            with self.subTest(request=request):
+                self.assertEqual(large_count, small_count, "{} makes more queries on a larger event".format(request))
+                self.assertLessEqual(large_count, BUDGETS[request[:2]], "{} is over its budget".format(request))
+
+    '''
+     Tests the query counts of the routes a hacker uses
+    '''
+
+    def test_hacker(self):
+        self.check(HACKER)
+
+    '''
+     Tests the query counts of the routes a mentor uses
+    '''
+
+    def test_mentor(self):
+        self.check(MENTOR)
+
+    '''
+     Tests the query counts of the routes a director uses
+    '''
+
+    def test_director(self):
+        self.check(DIRECTOR)
+
+    '''
+     Tests the query counts of obtaining and refreshing tokens
+    '''
+
+    def test_auth(self):
+        counts = []
+        for count in (SMALL, GROWTH):
+            self.populate(count)
+            client = APIClient()
+            with CaptureQueriesContext(connection) as obtain:
+                response = client.post("/api/auth/token/", {"email": HACKER, "lcs_token": "hacker-token"})
+            self.assertEqual(response.status_code, 200)
+            with CaptureQueriesContext(connection) as refresh:
+                response = client.post("/api/auth/refresh/",
+                                       {"refresh": str(RefreshToken.for_user(self.users[HACKER]))})
+            self.assertEqual(response.status_code, 200)
+            counts.append((len(obtain), len(refresh)))
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1][0], BUDGETS[("mentorq_token_obtain_pair", "POST")])
+        self.assertLessEqual(counts[1][1], BUDGETS[("mentorq_token_refresh", "POST")])
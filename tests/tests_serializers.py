@@ -0,0 +1,60 @@
+from django.test import TestCase
+from rest_framework.reverse import reverse
+
+from mentorq_api.models import Ticket, Feedback
+from tests.utils import client_for
+
+
+class TicketListQueriesTestCase(TestCase):
+    def setUp(self):
+        self.director = client_for("director@example.com", director=True)
+        self.hacker = client_for("hacker@example.com")
+
+    def create_tickets(self, count):
+        for i in range(count):
+            ticket = Ticket.objects.create(owner_email="hacker@example.com", title="ticket {}".format(i),
+                                           location="table", status=Ticket.StatusType.CLOSED,
+                                           mentor_email="mentor@example.com")
+            if i % 2:
+                Feedback.objects.create(ticket=ticket, rating=4, comments="")
+
+    '''
+     Tests that listing tickets takes the same number of queries no matter how many tickets there are
+    '''
+
+    def test_list_queries_constant(self):
+        for client in (self.director, self.hacker):
+            self.create_tickets(2)
+            with self.assertNumQueries(1):
+                self.assertEqual(len(client.get("/api/tickets/").json()), 2)
+            self.create_tickets(20)
+            with self.assertNumQueries(1):
+                self.assertEqual(len(client.get("/api/tickets/").json()), 22)
+            Feedback.objects.all().delete()
+            Ticket.objects.all().delete()
+
+    '''
+     Tests that listing feedback takes a single query
+    '''
+
+    def test_feedback_list_queries(self):
+        self.create_tickets(20)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.director.get("/api/feedback/").json()), 10)
+
+    '''
+     Tests that the templated links are the same as the ones reverse() gives
+    '''
+
+    def test_links(self):
+        self.create_tickets(4)
+        for ticket in self.director.get("/api/tickets/").json():
+            self.assertEqual(ticket["url"], "http://testserver" + reverse("ticket-detail", args=[ticket["id"]]))
+            if ticket["feedback"]:
+                self.assertEqual(ticket["feedback"],
+                                 "http://testserver" + reverse("feedback-detail", args=[ticket["id"]]))
+        for feedback in self.director.get("/api/feedback/").json():
+            self.assertEqual(feedback["ticket_url"],
+                             "http://testserver" + reverse("ticket-detail", args=[feedback["ticket"]]))
+        ticket = self.hacker.get("/api/tickets/{}/".format(Ticket.objects.first().pk)).json()
+        self.assertEqual(ticket["url"], "http://testserver" + reverse("ticket-detail", args=[ticket["id"]]))
@@ -0,0 +1,85 @@
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from mentorq_api.models import Ticket
+from mentorq_main.timing import RequestTimings
+from mentorq_user.fake_lcs import FakeLCS
+from mentorq_user.models import MentorqUser
+from tests.utils import access_token
+
+
+class ServerTimingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.lcs = FakeLCS().install()
+        self.addCleanup(self.lcs.uninstall)
+        user = MentorqUser.objects.create(email="mentor@example.com", lcs_token="mentor-token")
+        Ticket.objects.create(owner_email="hacker@example.com", owner="Hacker", title="Help", location="Table 1")
+        self.token = str(access_token("mentor@example.com", mentor=True, user_id=user.pk))
+
+    # a new client, so that the middleware is loaded with the current settings
+    def get(self, path):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer " + self.token)
+        return client.get(path)
+
+    @staticmethod
+    def metrics(response):
+        return {metric.split(";")[0].strip(): metric for metric in response["Server-Timing"].split(",")}
+
+    '''
+     Tests that the time spent in the database, LCS and serialization is sent back and logged
+    '''
+
+    @override_settings(MENTORQ_SERVER_TIMING=True)
+    def test_server_timing(self):
+        with self.assertLogs("mentorq.timing", "INFO") as logs:
+            response = self.get("/api/tickets/")
+        self.assertEqual(response.status_code, 200)
+        metrics = self.metrics(response)
+        self.assertEqual(set(metrics), {"total", "db", "lcs", "serialize"})
+        # the profile is read from LCS on the first request
+        self.assertIn('desc="2 calls"', metrics["lcs"])
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line["path"], line["status"], line["lcs_calls"]), ("/api/tickets/", 200, 2))
+        self.assertGreater(line["db_queries"], 0)
+        self.assertNotIn("queries", line)
+
+        with self.assertLogs("mentorq.timing", "INFO"):
+            self.assertIn('desc="0 calls"', self.metrics(self.get("/api/tickets/"))["lcs"])
+
+    '''
+     Tests that rendering the response counts as serialization along with building its data
+    '''
+
+    @override_settings(MENTORQ_SERVER_TIMING=True)
+    def test_render(self):
+        with mock.patch.object(RequestTimings, "add", autospec=True, side_effect=RequestTimings.add) as add, \
+                self.assertLogs("mentorq.timing", "INFO"):
+            self.assertEqual(self.get("/api/tickets/").status_code, 200)
+        self.assertEqual([call[0][1] for call in add.call_args_list].count("serialize"), 2)
+
+    '''
+     Tests that slow requests are logged with the queries they made
+    '''
+
+    @override_settings(MENTORQ_SERVER_TIMING=True, MENTORQ_SLOW_REQUEST_MS=0)
+    def test_slow_request(self):
+        with self.assertLogs("mentorq.timing", "WARNING") as logs:
+            self.get("/api/tickets/")
+        line = json.loads(logs.records[0].getMessage())
+        self.assertTrue(line["slow"])
+        self.assertEqual(len(line["queries"]), line["db_queries"])
+        self.assertTrue(any("mentorq_api_ticket" in query["sql"] for query in line["queries"]))
+
+    '''
+     Tests that nothing is added when the middleware is disabled
+    '''
+
+    @override_settings(MENTORQ_SERVER_TIMING=False)
+    def test_disabled(self):
+        self.assertNotIn("Server-Timing", self.get("/api/tickets/"))
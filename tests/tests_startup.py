@@ -0,0 +1,23 @@
+import lcs_client
+from django.test import TestCase
+from django.urls import resolve
+
+from mentorq_main.warmup import warm_up
+
+
+class StartupTestCase(TestCase):
+    '''
+     Tests that the warmup (which runs before gunicorn forks) doesn't touch the database
+    '''
+
+    def test_warm_up(self):
+        with self.assertNumQueries(0):
+            warm_up()
+        self.assertEqual(resolve("/api/tickets/1/").url_name, "ticket-detail")
+
+    '''
+     Tests that the dev LCS endpoint is selected when the app starts, not when the URLconf is first loaded
+    '''
+
+    def test_lcs_dev(self):
+        self.assertTrue(lcs_client.get_base_url().endswith("/dev"))
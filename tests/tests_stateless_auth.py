@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from mentorq_api.models import Ticket
+from mentorq_api.views import TicketViewSet
+from mentorq_user.authentication import MentorqStatelessJWTAuthentication
+from mentorq_user.lcs import profile_cache
+from mentorq_user.models import MentorqUser
+from mentorq_user.serializers import MentorqTokenObtainPairSerializer
+
+
+class StatelessAuthTestCase(TestCase):
+    def setUp(self):
+        # view classes read DEFAULT_AUTHENTICATION_CLASSES at import time, so the stateless mode is patched in
+        patcher = mock.patch.object(TicketViewSet, "authentication_classes", [MentorqStatelessJWTAuthentication])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = MentorqUser.objects.create_user(email="mentor@example.com", lcs_token="token")
+        profile_cache.set(self.user.email, self.user.lcs_token, {
+            "email": "mentor@example.com", "first_name": "Men", "last_name": "Tor",
+            "role": {"director": False, "mentor": True, "organizer": False}
+        })
+        access_token = MentorqTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(access_token))
+        Ticket.objects.create(owner_email="hacker@example.com", title="help", location="table 1")
+        Ticket.objects.create(owner_email="hacker@example.com", title="done", location="table 2",
+                              status=Ticket.StatusType.CLOSED)
+
+    '''
+     Tests that the ticket list is authorized from the token claims without a user lookup or an LCS call
+    '''
+
+    def test_list_without_user_lookup(self):
+        with mock.patch("mentorq_user.models.profile_cache") as cache, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/tickets/")
+        cache.get.assert_not_called()
+        self.assertFalse([query for query in queries if "mentorq_user_mentorquser" in query["sql"]])
+        self.assertEqual(response.status_code, 200)
+        # mentors don't see closed tickets
+        self.assertEqual([ticket["title"] for ticket in response.json()], ["help"])
+
+    '''
+     Tests that tokens without the role claims fall back to the database user
+    '''
+
+    def test_legacy_token_falls_back(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer {}".format(RefreshToken.for_user(self.user).access_token))
+        response = self.client.get("/api/tickets/")
+        self.assertEqual(response.status_code, 200)
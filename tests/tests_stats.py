@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from django.db.models import Avg, Q
+from django.test import TestCase
+from django.utils import timezone
+
+from mentorq_api.models import Ticket, Feedback, TicketStats
+from tests.utils import client_for
+
+
+# the statistics as they were computed in Python before the aggregate query
+def python_stats():
+    def average(deltas):
+        return sum(deltas, timedelta(0)) / len(deltas) if deltas else None
+
+    claimed = [ticket.claimed_datetime - ticket.created_datetime
+               for ticket in Ticket.objects.exclude(claimed_datetime__isnull=True)]
+    closed = [ticket.closed_datetime - ticket.created_datetime
+              for ticket in Ticket.objects.exclude(Q(closed_datetime__isnull=True) | Q(active=False))]
+    return {
+        "average_claimed_datetime_seconds": str(average(claimed).total_seconds()),
+        "average_closed_datetime_seconds": str(average(closed).total_seconds()),
+        "Total tickets": Ticket.objects.count(),
+        "Open tickets": Ticket.objects.filter(status="OPEN").count(),
+        "Claimed tickets": Ticket.objects.filter(status="CLAIMED").count(),
+        "Closed Tickets": Ticket.objects.filter(status="CLOSED").count(),
+        "Cancelled Tickets": Ticket.objects.filter(status="CANCELLED").count(),
+        "Number of mentors": Ticket.objects.values("mentor_email").exclude(mentor_email="").distinct().count(),
+        "Number of users": Ticket.objects.values("owner_email").exclude(owner_email="").distinct().count(),
+        "Average Rating": Feedback.objects.all().aggregate(Avg("rating")),
+    }
+
+
+class StatsTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        statuses = ["OPEN", "CLAIMED", "CLOSED", "CLOSED", "CANCELLED", "CLOSED", "CLAIMED"]
+        for i, status in enumerate(statuses):
+            ticket = Ticket.objects.create(owner_email="hacker{}@example.com".format(i % 3), title="ticket",
+                                           location="table", status=status, active=i != 5,
+                                           mentor_email="mentor{}@example.com".format(i % 2) if i % 4 else "")
+            claimed = now + timedelta(seconds=37 * i, microseconds=333 * i) if status in ("CLAIMED", "CLOSED") \
+                else None
+            closed = now + timedelta(minutes=i, microseconds=7) if status == "CLOSED" else None
+            Ticket.objects.filter(pk=ticket.pk).update(created_datetime=now, claimed_datetime=claimed,
+                                                       closed_datetime=closed)
+            if status == "CLOSED":
+                Feedback.objects.create(ticket=ticket, rating=i % 5 + 1, comments="")
+        # the timestamps were forced with update(), which the rollup doesn't see
+        TicketStats.rebuild()
+
+    '''
+     Tests that the director stats match the Python computation and are a single read of the rollup
+    '''
+
+    def test_director_stats(self):
+        client = client_for("director@example.com", director=True, organizer=True)
+        with self.assertNumQueries(1):
+            response = client.get("/api/tickets/stats/")
+        self.assertEqual(response.json(), python_stats())
+
+    '''
+     Tests that everyone else gets the averages and the total
+    '''
+
+    def test_hacker_stats(self):
+        client = client_for("hacker0@example.com")
+        with self.assertNumQueries(1):
+            response = client.get("/api/tickets/stats/")
+        expected = python_stats()
+        self.assertEqual(response.json(), {key: expected[key] for key in (
+            "average_claimed_datetime_seconds", "average_closed_datetime_seconds", "Total tickets")})
+
+    '''
+     Tests that the rollup follows status transitions, edits, feedback and deletes
+    '''
+
+    def test_incremental_updates(self):
+        ticket = Ticket.objects.create(owner_email="new@example.com", title="ticket", location="table")
+        ticket.status = Ticket.StatusType.CLAIMED
+        ticket.mentor_email = "mentor9@example.com"
+        ticket.save()
+        ticket.status = Ticket.StatusType.CLOSED
+        ticket.save()
+        feedback = Feedback.objects.create(ticket=ticket, rating=2, comments="")
+        feedback = Feedback.objects.get(pk=feedback.pk)
+        feedback.rating = 4
+        feedback.save()
+        ticket.active = False
+        ticket.mentor_email = "mentor0@example.com"
+        ticket.save()
+        self.assertEqual(TicketStats.verify(), [])
+        Ticket.objects.filter(owner_email="hacker1@example.com").delete()
+        self.assertEqual(TicketStats.verify(), [])
+        self.assertEqual(TicketStats.objects.get().users, 3)
@@ -0,0 +1,288 @@
+import threading
+from unittest import mock
+
+from django.db import connection, OperationalError
+from django.db.models.signals import post_save, pre_save
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from mentorq_api.models import Ticket, TicketStats, TicketConflict, InvalidTransition
+from mentorq_api.views import TicketViewSet
+from mentorq_user.models import MentorqUser
+from tests.utils import client_for
+
+
+class TransitionTestCase(TestCase):
+    def setUp(self):
+        self.ticket = Ticket.objects.create(owner_email="hacker@example.com", title="ticket", location="table")
+
+    '''
+     Tests that a transition sets the status and its datetime and that a stale ticket loses
+    '''
+
+    def test_transition(self):
+        stale = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertTrue(self.ticket.transition(Ticket.StatusType.CLAIMED, mentor_email="mentor@example.com"))
+        self.assertFalse(stale.transition(Ticket.StatusType.CLAIMED, mentor_email="other@example.com"))
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertEqual(ticket.mentor_email, "mentor@example.com")
+        self.assertIsNotNone(ticket.claimed_datetime)
+        self.assertIsNone(ticket.closed_datetime)
+        self.assertTrue(ticket.transition(Ticket.StatusType.CLOSED))
+        self.assertIsNotNone(Ticket.objects.get(pk=self.ticket.pk).closed_datetime)
+        self.assertEqual(TicketStats.verify(), [])
+
+    '''
+     Tests that transitions the status can't make are refused
+    '''
+
+    def test_invalid_transition(self):
+        self.assertFalse(self.ticket.transition(Ticket.StatusType.OPEN))
+        self.ticket.transition(Ticket.StatusType.CANCELLED)
+        self.assertFalse(self.ticket.transition(Ticket.StatusType.CLAIMED))
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).status, Ticket.StatusType.CANCELLED)
+
+    '''
+     Tests that saving a loaded ticket doesn't read it again
+    '''
+
+    def test_save_without_read(self):
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        ticket.status = Ticket.StatusType.CLAIMED
+        with CaptureQueriesContext(connection) as queries:
+            ticket.save()
+        self.assertFalse([query for query in queries
+                          if query["sql"].startswith("SELECT") and '"mentorq_api_ticket"' in query["sql"]])
+        self.assertIsNotNone(Ticket.objects.get(pk=self.ticket.pk).claimed_datetime)
+
+    '''
+     Tests that saving a ticket somebody else changed raises a conflict, which the API returns as a 409
+    '''
+
+    def test_save_conflict(self):
+        stale = Ticket.objects.get(pk=self.ticket.pk)
+        self.ticket.status = Ticket.StatusType.CLAIMED
+        self.ticket.save()
+        stale.status = Ticket.StatusType.CANCELLED
+        with self.assertRaises(TicketConflict):
+            stale.save()
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).status, Ticket.StatusType.CLAIMED)
+        self.assertEqual(TicketStats.verify(), [])
+
+        mentor = client_for("mentor@example.com", mentor=True)
+        response = mentor.patch("/api/tickets/{}/".format(self.ticket.pk), {"status": "CLOSED"})
+        self.assertEqual(response.status_code, 200)
+
+    '''
+     Tests that a ticket refreshed after somebody else changed it saves without a conflict
+    '''
+
+    def test_save_after_refresh(self):
+        stale = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertTrue(self.ticket.transition(Ticket.StatusType.CLAIMED, mentor_email="mentor@example.com"))
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, Ticket.StatusType.CLAIMED)
+        stale.comment = "new"
+        stale.save()
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).comment, "new")
+
+        # refreshing some fields only counts those as loaded
+        stale = Ticket.objects.get(pk=self.ticket.pk)
+        self.assertTrue(self.ticket.transition(Ticket.StatusType.CLOSED))
+        stale.refresh_from_db(fields=["comment"])
+        with self.assertRaises(TicketConflict):
+            stale.save()
+        stale.refresh_from_db(fields=["status", "closed_datetime"])
+        stale.save()
+        self.assertEqual(TicketStats.verify(), [])
+
+    '''
+     Tests that saves refuse status changes the transitions don't allow
+    '''
+
+    def test_save_invalid_status(self):
+        self.assertTrue(self.ticket.transition(Ticket.StatusType.CLOSED))
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        ticket.status = Ticket.StatusType.OPEN
+        with self.assertRaises(InvalidTransition):
+            ticket.save()
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).status, Ticket.StatusType.CLOSED)
+        director = client_for("director@example.com", director=True)
+        response = director.patch("/api/tickets/{}/".format(self.ticket.pk), {"status": "CLAIMED"})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["detail"], "The ticket is CLOSED and can't be moved to CLAIMED.")
+
+    '''
+     Tests that updates and transitions send the save signals, with the fields they write
+    '''
+
+    def test_save_signals(self):
+        received = []
+
+        def receiver(signal, instance, update_fields, **kwargs):
+            received.append((signal, instance.status, kwargs.get("created"), update_fields))
+
+        for signal in (pre_save, post_save):
+            signal.connect(receiver, sender=Ticket)
+            self.addCleanup(signal.disconnect, receiver, sender=Ticket)
+        ticket = Ticket.objects.get(pk=self.ticket.pk)
+        ticket.comment = "new"
+        ticket.save(update_fields=["comment"])
+        self.assertEqual(received, [(pre_save, "OPEN", None, {"comment", "version"}),
+                                    (post_save, "OPEN", False, {"comment", "version"})])
+        received.clear()
+        ticket.transition(Ticket.StatusType.CLAIMED, mentor_email="mentor@example.com")
+        fields = {"status", "mentor_email", "claimed_datetime", "version"}
+        self.assertEqual(received, [(pre_save, "CLAIMED", None, fields), (post_save, "CLAIMED", False, fields)])
+        # a transition that loses sends no post_save and leaves the ticket as it was
+        received.clear()
+        stale = Ticket.objects.get(pk=self.ticket.pk)
+        ticket.transition(Ticket.StatusType.OPEN)
+        self.assertFalse(stale.transition(Ticket.StatusType.CLOSED))
+        self.assertEqual(stale.status, Ticket.StatusType.CLAIMED)
+        self.assertEqual([signal for signal, *_ in received], [pre_save, post_save, pre_save])
+
+
+class TicketAdminTestCase(TestCase):
+    def setUp(self):
+        self.ticket = Ticket.objects.create(owner_email="hacker@example.com", title="ticket", location="table")
+        self.client.force_login(MentorqUser.objects.create_superuser("admin@example.com", "token", "password"))
+        self.url = "/admin/mentorq_api/ticket/{}/change/".format(self.ticket.pk)
+
+    def change(self, **changes):
+        data = {"owner_email": "hacker@example.com", "mentor": "", "mentor_email": "", "status": "OPEN",
+                "title": "ticket", "comment": "", "contact": "", "location": "table", "owner": "", "active": "on"}
+        data.update(changes)
+        return self.client.post(self.url, data, follow=True)
+
+    '''
+     Tests that the admin saves tickets, and shows conflicts and invalid status changes instead of failing
+    '''
+
+    def test_change(self):
+        response = self.change(status="CLOSED")
+        self.assertEqual(response.redirect_chain[-1][0], "/admin/mentorq_api/ticket/")
+        self.assertIsNotNone(Ticket.objects.get(pk=self.ticket.pk).closed_datetime)
+
+        response = self.change(status="OPEN", title="reopened")
+        self.assertEqual(response.redirect_chain[-1][0], self.url)
+        self.assertContains(response, "The ticket is CLOSED and can&#x27;t be moved to OPEN.")
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).title, "ticket")
+
+        with mock.patch.object(Ticket, "conditional_update", return_value=False):
+            response = self.change(status="CLOSED", title="renamed")
+        self.assertEqual(response.redirect_chain[-1][0], self.url)
+        self.assertContains(response, "The ticket was changed by somebody else.")
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).title, "ticket")
+        self.assertEqual(TicketStats.verify(), [])
+
+
+# uses TransactionTestCase since every thread has its own database connection
+class ConcurrentClaimTestCase(TransactionTestCase):
+    THREADS = 16
+
+    def setUp(self):
+        # the rollup row is flushed along with the other tables after each TransactionTestCase
+        TicketStats.rebuild()
+
+    def claim(self, pk, n, results, barrier):
+        ticket = Ticket.objects.get(pk=pk)
+        barrier.wait()
+        try:
+            while True:
+                try:
+                    results[n] = ticket.transition(Ticket.StatusType.CLAIMED,
+                                                   mentor_email="mentor{}@example.com".format(n))
+                    break
+                except OperationalError:
+                    # SQLite reports a locked database instead of waiting for the other writer
+                    continue
+        finally:
+            connection.close()
+
+    '''
+     Tests that exactly one of many mentors claiming the same tickets at once wins each of them
+    '''
+
+    def test_concurrent_claims(self):
+        for _ in range(5):
+            pk = Ticket.objects.create(owner_email="hacker@example.com", title="ticket", location="table").pk
+            results = [None] * self.THREADS
+            barrier = threading.Barrier(self.THREADS)
+            threads = [threading.Thread(target=self.claim, args=(pk, n, results, barrier))
+                       for n in range(self.THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(results.count(True), 1)
+            self.assertEqual(results.count(False), self.THREADS - 1)
+            ticket = Ticket.objects.get(pk=pk)
+            self.assertEqual(ticket.mentor_email, "mentor{}@example.com".format(results.index(True)))
+        stats = TicketStats.objects.get()
+        self.assertEqual((stats.claimed_tickets, stats.claimed_count), (5, 5))
+        self.assertEqual(TicketStats.verify(), [])
+
+
+class TicketActionTestCase(TestCase):
+    def setUp(self):
+        self.ticket = Ticket.objects.create(owner_email="hacker@example.com", title="ticket", location="table")
+        self.url = "/api/tickets/{}/{{}}/".format(self.ticket.pk)
+        self.hacker = client_for("hacker@example.com")
+        self.mentor = client_for("mentor@example.com", mentor=True)
+        self.other_mentor = client_for("other@example.com", mentor=True)
+
+    '''
+     Tests a ticket going through claim, release, claim and close with the minimal responses
+    '''
+
+    def test_lifecycle(self):
+        response = self.mentor.post(self.url.format("claim"), {"mentor": "Mentor Person"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), set(TicketViewSet.TRANSITION_FIELDS))
+        self.assertEqual(response.json()["status"], "CLAIMED")
+        self.assertEqual(response.json()["mentor"], "Mentor Person")
+        self.assertEqual(response.json()["mentor_email"], "mentor@example.com")
+
+        self.assertEqual(self.other_mentor.post(self.url.format("release")).status_code, 403)
+        response = self.mentor.post(self.url.format("release"))
+        self.assertEqual((response.json()["status"], response.json()["mentor_email"]), ("OPEN", ""))
+
+        self.other_mentor.post(self.url.format("claim"))
+        response = self.hacker.post(self.url.format("close"))
+        self.assertEqual(response.json()["status"], "CLOSED")
+        self.assertIsNotNone(response.json()["closed_datetime"])
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).mentor_email, "other@example.com")
+        self.assertEqual(TicketStats.verify(), [])
+
+    '''
+     Tests that claiming a claimed ticket is a conflict and that hackers can't claim
+    '''
+
+    def test_claim_conflict(self):
+        self.assertEqual(self.hacker.post(self.url.format("claim")).status_code, 403)
+        self.assertEqual(self.mentor.post(self.url.format("claim")).status_code, 200)
+        response = self.other_mentor.post(self.url.format("claim"))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Ticket.objects.get(pk=self.ticket.pk).mentor_email, "mentor@example.com")
+
+    '''
+     Tests that only the owner cancels and that cancelled tickets can't be claimed
+    '''
+
+    def test_cancel(self):
+        self.assertEqual(self.mentor.post(self.url.format("cancel")).status_code, 403)
+        self.assertEqual(client_for("else@example.com").post(self.url.format("cancel")).status_code, 404)
+        self.assertEqual(self.hacker.post(self.url.format("cancel")).json()["status"], "CANCELLED")
+        self.assertEqual(self.mentor.post(self.url.format("claim")).status_code, 409)
+
+    '''
+     Tests that a claim reads and writes the ticket with one statement each
+    '''
+
+    def test_claim_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.mentor.post(self.url.format("claim"))
+        ticket_queries = [query["sql"] for query in queries if '"mentorq_api_ticket"' in query["sql"]]
+        self.assertEqual(len(ticket_queries), 2)
+        self.assertTrue(ticket_queries[1].startswith("UPDATE"))
@@ -0,0 +1,27 @@
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from mentorq_user.authentication import MentorqTokenUser
+
+
+# an access token with the claims Mentorq issues
+def access_token(email, director=False, mentor=False, organizer=False, user_id=1):
+    token = AccessToken()
+    token["user_id"] = user_id
+    token["email"] = email
+    token["director"] = director
+    token["mentor"] = mentor
+    token["organizer"] = organizer
+    return token
+
+
+# builds a user with the given roles from token claims, so no LCS or user lookup is involved
+def token_user(email, **kwargs):
+    return MentorqTokenUser(access_token(email, **kwargs))
+
+
+# returns an API client that is authenticated as a user with the given roles
+def client_for(email, **roles):
+    client = APIClient()
+    client.force_authenticate(user=token_user(email, **roles))
+    return client